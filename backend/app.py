@@ -1,27 +1,107 @@
 import os
 import io
+import hmac
+import json
 import zipfile
 import base64
+import math
+import logging
+import mimetypes
 from pathlib import Path
 from urllib.parse import urlparse, parse_qs
-import requests
-from flask import Flask, render_template, request, redirect, url_for, send_file, jsonify, flash, send_from_directory, abort
+from flask import Flask, render_template, request, redirect, url_for, send_file, jsonify, flash, send_from_directory, abort, g
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 
-from backend import create_and_deploy_project
+from logConfig import configure_logging, set_request_id, request_id_var
+from tracing import start_trace, end_trace, current_trace_id, traced_session
+from profiler import request_profiler, PROFILE_ADMIN_TOKEN
+from backend import create_and_deploy_project, edit_project, find_project
+from batchRunner import batch_manager, load_items, load_checkpoint, BatchLimitError
+from pagesWatcher import pages_watcher
+from siteBuilder import is_precompressed_variant, PRECOMPRESSED
+from rateLimiter import rate_limiter, tenant_from_request, RATE_LIMIT_ENABLED
+from modelRouter import model_router
+from contextCache import instruction_cache
+from blobStore import blob_store
+
+FIGMA_API_URL = os.getenv("FIGMA_API_URL", "https://api.figma.com")
+# Reverse proxies in front of the app (1 on Render); their X-Forwarded-For entries are trusted for the client IP
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+logger = logging.getLogger(__name__)
 
 def create_app():
+    configure_logging()
     app = Flask(__name__)
+    if TRUSTED_PROXY_HOPS:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
     
     # Configure CORS to allow all origins
     CORS(app, resources={r"/api/*": {"origins": "*"}})
     
     app.secret_key = os.getenv("FLASK_SECRET_KEY", "dev-secret-key")
 
+    @app.before_request
+    def _start_request():
+        # Honour an upstream id (e.g. from a proxy) so logs line up across services
+        g.request_id_token = set_request_id(request.headers.get("X-Request-ID"))
+        route = f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+        if request.path.startswith("/api/") or request.method == "POST":
+            g.trace = start_trace(route, traceparent=request.headers.get("traceparent"),
+                                  request_id=request_id_var.get())
+        if request_profiler.sample_rate > 0:
+            g.profile = request_profiler.start(route)
+
+    @app.after_request
+    def _tag_response(response):
+        response.headers["X-Request-ID"] = request_id_var.get()
+        trace = g.get("trace")
+        if trace is not None:
+            root = trace[0]
+            root.set("status_code", response.status_code)
+            if response.status_code >= 500:
+                root.fail(f"HTTP {response.status_code}")
+            response.headers["X-Trace-ID"] = root.trace.trace_id
+        return response
+
+    @app.teardown_request
+    def _end_request(exc):
+        request_profiler.stop(g.pop("profile", None))
+        end_trace(g.pop("trace", None), exc)
+        token = g.pop("request_id_token", None)
+        if token is not None:
+            request_id_var.reset(token)
+
+    def _with_trace_id(result: dict) -> dict:
+        """Add the request's trace id so a response can be matched to its exported trace"""
+        trace_id = current_trace_id()
+        return {**result, "trace_id": trace_id} if trace_id else result
+
     @app.route("/", methods=["GET"])
     def index():
         return render_template("index.html")
 
+    def _admit(tenant: str, auto_deploy: bool = False) -> float:
+        """
+        Admit a generation: hold a model slot for the request and, for a deploy,
+        charge the deploy budget up front; the deploy slot itself is only taken
+        around the deploy stage. Returns seconds to wait if the tenant is over a limit.
+        """
+        if not RATE_LIMIT_ENABLED:
+            return 0
+        wait = rate_limiter.admit(tenant, "model")
+        if wait or not auto_deploy:
+            return wait
+        wait = rate_limiter.take_token(tenant, "deploy")
+        if wait:
+            rate_limiter.release(tenant, "model")
+        return wait
+
+    def _release(tenant: str) -> None:
+        if RATE_LIMIT_ENABLED:
+            rate_limiter.release(tenant, "model")
+
     def _extract_figma_key_and_node(figma_url: str):
         try:
             u = urlparse(figma_url)
@@ -39,16 +119,17 @@ def create_app():
         key, node = _extract_figma_key_and_node(figma_url)
         if not key or not token:
             return None
+        session = traced_session()
         headers = {"X-FIGMA-TOKEN": token}
         if not node:
-            meta = requests.get(f"https://api.figma.com/v1/files/{key}", headers=headers, timeout=30)
+            meta = session.get(f"{FIGMA_API_URL}/v1/files/{key}", headers=headers, timeout=30)
             meta.raise_for_status()
             data = meta.json()
             node = data.get('document', {}).get('children', [{}])[0].get('id')
             if not node:
                 return None
-        imgs = requests.get(
-            f"https://api.figma.com/v1/images/{key}",
+        imgs = session.get(
+            f"{FIGMA_API_URL}/v1/images/{key}",
             headers=headers,
             params={"ids": node, "format": "png", "scale": 2},
             timeout=30,
@@ -57,7 +138,7 @@ def create_app():
         img_url = imgs.json().get('images', {}).get(node)
         if not img_url:
             return None
-        img_resp = requests.get(img_url, timeout=60)
+        img_resp = session.get(img_url, timeout=60)
         img_resp.raise_for_status()
         uploads_dir.mkdir(parents=True, exist_ok=True)
         out_path = uploads_dir / f"figma_{key}_{node.replace(':','-')}.png"
@@ -69,36 +150,6 @@ def create_app():
     def generate():
         prompt = request.form.get("prompt", "").strip()
         project_name = request.form.get("project_name", "").strip() or None
-        img_path = None
-        file = request.files.get("image")
-        if file and file.filename:
-            uploads_dir = Path("uploads")
-            uploads_dir.mkdir(parents=True, exist_ok=True)
-            img_path = str(uploads_dir / file.filename)
-            file.save(img_path)
-        canvas_data = request.form.get("canvas_data", "")
-        if canvas_data.startswith("data:image/"):
-            try:
-                header, b64 = canvas_data.split(",", 1)
-                raw = base64.b64decode(b64)
-                uploads_dir = Path("uploads")
-                uploads_dir.mkdir(parents=True, exist_ok=True)
-                img_path = str(uploads_dir / "canvas_wireframe.png")
-                with open(img_path, 'wb') as f:
-                    f.write(raw)
-            except Exception as e:
-                flash(f"Canvas image parse failed: {e}", "error")
-        figma_url = request.form.get("figma_url", "").strip()
-        figma_token = request.form.get("figma_token") or os.getenv("FIGMA_TOKEN")
-        if figma_url:
-            try:
-                img_from_figma = _download_figma_image(figma_url, figma_token, Path("uploads"))
-                if img_from_figma:
-                    img_path = img_from_figma
-                else:
-                    flash("Unable to render Figma file. Check URL and token.", "error")
-            except Exception as e:
-                flash(f"Figma fetch failed: {e}", "error")
         auto_deploy = request.form.get("auto_deploy") == "on"
         username = request.form.get("github_username") or None
         repo_name = request.form.get("repo_name") or None
@@ -106,15 +157,56 @@ def create_app():
         if not prompt:
             flash("Prompt is required", "error")
             return redirect(url_for("index"))
-        result = create_and_deploy_project(
-            prompt=prompt,
-            project_name=project_name,
-            github_token=token if auto_deploy else None,
-            username=username if auto_deploy else None,
-            repo_name=repo_name if auto_deploy else None,
-            auto_deploy=auto_deploy,
-            img=img_path,
-        )
+        # Admit before saving uploads or calling Figma so a throttled client costs nothing
+        tenant = tenant_from_request(request)
+        retry_after = _admit(tenant, auto_deploy)
+        if retry_after:
+            flash(f"Too many requests. Please retry in {math.ceil(retry_after)} seconds.", "error")
+            return render_template("index.html"), 429, {"Retry-After": str(math.ceil(retry_after))}
+        try:
+            img_path = None
+            file = request.files.get("image")
+            if file and file.filename:
+                uploads_dir = Path("uploads")
+                uploads_dir.mkdir(parents=True, exist_ok=True)
+                img_path = str(uploads_dir / file.filename)
+                file.save(img_path)
+            canvas_data = request.form.get("canvas_data", "")
+            if canvas_data.startswith("data:image/"):
+                try:
+                    header, b64 = canvas_data.split(",", 1)
+                    raw = base64.b64decode(b64)
+                    uploads_dir = Path("uploads")
+                    uploads_dir.mkdir(parents=True, exist_ok=True)
+                    img_path = str(uploads_dir / "canvas_wireframe.png")
+                    with open(img_path, 'wb') as f:
+                        f.write(raw)
+                except Exception as e:
+                    flash(f"Canvas image parse failed: {e}", "error")
+            figma_url = request.form.get("figma_url", "").strip()
+            figma_token = request.form.get("figma_token") or os.getenv("FIGMA_TOKEN")
+            if figma_url:
+                try:
+                    img_from_figma = _download_figma_image(figma_url, figma_token, Path("uploads"))
+                    if img_from_figma:
+                        img_path = img_from_figma
+                    else:
+                        flash("Unable to render Figma file. Check URL and token.", "error")
+                except Exception as e:
+                    flash(f"Figma fetch failed: {e}", "error")
+            result = create_and_deploy_project(
+                prompt=prompt,
+                project_name=project_name,
+                github_token=token if auto_deploy else None,
+                username=username if auto_deploy else None,
+                repo_name=repo_name if auto_deploy else None,
+                auto_deploy=auto_deploy,
+                img=img_path,
+                bypass_cache=request.form.get("no_cache") == "on",
+                tenant=tenant,
+            )
+        finally:
+            _release(tenant)
         if not result.get("success"):
             flash(result.get("error", "Generation failed"), "error")
             return redirect(url_for("index"))
@@ -124,36 +216,6 @@ def create_app():
     def generate_api():
         prompt = request.form.get("prompt", "").strip()
         project_name = request.form.get("project_name", "").strip() or None
-        img_path = None
-        file = request.files.get("image")
-        if file and file.filename:
-            uploads_dir = Path("uploads")
-            uploads_dir.mkdir(parents=True, exist_ok=True)
-            img_path = str(uploads_dir / file.filename)
-            file.save(img_path)
-        canvas_data = request.form.get("canvas_data", "")
-        if canvas_data.startswith("data:image/"):
-            try:
-                header, b64 = canvas_data.split(",", 1)
-                raw = base64.b64decode(b64)
-                uploads_dir = Path("uploads")
-                uploads_dir.mkdir(parents=True, exist_ok=True)
-                img_path = str(uploads_dir / "canvas_wireframe.png")
-                with open(img_path, 'wb') as f:
-                    f.write(raw)
-            except Exception as e:
-                return jsonify({"success": False, "error": f"Canvas image parse failed: {e}"}), 400
-        figma_url = request.form.get("figma_url", "").strip()
-        figma_token = request.form.get("figma_token") or os.getenv("FIGMA_TOKEN")
-        if figma_url:
-            try:
-                img_from_figma = _download_figma_image(figma_url, figma_token, Path("uploads"))
-                if img_from_figma:
-                    img_path = img_from_figma
-                else:
-                    return jsonify({"success": False, "error": "Unable to render Figma file. Check URL and token."}), 400
-            except Exception as e:
-                return jsonify({"success": False, "error": f"Figma fetch failed: {e}"}), 400
         auto_deploy = request.form.get("auto_deploy") == "on"
         username = request.form.get("github_username") or None
         repo_name = request.form.get("repo_name") or None
@@ -167,8 +229,49 @@ def create_app():
                 "success": False, 
                 "error": "AI service is not configured. Please contact the administrator."
             }), 503
+
+        # Admit before saving uploads or calling Figma so a throttled client costs nothing
+        tenant = tenant_from_request(request)
+        retry_after = _admit(tenant, auto_deploy)
+        if retry_after:
+            return jsonify({
+                "success": False,
+                "error": "Rate limit exceeded. Please retry later.",
+                "retry_after": math.ceil(retry_after)
+            }), 429, {"Retry-After": str(math.ceil(retry_after))}
             
         try:
+            img_path = None
+            file = request.files.get("image")
+            if file and file.filename:
+                uploads_dir = Path("uploads")
+                uploads_dir.mkdir(parents=True, exist_ok=True)
+                img_path = str(uploads_dir / file.filename)
+                file.save(img_path)
+            canvas_data = request.form.get("canvas_data", "")
+            if canvas_data.startswith("data:image/"):
+                try:
+                    header, b64 = canvas_data.split(",", 1)
+                    raw = base64.b64decode(b64)
+                    uploads_dir = Path("uploads")
+                    uploads_dir.mkdir(parents=True, exist_ok=True)
+                    img_path = str(uploads_dir / "canvas_wireframe.png")
+                    with open(img_path, 'wb') as f:
+                        f.write(raw)
+                except Exception as e:
+                    return jsonify({"success": False, "error": f"Canvas image parse failed: {e}"}), 400
+            figma_url = request.form.get("figma_url", "").strip()
+            figma_token = request.form.get("figma_token") or os.getenv("FIGMA_TOKEN")
+            if figma_url:
+                try:
+                    img_from_figma = _download_figma_image(figma_url, figma_token, Path("uploads"))
+                    if img_from_figma:
+                        img_path = img_from_figma
+                    else:
+                        return jsonify({"success": False, "error": "Unable to render Figma file. Check URL and token."}), 400
+                except Exception as e:
+                    return jsonify({"success": False, "error": f"Figma fetch failed: {e}"}), 400
+
             result = create_and_deploy_project(
                 prompt=prompt,
                 project_name=project_name,
@@ -177,14 +280,183 @@ def create_app():
                 repo_name=repo_name if auto_deploy else None,
                 auto_deploy=auto_deploy,
                 img=img_path,
+                bypass_cache=request.form.get("no_cache") == "on",
+                tenant=tenant,
             )
-            return jsonify(result)
+            return jsonify(_with_trace_id(result))
         except Exception as e:
-            print(f"Error in project generation: {str(e)}")
+            logger.exception(f"Error in project generation: {str(e)}")
             return jsonify({
                 "success": False,
                 "error": f"Project generation failed: {str(e)}"
             }), 500
+        finally:
+            _release(tenant)
+
+    @app.route("/api/projects/<project_id>/edit", methods=["POST"])
+    def project_edit(project_id: str):
+        payload = request.get_json(silent=True) or request.form
+        change_request = (payload.get("change_request") or payload.get("prompt") or "").strip()
+        if not change_request:
+            return jsonify({"success": False, "error": "change_request is required"}), 400
+        if find_project(project_id) is None:
+            return jsonify({"success": False, "error": f"Project '{project_id}' not found"}), 404
+        if not os.getenv("GOOGLE_API_KEY"):
+            return jsonify({
+                "success": False,
+                "error": "AI service is not configured. Please contact the administrator."
+            }), 503
+
+        tenant = tenant_from_request(request)
+        retry_after = _admit(tenant)
+        if retry_after:
+            return jsonify({
+                "success": False,
+                "error": "Rate limit exceeded. Please retry later.",
+                "retry_after": math.ceil(retry_after)
+            }), 429, {"Retry-After": str(math.ceil(retry_after))}
+
+        try:
+            return jsonify(_with_trace_id(edit_project(project_id, change_request)))
+        except Exception as e:
+            logger.exception(f"Error in project edit: {str(e)}")
+            return jsonify({"success": False, "error": f"Project edit failed: {str(e)}"}), 500
+        finally:
+            _release(tenant)
+
+    @app.route("/api/batch", methods=["POST"])
+    def batch_create():
+        """Start a background batch from an uploaded JSONL file ("file") or a JSON {"items": [...]} body"""
+        if not os.getenv("GOOGLE_API_KEY"):
+            return jsonify({
+                "success": False,
+                "error": "AI service is not configured. Please contact the administrator."
+            }), 503
+        try:
+            upload = request.files.get("file")
+            if upload:
+                items = load_items(upload.stream.read().decode("utf-8").splitlines())
+                options = request.form
+            else:
+                body = request.get_json(silent=True) or {}
+                if not isinstance(body, dict) or not isinstance(body.get("items", []), list):
+                    raise ValueError('expected a JSON object with an "items" list')
+                items = load_items(json.dumps(item) for item in body.get("items", []))
+                options = body
+            concurrency = int(options.get("concurrency", 4))
+            retries = int(options.get("retries", 2))
+        except (TypeError, ValueError, UnicodeDecodeError) as e:
+            return jsonify({"success": False, "error": f"Invalid batch input: {e}"}), 400
+        if not items:
+            return jsonify({"success": False, "error": "Batch contains no items"}), 400
+        if any(not item["prompt"] for item in items):
+            return jsonify({"success": False, "error": "Every batch item needs a prompt"}), 400
+
+        token = options.get("github_token") or os.getenv("GITHUB_TOKEN")
+        # Items are charged to the caller's model/deploy budgets as they run
+        try:
+            batch_id = batch_manager.start(items, concurrency=concurrency, retries=retries, github_token=token,
+                                           tenant=tenant_from_request(request))
+        except BatchLimitError as e:
+            return jsonify({"success": False, "error": str(e)}), 429
+        return jsonify({
+            "success": True,
+            "batch_id": batch_id,
+            "items": len(items),
+            "status_url": url_for("batch_status", batch_id=batch_id)
+        }), 202
+
+    @app.route("/api/batch/<batch_id>/resume", methods=["POST"])
+    def batch_resume(batch_id: str):
+        body = request.get_json(silent=True) or request.form
+        try:
+            if not hasattr(body, "get"):
+                raise ValueError("expected a JSON object")
+            concurrency = int(body.get("concurrency", 4))
+            retries = int(body.get("retries", 2))
+        except (TypeError, ValueError) as e:
+            return jsonify({"success": False, "error": f"Invalid batch options: {e}"}), 400
+        token = body.get("github_token") or os.getenv("GITHUB_TOKEN")
+        try:
+            resumed = batch_manager.resume(batch_id, concurrency=concurrency, retries=retries, github_token=token,
+                                           tenant=tenant_from_request(request))
+        except BatchLimitError as e:
+            return jsonify({"success": False, "error": str(e)}), 429
+        if not resumed:
+            return jsonify({"success": False, "error": f"Batch '{batch_id}' not found or still running"}), 409
+        return jsonify({"success": True, "batch_id": batch_id,
+                        "status_url": url_for("batch_status", batch_id=batch_id)}), 202
+
+    @app.route("/api/batch/<batch_id>", methods=["GET"])
+    def batch_status(batch_id: str):
+        run = batch_manager.get(batch_id)
+        if run is None:
+            return jsonify({"error": f"Batch '{batch_id}' not found"}), 404
+        status = run.summary()
+        if request.args.get("results") == "1":
+            status["results"] = list(load_checkpoint(run.output_path).values())
+        return jsonify(status)
+
+    @app.route("/api/deployments/<username>/<repo_name>", methods=["GET"])
+    def deployment_status(username: str, repo_name: str):
+        """
+        Pages build status for a deployed repo. Pass wait=<seconds> (max 25) to
+        long-poll until the build settles or its status moves past version=<n>
+        """
+        try:
+            wait = min(float(request.args.get("wait", 0)), 25.0)
+            version = request.args.get("version", type=int)
+        except ValueError:
+            return jsonify({"error": "wait must be a number"}), 400
+        if wait > 0:
+            status = pages_watcher.wait(username, repo_name, timeout=wait, version=version)
+        else:
+            status = pages_watcher.status(username, repo_name)
+        if status is None:
+            return jsonify({"error": f"No deployment tracked for {username}/{repo_name}"}), 404
+        return jsonify(status)
+
+    @app.route("/api/diagnostics/models", methods=["GET"])
+    def model_diagnostics():
+        """Routing order per stage, sliding-window stats per model and context cache counters"""
+        return jsonify(dict(model_router.snapshot(), context_cache=dict(instruction_cache.stats)))
+
+    def _is_admin() -> bool:
+        supplied = request.headers.get("X-Admin-Token", "")
+        return bool(PROFILE_ADMIN_TOKEN) and hmac.compare_digest(supplied.encode(), PROFILE_ADMIN_TOKEN.encode())
+
+    @app.route("/api/admin/profiling", methods=["GET", "POST"])
+    def profiling():
+        """
+        GET: profiler settings and hottest frames per route. POST {"sample_rate", "mode",
+        "interval_ms"} changes them for this worker; sample_rate 0 turns profiling off
+        """
+        if not PROFILE_ADMIN_TOKEN:
+            abort(404)
+        if not _is_admin():
+            return jsonify({"error": "Admin token required"}), 401
+        if request.method == "POST":
+            payload = request.get_json(silent=True) or {}
+            try:
+                request_profiler.configure(
+                    sample_rate=float(payload["sample_rate"]) if "sample_rate" in payload else None,
+                    mode=payload.get("mode"),
+                    interval_ms=float(payload["interval_ms"]) if "interval_ms" in payload else None,
+                )
+            except (TypeError, ValueError) as e:
+                return jsonify({"error": str(e)}), 400
+            logger.info(f"Profiling set to {request_profiler.sample_rate} ({request_profiler.mode})")
+        return jsonify(request_profiler.status(top=request.args.get("top", 10, type=int)))
+
+    @app.route("/api/admin/profiling/flush", methods=["POST"])
+    def profiling_flush():
+        """Write this worker's aggregated profiles to PROFILE_DIR; pass reset=1 to start over"""
+        if not PROFILE_ADMIN_TOKEN:
+            abort(404)
+        if not _is_admin():
+            return jsonify({"error": "Admin token required"}), 401
+        files = request_profiler.flush(reset=request.args.get("reset") == "1")
+        return jsonify({"files": files})
 
     @app.route("/download", methods=["GET"])
     def download():
@@ -197,6 +469,8 @@ def create_app():
             for root, _, files in os.walk(project_path):
                 for f in files:
                     full = os.path.join(root, f)
+                    if is_precompressed_variant(full):
+                        continue
                     arcname = os.path.relpath(full, project_path)
                     zf.write(full, arcname)
         mem.seek(0)
@@ -226,7 +500,21 @@ def create_app():
             abort(403)
         if os.path.isdir(full):
             rel = os.path.join(rel, "index.html") if rel else "index.html"
-        return send_from_directory(base, rel, conditional=True)
+            full = os.path.join(full, "index.html")
+        # Serve the .br/.gz variant written by the build step when the client accepts it
+        accepted = request.headers.get("Accept-Encoding", "")
+        for suffix, encoding in PRECOMPRESSED.items():
+            if encoding in accepted and os.path.isfile(full + suffix):
+                response = send_from_directory(
+                    base, rel + suffix, conditional=True, etag=blob_store.sha_of(full + suffix),
+                    mimetype=mimetypes.guess_type(rel)[0] or "application/octet-stream"
+                )
+                response.headers["Content-Encoding"] = encoding
+                response.headers["Vary"] = "Accept-Encoding"
+                return response
+        # The content hash makes a stable ETag, unlike the default one derived from mtime
+        etag = blob_store.sha_of(full) if os.path.isfile(full) else True
+        return send_from_directory(base, rel, conditional=True, etag=etag)
 
     @app.route("/api/files", methods=["GET"])
     def api_files():
@@ -242,7 +530,7 @@ def create_app():
         files = {}
         try:
             for file_path in full_path.iterdir():
-                if file_path.is_file():
+                if file_path.is_file() and not is_precompressed_variant(str(file_path)):
                     files[file_path.name] = file_path.read_text(encoding='utf-8')
         except Exception as e:
             return jsonify({"error": f"Error reading files: {str(e)}"}), 500
@@ -1,21 +1,56 @@
 # backend.py
 import os
+import time
+import re
+import base64
+import shutil
 import logging
+import threading
 import uuid
 from pathlib import Path
 from datetime import datetime
+from contextlib import nullcontext
 from typing import Dict, Any
 
-from projectCreator import create_project_structure
-from model import get_data_from_agent
-from githubHandler import deploy_to_github
+from projectCreator import create_project_structure, read_project_files, apply_project_edit
+from model import get_data_from_agent, get_edit_from_agent, is_fallback_structure
+from pagesWatcher import pages_watcher
+from tracing import span
+from siteBuilder import build_project, rebuild_project, sources_path, SITE_BUILD_ENABLED
+from siteAudit import audit_site, SITE_AUDIT_ENABLED, SITE_AUDIT_BLOCK_DEPLOY
+from resultCache import result_cache, request_fingerprint, RESULT_CACHE_ENABLED
+from rateLimiter import rate_limiter, RATE_LIMIT_ENABLED
+from templateIndex import (
+    template_index,
+    TEMPLATE_INDEX_ENABLED,
+    TEMPLATE_SERVE_THRESHOLD,
+    TEMPLATE_SEED_THRESHOLD,
+)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 PROJECTS_DIR = Path("projects")
+BASE_URL = "https://autogenx.onrender.com"  # Your Render backend URL
 
+# Edits to the same project are applied one at a time
+_edit_locks: Dict[str, threading.Lock] = {}
+_edit_locks_guard = threading.Lock()
+
+
+def warm_up() -> None:
+    """
+    Load everything the app defers until first use
+
+    The genai SDK and the GitHub/HTTP stack are imported lazily so the app starts
+    fast. Under gunicorn with preload_app the master calls this once before forking,
+    so workers share the already-imported modules instead of each loading them.
+    """
+    from google import genai
+    from google.genai import types
+    import githubHandler
+    import deployPlanner
+    if TEMPLATE_INDEX_ENABLED:
+        template_index.stats()
 
 def create_and_deploy_project(
     prompt: str,
@@ -27,6 +62,8 @@ def create_and_deploy_project(
     img: str | None = None,
     figma_url: str | None = None,
     figma_token: str | None = None,
+    bypass_cache: bool = False,
+    tenant: str | None = None,
 ) -> dict:
     """
     Complete pipeline: Generate project from prompt using AI and optionally deploy to GitHub
@@ -41,26 +78,90 @@ def create_and_deploy_project(
         img: Path to uploaded image file
         figma_url: Figma design URL (not used in this implementation)
         figma_token: Figma access token (not used in this implementation)
+        bypass_cache: Skip the result cache for this request even when it is enabled
+        tenant: Rate-limit tenant whose deploy concurrency slot the deploy stage holds
     
     Returns:
         Dict containing project info and deployment status
     """
+    kwargs = dict(
+        prompt=prompt,
+        project_name=project_name,
+        github_token=github_token,
+        username=username,
+        repo_name=repo_name,
+        auto_deploy=auto_deploy,
+        img=img,
+        bypass_cache=bypass_cache,
+        tenant=tenant,
+    )
+
+    if not RESULT_CACHE_ENABLED:
+        return _generate_and_deploy(**kwargs)
+
+    if bypass_cache:
+        result = _generate_and_deploy(**kwargs)
+        result["cache"] = "bypass"
+        return result
+
+    # Deploy target is part of the key so a hit never skips a deploy to a different repo
+    key = request_fingerprint(
+        prompt,
+        img=img,
+        auto_deploy=auto_deploy,
+        username=username if auto_deploy else None,
+        repo_name=repo_name if auto_deploy else None,
+    )
+    result = result_cache.get_or_compute(key, lambda: _generate_and_deploy(**kwargs))
+    if result["cache"] == "hit":
+        logger.info(f"Cache hit: reusing {result.get('project_path')}")
+    return result
+
+
+def _generate_and_deploy(
+    prompt: str,
+    project_name: str | None = None,
+    github_token: str | None = None,
+    username: str | None = None,
+    repo_name: str | None = None,
+    auto_deploy: bool = False,
+    img: str | None = None,
+    bypass_cache: bool = False,
+    tenant: str | None = None,
+) -> dict:
+    """Run both model stages, write the project and optionally deploy it"""
     
     # Generate project name if not provided
     if not project_name:
-        import time
         project_name = f"generated_project_{int(time.time())}"
     
     # Create unique project ID for file organization
     pid = uuid.uuid4().hex[:8]
     project_dir_name = f"site-{pid}"
     
-    print(f"🎯 Creating project: {project_dir_name}")
-    print(f"📝 User request: {prompt}")
+    logger.info(f"Creating project {project_dir_name}", extra={"prompt": prompt})
     
-    # Step 1: Generate project files using AI
+    # Wall time per pipeline stage, reported back with the result
+    timings = {}
+
+    PROJECTS_DIR.mkdir(parents=True, exist_ok=True)
+    project_path = PROJECTS_DIR / project_dir_name
+
+    # Step 1: Generate project files using AI (or start from a close stored template)
     try:
-        agent_result = get_data_from_agent(prompt, img=img)
+        agent_result = None
+        # A caller bypassing the cache wants a fresh generation, not a stored one
+        if TEMPLATE_INDEX_ENABLED and not img and not bypass_cache:
+            stage_start = time.perf_counter()
+            with span("stage template") as trace_span:
+                agent_result = _project_from_template(prompt, project_path)
+                trace_span.set("outcome", (agent_result or {}).get("template", {}).get("mode", "miss"))
+            timings["template"] = round(time.perf_counter() - stage_start, 4)
+        if agent_result is None:
+            stage_start = time.perf_counter()
+            with span("stage model", image=bool(img)):
+                agent_result = get_data_from_agent(prompt, img=img)
+            timings["model"] = round(time.perf_counter() - stage_start, 4)
         
         if not agent_result:
             return {
@@ -91,11 +192,11 @@ def create_and_deploy_project(
     
     # Step 2: Create local project structure in projects directory
     try:
-        PROJECTS_DIR.mkdir(parents=True, exist_ok=True)
-        project_path = PROJECTS_DIR / project_dir_name
-        
-        # Create the project using the AI result
-        success = create_project_structure(agent_result, str(project_path))
+        # Create the project using the AI result (template projects are already on disk)
+        stage_start = time.perf_counter()
+        with span("stage project", files=len(agent_result.get("files", {}))):
+            success = "template" in agent_result or create_project_structure(agent_result, str(project_path))
+        timings["project"] = round(time.perf_counter() - stage_start, 4)
         
         if not success:
             return {
@@ -124,12 +225,39 @@ def create_and_deploy_project(
             "files_written": []
         }
     
+    # Check the generated files before anything reuses or deploys them: broken references,
+    # page weight, render-blocking resources
+    audit_report = _audit_project(project_path, timings)
+
+    # Remember good text-only generations, before the build step rewrites them; a site with
+    # broken references would only hand its problems on to later requests
+    if TEMPLATE_INDEX_ENABLED and not img and "template" not in agent_result \
+            and not is_fallback_structure(agent_result.get("files", {})) \
+            and (audit_report is None or audit_report["ok"]):
+        try:
+            template_index.add(prompt, str(project_path), agent_result.get("amplified_requirements"))
+        except Exception as e:
+            logger.error(f"Error adding project to template index: {str(e)}")
+
+    # Optional build step: minify, purge unused CSS, fingerprint and precompress
+    build_report = None
+    if SITE_BUILD_ENABLED:
+        try:
+            stage_start = time.perf_counter()
+            with span("stage build"):
+                build_report = build_project(str(project_path))
+            timings["build"] = round(time.perf_counter() - stage_start, 4)
+            logger.info(f"Optimized site: {build_report['before_bytes']} -> {build_report['after_bytes']} bytes")
+        except Exception as e:
+            # The unoptimized files are still valid, so carry on with them
+            logger.error(f"Error optimizing project: {str(e)}")
+
+    # The build renames and rewrites files, so audit what will actually be deployed
+    if build_report and audit_report is not None:
+        audit_report = _audit_project(project_path, timings)
+    
     # Generate preview and download URLs for the frontend
-    import base64
-    b64_path = base64.urlsafe_b64encode(str(project_path).encode()).decode()
-    base_url = "https://autogenx.onrender.com"  # Your Render backend URL
-    preview_url = f"{base_url}/preview/{b64_path}/"
-    download_url = f"{base_url}/download?path={str(project_path)}"
+    preview_url, download_url = _project_urls(project_path)
     
     # Get list of created files
     files_created = []
@@ -138,6 +266,7 @@ def create_and_deploy_project(
     
     result = {
         "success": True,
+        "project_id": project_dir_name,
         "project_path": str(project_path),
         "preview_url": preview_url,
         "download_url": download_url,
@@ -146,25 +275,53 @@ def create_and_deploy_project(
         "github_url": None,
         "pages_url": None,
         "generated_at": datetime.utcnow().isoformat() + "Z",
-        "files_written": files_created
+        "files_written": files_created,
+        "timings": timings
     }
+    if build_report:
+        result["build_report"] = build_report
+    if "template" in agent_result:
+        result["template"] = agent_result["template"]
+    if audit_report:
+        result["audit_report"] = audit_report
     
-    # Step 3: Deploy to GitHub if requested
-    if auto_deploy and github_token and username and repo_name:
-        print(f"\n🌐 Auto-deploying to GitHub...")
+    # Step 3: Deploy to GitHub if requested (a page with missing assets isn't worth a deploy)
+    if auto_deploy and SITE_AUDIT_BLOCK_DEPLOY and audit_report and not audit_report["ok"]:
+        broken = [link["ref"] for link in audit_report["broken_links"]]
+        result["deployment_status"] = "blocked"
+        result["deployment_error"] = f"Site audit found {len(broken)} broken link(s): {', '.join(broken[:5])}"
+        logger.warning(f"Deployment blocked: {len(broken)} broken link(s)", extra={"broken_links": broken[:20]})
+
+    elif auto_deploy and github_token and username and repo_name:
         
         try:
-            website_url = deploy_to_github(str(project_path), github_token, username, repo_name)
+            deploy_started_at = time.time()
+            stage_start = time.perf_counter()
+            from githubHandler import deploy_to_github_with_plan
+            with _deploy_slot(tenant), span("stage deploy", repo=f"{username}/{repo_name}") as trace_span:
+                deployment = deploy_to_github_with_plan(str(project_path), github_token, username, repo_name)
+                trace_span.set("success", deployment["success"])
+            timings["deploy"] = round(time.perf_counter() - stage_start, 4)
+            website_url = deployment["website_url"] if deployment["success"] else None
+            result["deploy_plan"] = deployment["plan"]
             
             if website_url:
                 result["pages_url"] = website_url
                 result["github_url"] = f"https://github.com/{username}/{repo_name}"
                 result["deployment_status"] = "success"
-                print(f"\n🎉 Project successfully deployed!")
-                print(f"🔗 Live website: {website_url}")
+                logger.info(f"Project deployed to {website_url}")
+
+                # Track the Pages build in the background so clients can wait for the site to go live.
+                # A deploy that changed nothing triggers no build, so report the latest one instead.
+                if ".github.io/" in website_url:
+                    since = 0 if (deployment["plan"] or {}).get("no_changes") else deploy_started_at
+                    result["pages_status"] = pages_watcher.watch(
+                        github_token, username, repo_name, website_url, since=since
+                    )
+                    result["pages_status_url"] = f"{BASE_URL}/api/deployments/{username}/{repo_name}"
             else:
                 result["deployment_status"] = "failed"
-                print(f"\n⚠️ Local project created but deployment failed")
+                logger.warning("Local project created but deployment failed")
                 
         except Exception as e:
             logger.error(f"Deployment error: {str(e)}")
@@ -174,6 +331,161 @@ def create_and_deploy_project(
     elif auto_deploy:
         result["deployment_status"] = "skipped"
         result["deployment_error"] = "Missing GitHub credentials for deployment"
-        print(f"\n⚠️ Deployment skipped: Missing GitHub token, username, or repo name")
+        logger.warning("Deployment skipped: missing GitHub token, username, or repo name")
     
     return result
+
+
+def _deploy_slot(tenant: str | None):
+    """The tenant's deploy concurrency slot, held only while the deploy stage runs"""
+    if tenant is None or not RATE_LIMIT_ENABLED:
+        return nullcontext()
+    return rate_limiter.slot(tenant, "deploy")
+
+
+def _audit_project(project_path: Path, timings: dict) -> dict | None:
+    """Run the site audit when enabled; an audit failure never fails the generation"""
+    if not SITE_AUDIT_ENABLED:
+        return None
+    try:
+        stage_start = time.perf_counter()
+        with span("stage audit") as trace_span:
+            report = audit_site(str(project_path))
+            trace_span.set("broken_links", len(report["broken_links"]))
+        timings["audit"] = round(timings.get("audit", 0) + time.perf_counter() - stage_start, 4)
+        return report
+    except Exception as e:
+        logger.error(f"Error auditing project: {str(e)}")
+        return None
+
+
+def _project_from_template(prompt: str, project_path: Path) -> dict | None:
+    """
+    Start the project from the closest stored template when one is similar enough
+
+    Above TEMPLATE_SERVE_THRESHOLD the template is used as is; above
+    TEMPLATE_SEED_THRESHOLD it is copied and adapted with one edit call. Returns
+    an agent-style result with a "template" entry, or None to generate normally.
+    """
+    found = template_index.match(prompt)
+    if not found or found[1] < TEMPLATE_SEED_THRESHOLD:
+        return None
+    entry, score = found
+    mode = "direct" if score >= TEMPLATE_SERVE_THRESHOLD else "seed"
+    logger.info(f"Template {entry['id']} matches with score {score:.2f} ({mode})")
+
+    try:
+        files = template_index.materialize(entry, str(project_path))
+    except Exception as e:
+        # e.g. another worker evicted the template between match and copy
+        logger.error(f"Could not copy template {entry['id']}, generating instead: {str(e)}")
+        shutil.rmtree(project_path, ignore_errors=True)
+        return None
+    if mode == "seed":
+        edit = get_edit_from_agent(
+            f"This site was built for: \"{entry['prompt']}\". Adapt it to this request instead: \"{prompt}\"",
+            read_project_files(str(project_path)),
+        )
+        report = apply_project_edit(str(project_path), edit) if edit is not None else None
+        if not report or not (report["changed"] or report["created"]):
+            # An unadapted copy would answer a different request; generate from scratch instead
+            shutil.rmtree(project_path, ignore_errors=True)
+            return None
+        files = read_project_files(str(project_path))
+
+    return {
+        "amplified_requirements": entry.get("amplified_requirements", {}),
+        "files": files,
+        "template": {"id": entry["id"], "score": round(score, 4), "mode": mode},
+    }
+
+
+def _project_urls(project_path: Path) -> tuple[str, str]:
+    """Preview and download URLs for a local project directory"""
+    b64_path = base64.urlsafe_b64encode(str(project_path).encode()).decode()
+    return f"{BASE_URL}/preview/{b64_path}/", f"{BASE_URL}/download?path={str(project_path)}"
+
+
+def find_project(project_id: str) -> Path | None:
+    """Resolve a project id (the site-xxxxxxxx directory name) to its directory"""
+    if not re.fullmatch(r"[\w-]+", project_id or ""):
+        return None
+    project_path = PROJECTS_DIR / project_id
+    return project_path if project_path.is_dir() else None
+
+
+def edit_project(project_id: str, change_request: str) -> dict:
+    """
+    Apply a follow-up change request to an existing project in place
+
+    Only the current files and the request go to the model, which answers with
+    patches or the affected files; everything else stays as it is.
+
+    Args:
+        project_id: Directory name of the project under projects/
+        change_request: The user's follow-up instruction
+
+    Returns:
+        Dict with the changed files, the edit report and fresh preview/download URLs
+    """
+    project_path = find_project(project_id)
+    if project_path is None:
+        return {"success": False, "error": f"Project '{project_id}' not found"}
+
+    with _edit_locks_guard:
+        lock = _edit_locks.setdefault(project_id, threading.Lock())
+
+    with lock:
+        timings = {}
+        # A built project is edited through its unbuilt sources and rebuilt, so patches see
+        # the original file names and the assets get fresh fingerprints and compressed variants
+        sources = sources_path(project_path)
+        edit_path = sources if sources.is_dir() else project_path
+        files = read_project_files(str(edit_path))
+        logger.info(f"Editing {project_id} ({len(files)} files)", extra={"change_request": change_request})
+
+        stage_start = time.perf_counter()
+        with span("stage model", files=len(files)):
+            edit = get_edit_from_agent(change_request, files)
+        timings["model"] = round(time.perf_counter() - stage_start, 4)
+        if edit is None:
+            return {"success": False, "error": "Failed to generate edits using AI", "project_path": str(project_path)}
+
+        stage_start = time.perf_counter()
+        with span("stage apply"):
+            report = apply_project_edit(str(edit_path), edit)
+        timings["apply"] = round(time.perf_counter() - stage_start, 4)
+        build_report = None
+        if edit_path == sources and (report["changed"] or report["created"]):
+            stage_start = time.perf_counter()
+            with span("stage build"):
+                build_report = rebuild_project(str(project_path))
+            timings["build"] = round(time.perf_counter() - stage_start, 4)
+        audit_report = _audit_project(project_path, timings)
+
+    for failure in report["failed"]:
+        logger.warning(f"Skipped edit to {failure['file']}: {failure['reason']}")
+    files_changed = report["changed"] + report["created"]
+    if files_changed:
+        # Cached generations pointing here no longer describe what's on disk
+        result_cache.invalidate_path(str(project_path))
+
+    preview_url, download_url = _project_urls(project_path)
+    result = {
+        "success": bool(files_changed) or not report["failed"],
+        "project_id": project_id,
+        "project_path": str(project_path),
+        "preview_url": preview_url,
+        "download_url": download_url,
+        "files_changed": files_changed,
+        "edit_report": report,
+        "edited_at": datetime.utcnow().isoformat() + "Z",
+        "timings": timings,
+    }
+    if build_report:
+        result["build_report"] = build_report
+    if audit_report:
+        result["audit_report"] = audit_report
+    if not result["success"]:
+        result["error"] = "None of the requested edits could be applied"
+    return result
@@ -0,0 +1,318 @@
+"""
+Batch generation driven by a JSONL request file
+
+Each input line is a JSON object with a "prompt" (or "title"/"body", which are
+joined into one) and optionally "id"/"request_id", "project_name", "image",
+"auto_deploy", "github_username", "repo_name". "image" is a local file path and
+is only honoured from the command line; batches submitted through the API
+cannot reference files on the server. Every finished item is appended
+to the results JSONL immediately, so a rerun with the same output file skips
+items that already succeeded and only retries the rest.
+
+Usage:
+    python batchRunner.py prompts.jsonl --output results.jsonl --concurrency 8 --retries 2
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable
+
+from logConfig import configure_logging, set_request_id
+from tracing import start_trace, end_trace, span
+from rateLimiter import rate_limiter, RATE_LIMIT_ENABLED
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+# Batches one tenant may have running at once through the API
+BATCH_MAX_PER_TENANT = int(os.getenv("BATCH_MAX_PER_TENANT", "2"))
+BATCHES_DIR = Path("batches")
+
+
+def load_items(lines, allow_image: bool = False) -> List[Dict[str, Any]]:
+    """
+    Parse JSONL lines into batch items with a stable id and a prompt
+
+    Raises:
+        ValueError: A line is not a JSON object, or sets "image" while allow_image is False
+    """
+    items = []
+    for index, line in enumerate(lines):
+        line = line.strip() if isinstance(line, str) else line.decode("utf-8").strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            raise ValueError(f"line {index + 1} is not a JSON object")
+        if record.get("image") and not allow_image:
+            raise ValueError(f"line {index + 1}: \"image\" is only accepted from the command line")
+        prompt = record.get("prompt")
+        if not prompt:
+            prompt = "\n\n".join(part for part in (record.get("title"), record.get("body")) if part)
+        items.append({
+            "id": str(record.get("id") or record.get("request_id") or index),
+            "prompt": prompt,
+            "project_name": record.get("project_name"),
+            "img": record.get("image") if allow_image else None,
+            "auto_deploy": bool(record.get("auto_deploy")),
+            "username": record.get("github_username"),
+            "repo_name": record.get("repo_name"),
+        })
+    return items
+
+
+class BatchLimitError(Exception):
+    pass
+
+
+class BatchRunningError(Exception):
+    pass
+
+
+def load_checkpoint(output_path: str) -> Dict[str, Dict[str, Any]]:
+    """Read the latest record per item id from an existing results file"""
+    done = {}
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-write can leave one torn line at the end
+                continue
+            done[record["id"]] = record
+    return done
+
+
+class BatchRun:
+    """One batch: bounded worker pool, per-item retry, append-only results file"""
+
+    def __init__(self, items: List[Dict[str, Any]], output_path: str, concurrency: int = 4, retries: int = 2,
+                 backoff: float = 2.0, github_token: str | None = None,
+                 generate: Callable[..., Dict[str, Any]] | None = None, tenant: str | None = None):
+        self.items = items
+        self.output_path = output_path
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.github_token = github_token or os.getenv("GITHUB_TOKEN")
+        self._generate = generate
+        # Rate-limit tenant the items are charged to (API batches); None for the CLI
+        self.tenant = tenant
+        self._write_lock = threading.Lock()
+        self.progress = {"total": len(items), "skipped": 0, "succeeded": 0, "failed": 0, "running": 0}
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.error: Optional[str] = None
+
+    def _model_slot(self):
+        """The tenant's model slot, held for one attempt like an interactive request holds it"""
+        if self.tenant is None or not RATE_LIMIT_ENABLED:
+            return nullcontext()
+        return rate_limiter.slot(self.tenant, "model")
+
+    def _charge(self, item: Dict[str, Any]) -> None:
+        """Charge one attempt to the tenant's model (and deploy) budget, waiting for it to refill"""
+        if self.tenant is None or not RATE_LIMIT_ENABLED:
+            return
+        rate_limiter.charge(self.tenant, "model")
+        if item["auto_deploy"]:
+            rate_limiter.charge(self.tenant, "deploy")
+
+    def _run_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        if self._generate is None:
+            # Imported lazily so the CLI can parse arguments without loading the model stack
+            from backend import create_and_deploy_project
+            self._generate = create_and_deploy_project
+
+        set_request_id(f"item-{item['id']}")
+        trace = start_trace("batch item", item_id=item["id"])
+        with self._write_lock:
+            self.progress["running"] += 1
+        started = time.perf_counter()
+        result: Dict[str, Any] = {}
+        attempts = 0
+        for attempts in range(1, self.retries + 2):
+            try:
+                with span("attempt", attempt=attempts), self._model_slot():
+                    self._charge(item)
+                    result = self._generate(
+                        prompt=item["prompt"],
+                        project_name=item["project_name"],
+                        github_token=self.github_token if item["auto_deploy"] else None,
+                        username=item["username"] if item["auto_deploy"] else None,
+                        repo_name=item["repo_name"] if item["auto_deploy"] else None,
+                        auto_deploy=item["auto_deploy"],
+                        img=item["img"],
+                        tenant=self.tenant,
+                    )
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+            if result.get("success"):
+                break
+            if attempts <= self.retries:
+                time.sleep(self.backoff * (2 ** (attempts - 1)))
+
+        record = {
+            "id": item["id"],
+            "success": bool(result.get("success")),
+            "attempts": attempts,
+            "seconds": round(time.perf_counter() - started, 3),
+            "finished_at": datetime.utcnow().isoformat() + "Z",
+            "result": result,
+        }
+        if trace is not None:
+            record["trace_id"] = trace[0].trace.trace_id
+            end_trace(trace)
+        with self._write_lock:
+            self.progress["running"] -= 1
+            self.progress["succeeded" if record["success"] else "failed"] += 1
+            with open(self.output_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        return record
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Process every item not already successful in the results file
+
+        finished_at is set even when the run dies, so the batch stops counting
+        against its tenant and can be resumed; the error is kept in the summary.
+        """
+        self.started_at = datetime.utcnow().isoformat() + "Z"
+        try:
+            Path(self.output_path).parent.mkdir(parents=True, exist_ok=True)
+            checkpoint = load_checkpoint(self.output_path)
+            pending = [item for item in self.items if not checkpoint.get(item["id"], {}).get("success")]
+            self.progress["skipped"] = len(self.items) - len(pending)
+            if self.progress["skipped"]:
+                logger.info(f"Resuming batch: {self.progress['skipped']} items already done",
+                            extra={"output_path": self.output_path})
+
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                for record in pool.map(self._run_item, pending):
+                    logger.info(f"Batch item {record['id']} {'succeeded' if record['success'] else 'failed'}",
+                                extra={"item_id": record["id"], "seconds": record["seconds"],
+                                       "attempts": record["attempts"]})
+        except Exception as e:
+            self.error = str(e)
+            logger.exception(f"Batch run failed: {e}", extra={"output_path": self.output_path})
+            raise
+        finally:
+            self.finished_at = datetime.utcnow().isoformat() + "Z"
+        return self.summary()
+
+    def summary(self) -> Dict[str, Any]:
+        summary = dict(self.progress, output_path=self.output_path,
+                       started_at=self.started_at, finished_at=self.finished_at)
+        if self.error is not None:
+            summary["error"] = self.error
+        return summary
+
+
+class BatchManager:
+    """Background batch runs started from the API, addressable by id"""
+
+    def __init__(self):
+        self._runs: Dict[str, BatchRun] = {}
+        self._lock = threading.Lock()
+
+    def start(self, items: List[Dict[str, Any]], concurrency: int, retries: int,
+              github_token: str | None = None, batch_id: str | None = None, tenant: str | None = None) -> str:
+        """
+        Run items in the background; reusing a batch_id resumes from its results file
+
+        Raises:
+            BatchLimitError: tenant already has BATCH_MAX_PER_TENANT batches running
+            BatchRunningError: a batch with this batch_id is still running
+        """
+        batch_id = batch_id or uuid.uuid4().hex[:8]
+        batch_dir = BATCHES_DIR / f"batch-{batch_id}"
+        run = BatchRun(items, str(batch_dir / "results.jsonl"), concurrency=min(concurrency, BATCH_MAX_CONCURRENCY),
+                       retries=retries, github_token=github_token, tenant=tenant)
+        # Check and register in one step so concurrent requests can't both slip under the limit
+        with self._lock:
+            if tenant is not None and self._running(tenant) >= BATCH_MAX_PER_TENANT:
+                raise BatchLimitError(f"At most {BATCH_MAX_PER_TENANT} batches may run at once")
+            existing = self._runs.get(batch_id)
+            if existing and existing.finished_at is None:
+                raise BatchRunningError(f"Batch '{batch_id}' is still running")
+            self._runs[batch_id] = run
+        try:
+            batch_dir.mkdir(parents=True, exist_ok=True)
+            # Keep the input next to the results so the batch can be resumed after a restart
+            with open(batch_dir / "input.jsonl", "w", encoding="utf-8") as f:
+                for item in items:
+                    f.write(json.dumps(item) + "\n")
+        except OSError:
+            with self._lock:
+                if existing:
+                    self._runs[batch_id] = existing
+                else:
+                    self._runs.pop(batch_id, None)
+            raise
+        threading.Thread(target=run.run, daemon=True, name=f"batch-{batch_id}").start()
+        return batch_id
+
+    def resume(self, batch_id: str, concurrency: int, retries: int, github_token: str | None = None,
+               tenant: str | None = None) -> bool:
+        """Restart a batch from the input saved on disk; items that already succeeded are skipped"""
+        input_path = BATCHES_DIR / f"batch-{batch_id}" / "input.jsonl"
+        existing = self.get(batch_id)
+        if not input_path.exists() or (existing and existing.finished_at is None):
+            return False
+        with open(input_path, encoding="utf-8") as f:
+            items = [json.loads(line) for line in f if line.strip()]
+        try:
+            self.start(items, concurrency=concurrency, retries=retries, github_token=github_token,
+                       batch_id=batch_id, tenant=tenant)
+        except BatchRunningError:
+            # Another request resumed it between the check above and start
+            return False
+        return True
+
+    def running(self, tenant: str) -> int:
+        """Number of tenant's batches that haven't finished yet"""
+        with self._lock:
+            return self._running(tenant)
+
+    def _running(self, tenant: str) -> int:
+        # Caller holds self._lock
+        return sum(1 for run in self._runs.values() if run.tenant == tenant and run.finished_at is None)
+
+    def get(self, batch_id: str) -> Optional[BatchRun]:
+        with self._lock:
+            return self._runs.get(batch_id)
+
+
+batch_manager = BatchManager()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate projects for every prompt in a JSONL file")
+    parser.add_argument("input", help="JSONL file with one request per line")
+    parser.add_argument("--output", default="results.jsonl", help="Results JSONL; reused as the resume checkpoint")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--retries", type=int, default=2, help="Retries per item after the first attempt")
+    parser.add_argument("--backoff", type=float, default=2.0, help="Initial retry delay in seconds (doubles)")
+    args = parser.parse_args()
+    configure_logging()
+
+    with open(args.input, encoding="utf-8") as f:
+        items = load_items(f, allow_image=True)
+    run = BatchRun(items, args.output, concurrency=args.concurrency, retries=args.retries, backoff=args.backoff)
+    print(json.dumps(run.run(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Offline benchmark for the generation pipeline
+
+Starts local stub servers for Gemini, Figma and GitHub, points the app at them
+through GOOGLE_GENAI_BASE_URL / FIGMA_API_URL / GITHUB_API_URL, then drives
+/api/generate at the requested concurrency and reports throughput, per-stage
+latency percentiles and the memory high-water mark.
+
+Usage:
+    python benchmark.py --requests 50 --concurrency 8 --latency-ms 150 --deploy --figma
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+
+from stubServers import genai_stub, figma_stub, github_stub
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(max(values) * 1000, 2) if values else 0.0,
+    }
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    stub_options = dict(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                        error_rate=args.error_rate, seed=args.seed)
+    servers = {
+        "genai": genai_stub(html_kb=args.html_kb, truncate_chars=args.truncate_chars,
+                            exhausted_models=tuple(args.exhausted_model), **stub_options).start(),
+        "figma": figma_stub(**stub_options).start(),
+        "github": github_stub(**stub_options).start(),
+    }
+
+    # Configuration is read at import time, so set it before importing the app
+    os.environ.update({
+        "GOOGLE_API_KEY": "benchmark",
+        "GOOGLE_GENAI_BASE_URL": servers["genai"].url,
+        "FIGMA_API_URL": servers["figma"].url,
+        "FIGMA_TOKEN": "benchmark",
+        "GITHUB_API_URL": servers["github"].url,
+        "GITHUB_TOKEN": "benchmark",
+        "GEMINI_CONTEXT_CACHE": "1" if args.context_cache else "0",
+        # Each simulated client sends its own key; only configured keys get their own rate-limit budget
+        "RATE_LIMIT_API_KEYS": ",".join(f"bench-{i}" for i in range(args.requests)),
+    })
+    workdir = tempfile.mkdtemp(prefix="autogenx-bench-")
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app import create_app
+    from backend import warm_up
+    from modelRouter import model_router
+    from profiler import request_profiler
+
+    client = create_app().test_client()
+    # Load the lazily imported SDKs up front, as a preloading server does, so the first
+    # timed requests don't pay for the imports; the cost is reported separately
+    warm_started = time.perf_counter()
+    warm_up()
+    warm_up_seconds = time.perf_counter() - warm_started
+    if args.profile:
+        request_profiler.configure(sample_rate=1.0, mode=args.profile)
+
+    def one_request(i: int) -> Dict[str, Any]:
+        form = {"prompt": f"{args.prompt} #{i if args.unique else 0}"}
+        if args.figma:
+            form["figma_url"] = "https://www.figma.com/file/BENCHKEY/bench?node-id=1:2"
+        if args.deploy:
+            form.update({"auto_deploy": "on", "github_username": "bench", "repo_name": f"bench-{i % args.repos}"})
+        started = time.perf_counter()
+        response = client.post("/api/generate", data=form, headers={"X-API-Key": f"bench-{i}"})
+        elapsed = time.perf_counter() - started
+        body = response.get_json(silent=True) or {}
+        return {"status": response.status_code, "success": bool(body.get("success")),
+                "seconds": elapsed, "timings": body.get("timings", {})}
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(one_request, range(args.requests)))
+    wall = time.perf_counter() - started
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    for server in servers.values():
+        server.stop()
+
+    stages: Dict[str, List[float]] = defaultdict(list)
+    for r in results:
+        stages["end_to_end"].append(r["seconds"])
+        for stage, seconds in r["timings"].items():
+            stages[stage].append(seconds)
+
+    upstream: Dict[str, List[float]] = defaultdict(list)
+    upstream_errors: Dict[str, int] = defaultdict(int)
+    upstream_bytes: Dict[str, int] = defaultdict(int)
+    for name, server in servers.items():
+        for call in server.calls:
+            key = f"{name}.{call['route']}"
+            upstream[key].append(call["seconds"])
+            upstream_bytes[key] += call["bytes_in"]
+            if call["injected"]:
+                upstream_errors[key] += 1
+
+    succeeded = sum(1 for r in results if r["success"])
+    return {
+        "config": vars(args),
+        "requests": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "warm_up_seconds": round(warm_up_seconds, 3),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(results) / wall, 3) if wall else 0.0,
+        "stages": {stage: summarize(values) for stage, values in stages.items()},
+        "upstream": {key: dict(summarize(values), injected_errors=upstream_errors[key],
+                               avg_request_bytes=round(upstream_bytes[key] / len(values)))
+                     for key, values in sorted(upstream.items())},
+        "memory": {
+            "tracemalloc_peak_mb": round(traced_peak / 1024 / 1024, 2),
+            # ru_maxrss is KiB on Linux
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+        },
+        "model_routing": model_router.snapshot(),
+        "profiles": request_profiler.flush() if args.profile else [],
+        "workdir": workdir,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /api/generate against local stub upstreams")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=100, help="Base latency added by every stub call")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Extra uniform random latency per call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub calls that fail")
+    parser.add_argument("--html-kb", type=int, default=8, help="Size of the generated HTML body")
+    parser.add_argument("--truncate-chars", type=int, default=0,
+                        help="Cut every Gemini answer into slices of this size to exercise continuations")
+    parser.add_argument("--exhausted-model", action="append", default=[],
+                        help="Answer this model with 429 RESOURCE_EXHAUSTED (repeatable) to exercise failover")
+    parser.add_argument("--prompt", default="Landing page for a coffee shop")
+    parser.add_argument("--unique", action="store_true", help="Give each request a distinct prompt")
+    parser.add_argument("--figma", action="store_true", help="Include a Figma URL in every request")
+    parser.add_argument("--deploy", action="store_true", help="Auto-deploy every request to the GitHub stub")
+    parser.add_argument("--repos", type=int, default=1, help="Number of distinct target repos when deploying")
+    parser.add_argument("--context-cache", action="store_true", help="Serve system instructions from Gemini cached content")
+    parser.add_argument("--profile", choices=["sample", "cprofile"],
+                        help="Profile every request and write the per-route profiles to the workdir")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    report = run_benchmark(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
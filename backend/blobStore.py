@@ -0,0 +1,166 @@
+"""
+Content-addressed storage for generated project files
+
+Files are keyed by their git blob sha (sha1 of "blob <size>\\0" + content), so
+the same key doubles as an ETag for the preview route and as the sha GitHub
+reports for a file, which lets a deploy skip files the repo already has.
+
+With BLOB_STORE_ENABLED=1 each distinct content is stored once under
+BLOB_STORE_DIR and project files are hardlinks to it; identical files across
+projects (fallback pages, templates, rebuilt assets) then share one inode and
+writing one costs a link instead of a copy. Blob files must never be modified
+in place, so every writer goes through write_file(), which replaces the path.
+BLOB_STORE_DIR has to be on the same filesystem as projects/; otherwise files
+are copied.
+
+    python blobStore.py stats
+    python blobStore.py gc        # remove blobs no project links to any more
+"""
+import os
+import sys
+import json
+import errno
+import shutil
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+BLOB_STORE_ENABLED = os.getenv("BLOB_STORE_ENABLED", "0") == "1"
+BLOB_STORE_DIR = Path(os.getenv("BLOB_STORE_DIR", "blobs"))
+# Remembered (inode, mtime, size) -> sha entries before the table is cleared
+SHA_CACHE_MAX = int(os.getenv("BLOB_SHA_CACHE_MAX", "50000"))
+
+
+def git_blob_sha(data: bytes) -> str:
+    """The sha git (and the GitHub contents API) uses for a file with this content"""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class BlobStore:
+    def __init__(self, root: Path = BLOB_STORE_DIR, enabled: bool = BLOB_STORE_ENABLED):
+        self.root = root
+        self.enabled = enabled
+        self._shas: Dict[Tuple[int, int, int, int], str] = {}
+        self._lock = threading.Lock()
+        self.counters = {"writes": 0, "deduplicated": 0, "bytes_saved": 0, "copies": 0}
+
+    def _blob_path(self, sha: str) -> Path:
+        return self.root / sha[:2] / sha[2:]
+
+    @staticmethod
+    def _stat_key(st: os.stat_result) -> Tuple[int, int, int, int]:
+        return st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _count(self, counter: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[counter] += n
+
+    def _remember(self, path: Path, sha: str) -> None:
+        key = self._stat_key(path.stat())
+        with self._lock:
+            if len(self._shas) >= SHA_CACHE_MAX:
+                self._shas.clear()
+            self._shas[key] = sha
+
+    def put(self, data: bytes) -> Tuple[str, bool]:
+        """Store data if it isn't stored yet; returns (sha, whether it already existed)"""
+        sha = git_blob_sha(data)
+        blob = self._blob_path(sha)
+        if blob.exists():
+            return sha, True
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        tmp = blob.with_name(f".{blob.name}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, blob)
+        return sha, False
+
+    def write_file(self, path: str | Path, content: str | bytes) -> str:
+        """Atomically (re)place path with content and return its blob sha"""
+        path = Path(path)
+        data = content.encode("utf-8") if isinstance(content, str) else content
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        if self.enabled:
+            sha, existed = self.put(data)
+            if path.exists() and os.path.samefile(path, self._blob_path(sha)):
+                # Already linked to this content; renaming a link onto itself would leave tmp behind
+                self._remember(path, sha)
+                return sha
+            try:
+                tmp.unlink(missing_ok=True)
+                os.link(self._blob_path(sha), tmp)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                    raise
+                tmp.write_bytes(data)
+                self._count("copies")
+            if existed:
+                self._count("deduplicated")
+                self._count("bytes_saved", len(data))
+        else:
+            sha = git_blob_sha(data)
+            tmp.write_bytes(data)
+        os.replace(tmp, path)
+        self._count("writes")
+        self._remember(path, sha)
+        return sha
+
+    def sha_of(self, path: str | Path) -> str:
+        """Blob sha of a file on disk, hashed only when it changed since it was last seen"""
+        path = Path(path)
+        key = self._stat_key(path.stat())
+        with self._lock:
+            sha = self._shas.get(key)
+        if sha is None:
+            sha = git_blob_sha(path.read_bytes())
+            with self._lock:
+                self._shas[key] = sha
+        return sha
+
+    def copy_file(self, src: str, dst: str) -> str:
+        """shutil.copytree copy_function: link to the stored blob instead of copying bytes"""
+        if not self.enabled:
+            return shutil.copy2(src, dst)
+        self.write_file(dst, Path(src).read_bytes())
+        return dst
+
+    def copy_tree(self, src: str | Path, dst: str | Path, **kwargs) -> None:
+        shutil.copytree(src, dst, copy_function=self.copy_file, **kwargs)
+
+    def _blobs(self):
+        return (p for p in self.root.glob("??/*") if not p.name.startswith("."))
+
+    def gc(self) -> Dict[str, int]:
+        """Delete blobs whose only remaining link is the store's own; run it while no generation is in flight"""
+        removed = freed = 0
+        for blob in self._blobs():
+            st = blob.stat()
+            if st.st_nlink == 1:
+                blob.unlink(missing_ok=True)
+                removed += 1
+                freed += st.st_size
+        logger.info(f"Blob store gc removed {removed} blob(s), {freed} bytes")
+        return {"removed": removed, "freed_bytes": freed}
+
+    def stats(self) -> Dict[str, Any]:
+        blobs = total = links = 0
+        for blob in self._blobs():
+            st = blob.stat()
+            blobs += 1
+            total += st.st_size
+            links += st.st_nlink - 1
+        return dict(self.counters, enabled=self.enabled, blobs=blobs, stored_bytes=total, project_links=links)
+
+
+blob_store = BlobStore()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command not in ("stats", "gc"):
+        sys.exit("usage: python blobStore.py [stats|gc]")
+    print(json.dumps(blob_store.gc() if command == "gc" else blob_store.stats(), indent=2))
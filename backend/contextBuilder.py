@@ -0,0 +1,117 @@
+import os
+import json
+import logging
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# Rough budget for the development-stage input (system instruction excluded)
+DEVELOPMENT_CONTEXT_TOKENS = int(os.getenv("DEVELOPMENT_CONTEXT_TOKENS", "3000"))
+PROMPT_CHAR_LIMIT = int(os.getenv("DEVELOPMENT_PROMPT_CHAR_LIMIT", "4000"))
+
+# Per-field character caps, in priority order: when the whole context is still over
+# budget, fields at the end of this list are shortened first
+FIELD_LIMITS = {
+    "layout": 1500,
+    "content": 1500,
+    "functionality": 1200,
+    "visual_design": 1200,
+    "interactions": 1000,
+    "purpose": 400,
+    "design_system": 800,
+    "responsive_design": 600,
+    "semantic_structure": 600,
+    "dynamic_content": 600,
+    "animations": 600,
+    "api_integration": 400,
+}
+DEFAULT_FIELD_LIMIT = 800
+MIN_FIELD_CHARS = 80
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap offline token estimate (~4 characters per token for English/code)"""
+    return (len(text) + 3) // 4
+
+
+def _flatten(value: Any) -> str:
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, list):
+        return "; ".join(_flatten(v) for v in value)
+    if isinstance(value, dict):
+        return "; ".join(f"{k}: {_flatten(v)}" for k, v in value.items())
+    return str(value)
+
+
+def _truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(" ", 1)[0]
+    return cut + "…"
+
+
+def compact_requirements(requirements: Dict[str, Any], limits: Dict[str, int] | None = None) -> Dict[str, Any]:
+    """
+    Flatten each requirement field to one whitespace-normalized line, cap it, and
+    drop values that repeat an earlier field word for word
+    """
+    limits = limits or FIELD_LIMITS
+    seen = set()
+    compact: Dict[str, Any] = {}
+    for section, fields in requirements.items():
+        if not isinstance(fields, dict):
+            fields = {section: fields}
+        out = {}
+        for name, value in fields.items():
+            text = _flatten(value)
+            if not text or text.lower() in ("not specified", "none", "n/a"):
+                continue
+            if text in seen:
+                continue
+            seen.add(text)
+            out[name] = _truncate(text, limits.get(name, DEFAULT_FIELD_LIMIT))
+        if out:
+            compact[section] = out
+    return compact
+
+
+def build_development_context(prompt: str, requirements: Dict[str, Any],
+                              token_budget: int = DEVELOPMENT_CONTEXT_TOKENS) -> str:
+    """
+    Build the development-stage input: the original request plus the amplified
+    requirements as compact JSON, shrunk field by field until it fits token_budget
+    """
+    prompt_text = _truncate(" ".join(prompt.split()), PROMPT_CHAR_LIMIT)
+    limits = dict(FIELD_LIMITS)
+
+    while True:
+        compact = compact_requirements(requirements, limits)
+        context = (
+            f"ORIGINAL REQUEST:\n{prompt_text}\n\n"
+            f"REQUIREMENTS:\n{json.dumps(compact, separators=(',', ':'), ensure_ascii=False)}\n\n"
+            "Create the complete web project for this request."
+        )
+        over = estimate_tokens(context) - token_budget
+        if over <= 0:
+            return context
+        # Take the overflow from the lowest-priority field that can still give something up
+        for name in reversed(list(limits)):
+            if limits[name] > MIN_FIELD_CHARS:
+                limits[name] = max(MIN_FIELD_CHARS, limits[name] - over * 4)
+                break
+        else:
+            logger.warning(f"Development context still ~{over} tokens over budget at minimum field sizes")
+            return context
+
+
+def log_stage_tokens(stage: str, sent_text: str, response: Any = None) -> Dict[str, int]:
+    """Log estimated input tokens for a stage and, when available, the API's own usage counts"""
+    counts = {"estimated_input_tokens": estimate_tokens(sent_text)}
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        counts["prompt_tokens"] = getattr(usage, "prompt_token_count", None) or 0
+        counts["cached_tokens"] = getattr(usage, "cached_content_token_count", None) or 0
+        counts["output_tokens"] = getattr(usage, "candidates_token_count", None) or 0
+    logger.info(f"{stage} tokens: {counts}")
+    return counts
@@ -0,0 +1,156 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+from tracing import span
+
+
+logger = logging.getLogger(__name__)
+
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "0") == "1"
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+# Extend a cache this long before it expires so in-flight requests never hit a dead handle
+REFRESH_MARGIN = int(os.getenv("GEMINI_CONTEXT_CACHE_REFRESH_MARGIN", "300"))
+# After the API refuses to cache (e.g. instruction below the minimum token count) don't ask again for a while
+UNAVAILABLE_BACKOFF = int(os.getenv("GEMINI_CONTEXT_CACHE_BACKOFF", "600"))
+
+
+def _is_cache_gone(error: Exception) -> bool:
+    """Whether a cached generate failed because the cache itself expired or was evicted"""
+    text = str(error).lower()
+    return getattr(error, "code", None) == 404 or (
+        "cache" in text and any(hint in text for hint in ("not found", "expired", "permission denied", "does not exist"))
+    )
+
+
+class InstructionCache:
+    """
+    Registers static system instructions as Gemini cached content and reuses the handle
+
+    generate() sends cached_content instead of the full system_instruction when a
+    cache is available, refreshes the TTL shortly before expiry, and falls back to
+    a plain request whenever caching is unavailable or the cache has disappeared.
+    """
+
+    def __init__(self, enabled: bool = GEMINI_CONTEXT_CACHE, ttl: int = GEMINI_CONTEXT_CACHE_TTL):
+        self.enabled = enabled
+        self.ttl = ttl
+        self._handles: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._unavailable_until: Dict[Tuple[str, str], float] = {}
+        self._key_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "creates": 0, "refreshes": 0, "fallbacks": 0}
+
+    @staticmethod
+    def _key(model: str, system_instruction: str) -> Tuple[str, str]:
+        return model, hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()[:16]
+
+    def _key_lock(self, key: Tuple[str, str]) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _discard(self, client, key: Tuple[str, str], name: str) -> None:
+        """Forget a handle (unless it was already replaced) and delete it server-side so it stops billing storage"""
+        with self._lock:
+            if self._handles.get(key, {}).get("name") == name:
+                del self._handles[key]
+        try:
+            with span("gemini caches.delete"):
+                client.caches.delete(name=name)
+        except Exception as e:
+            logger.debug(f"Could not delete cached content {name}: {str(e)}")
+
+    def _handle(self, client, model: str, system_instruction: str) -> Optional[str]:
+        """Return a live cache name for this instruction, creating or refreshing it if needed"""
+        from google.genai import types
+        key = self._key(model, system_instruction)
+        with self._lock:
+            if time.time() < self._unavailable_until.get(key, 0):
+                return None
+            handle = self._handles.get(key)
+            if handle and time.time() < handle["expires_at"] - REFRESH_MARGIN:
+                return handle["name"]
+
+        # Creating or refreshing is a network call: one caller per instruction makes it,
+        # concurrent callers for the same instruction wait and reuse its result
+        with self._key_lock(key):
+            with self._lock:
+                if time.time() < self._unavailable_until.get(key, 0):
+                    return None
+                handle = self._handles.get(key)
+            now = time.time()
+            if handle and now < handle["expires_at"] - REFRESH_MARGIN:
+                return handle["name"]
+            try:
+                if handle and now < handle["expires_at"]:
+                    with span("gemini caches.update", model=model):
+                        client.caches.update(
+                            name=handle["name"],
+                            config=types.UpdateCachedContentConfig(ttl=f"{self.ttl}s"),
+                        )
+                    with self._lock:
+                        handle["expires_at"] = now + self.ttl
+                        self.stats["refreshes"] += 1
+                    return handle["name"]
+                with span("gemini caches.create", model=model):
+                    cached = client.caches.create(
+                        model=model,
+                        config=types.CreateCachedContentConfig(
+                            system_instruction=system_instruction,
+                            display_name=f"autogenx-{key[1]}",
+                            ttl=f"{self.ttl}s",
+                        ),
+                    )
+                with self._lock:
+                    self._handles[key] = {"name": cached.name, "expires_at": now + self.ttl}
+                    self.stats["creates"] += 1
+                logger.info(f"Registered cached system instruction {cached.name} for {model}")
+                return cached.name
+            except Exception as e:
+                logger.warning(f"Context caching unavailable for {model}, sending instruction inline: {str(e)}")
+                with self._lock:
+                    self._unavailable_until[key] = now + UNAVAILABLE_BACKOFF
+                if handle:
+                    self._discard(client, key, handle["name"])
+                return None
+
+    def generate(self, client, model: str, system_instruction: str, contents, **config_kwargs):
+        """client.models.generate_content with the system instruction served from cache when possible"""
+        from google.genai import types
+        if self.enabled:
+            name = self._handle(client, model, system_instruction)
+            if name:
+                try:
+                    with span("gemini generate_content", model=model, cached=True):
+                        response = client.models.generate_content(
+                            model=model,
+                            config=types.GenerateContentConfig(cached_content=name, **config_kwargs),
+                            contents=contents,
+                        )
+                    self.stats["hits"] += 1
+                    return response
+                except Exception as e:
+                    # Quota, server and request errors aren't about the cache; let the router handle them
+                    if not _is_cache_gone(e):
+                        raise
+                    logger.warning(f"Cached content {name} is gone, retrying without cache: {str(e)}")
+                    self._discard(client, self._key(model, system_instruction), name)
+            self.stats["fallbacks"] += 1
+
+        with span("gemini generate_content", model=model, cached=False) as s:
+            response = client.models.generate_content(
+                model=model,
+                config=types.GenerateContentConfig(system_instruction=system_instruction, **config_kwargs),
+                contents=contents,
+            )
+            usage = getattr(response, "usage_metadata", None)
+            if usage is not None:
+                s.set("prompt_tokens", usage.prompt_token_count)
+                s.set("output_tokens", usage.candidates_token_count)
+            return response
+
+
+instruction_cache = InstructionCache()
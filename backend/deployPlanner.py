@@ -0,0 +1,185 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Tuple
+
+from logConfig import with_context
+from siteBuilder import is_precompressed_variant
+from blobStore import blob_store
+from githubHandler import (
+    create_github_repo,
+    enable_github_pages,
+    list_repo_files,
+    put_repo_file,
+    delete_repo_file,
+)
+
+logger = logging.getLogger(__name__)
+
+# How long a remembered repo/Pages status is trusted before we ask GitHub again
+DEPLOY_STATE_TTL = int(os.getenv("DEPLOY_STATE_TTL", "600"))
+DEPLOY_WORKERS = int(os.getenv("DEPLOY_WORKERS", "4"))
+
+
+def collect_local_files(project_path: str) -> Dict[str, str]:
+    """Map repo-relative paths (forward slashes) to local file paths"""
+    files = {}
+    for root, _, names in os.walk(project_path):
+        for name in names:
+            full = os.path.join(root, name)
+            # Pages compresses on its own; the .gz/.br variants are only for local preview
+            if is_precompressed_variant(full):
+                continue
+            files[os.path.relpath(full, project_path).replace("\\", "/")] = full
+    return files
+
+
+class DeployPlanner:
+    """
+    Plans and runs GitHub deploys, remembering what it learned about each repo
+
+    After a successful deploy the planner knows the repo exists and Pages is on,
+    so a redeploy within DEPLOY_STATE_TTL skips the existence check and the Pages
+    call. The remote file listing is always fetched (one recursive tree call),
+    since another worker or an out-of-band push may have changed the repo. Files
+    are updated in place, only paths that disappeared are deleted, and files whose
+    git blob sha matches the remote one are not uploaded at all. Independent calls
+    run concurrently.
+    """
+
+    def __init__(self, ttl: int = DEPLOY_STATE_TTL, workers: int = DEPLOY_WORKERS):
+        self.ttl = ttl
+        self.workers = max(1, workers)
+        self._states: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._repo_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            state = self._states.get(key)
+            if state and time.time() - state["checked_at"] <= self.ttl:
+                return state
+            self._states.pop(key, None)
+            return None
+
+    def _repo_lock(self, key: Tuple[str, str]) -> threading.Lock:
+        with self._lock:
+            return self._repo_locks.setdefault(key, threading.Lock())
+
+    def forget(self, username: str, repo_name: str) -> None:
+        with self._lock:
+            self._states.pop((username, repo_name), None)
+
+    def plan(self, project_path: str, username: str, repo_name: str,
+             remote_files: Dict[str, str] | None = None) -> Dict[str, Any]:
+        """Describe the calls a deploy would make without touching GitHub"""
+        state = self._state((username, repo_name))
+        local = collect_local_files(project_path)
+        unchanged = [p for p, full in local.items() if remote_files and remote_files.get(p) == blob_store.sha_of(full)]
+
+        plan = {
+            "repo": f"{username}/{repo_name}",
+            "repo_check": "cached" if state else "request",
+            "listing": "request",
+            "pages": "cached" if state and state["pages_enabled"] else "request",
+            "uploads": len(local) - len(unchanged),
+            "updates": sum(1 for p in local if remote_files and p in remote_files) - len(unchanged),
+            "unchanged": len(unchanged),
+            "deletes": len([p for p in (remote_files or {}) if p not in local]) if remote_files is not None else None,
+            "workers": self.workers,
+        }
+        calls = {
+            "repo_check": 0 if state else 1,
+            "listing": 1,
+            "pages": 0 if plan["pages"] == "cached" else 1,
+            "uploads": plan["uploads"],
+            "deletes": plan["deletes"] or 0,
+        }
+        calls["total"] = sum(calls.values())
+        plan["expected_calls"] = calls
+        return plan
+
+    def deploy(self, project_path: str, github_token: str, username: str, repo_name: str) -> Dict[str, Any]:
+        """
+        Deploy project_path to username/repo_name and enable Pages
+
+        Returns:
+            Dict with success, website_url and the executed plan. A failed delete
+            fails the deploy and is listed in plan["failed_deletes"].
+        """
+        key = (username, repo_name)
+        if not os.path.isdir(project_path):
+            logger.error(f"Directory {project_path} does not exist")
+            return {"success": False, "website_url": None, "plan": None}
+
+        # Deploys to the same repo must not interleave their commits
+        with self._repo_lock(key):
+            started = time.perf_counter()
+            state = self._state(key)
+            local = collect_local_files(project_path)
+
+            if not state and not create_github_repo(github_token, username, repo_name):
+                return {"success": False, "website_url": None, "plan": self.plan(project_path, username, repo_name)}
+
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                # Pages only needs the default branch, so it can go out alongside the listing and uploads
+                pages_future = None
+                if not (state and state["pages_enabled"]):
+                    pages_future = pool.submit(with_context(enable_github_pages), github_token, username, repo_name)
+
+                remote_files = list_repo_files(github_token, username, repo_name)
+                if remote_files is None:
+                    self.forget(username, repo_name)
+                    return {"success": False, "website_url": None, "plan": self.plan(project_path, username, repo_name)}
+
+                plan = self.plan(project_path, username, repo_name, remote_files=remote_files)
+                # GitHub's file sha is the git blob sha, so identical content needs no upload
+                unchanged = {path: remote_files[path] for path, full in local.items()
+                             if remote_files.get(path) == blob_store.sha_of(full)}
+                upload_futures = {
+                    path: pool.submit(with_context(put_repo_file), full, path, github_token, username, repo_name, remote_files.get(path))
+                    for path, full in local.items() if path not in unchanged
+                }
+                delete_futures = {
+                    path: pool.submit(with_context(delete_repo_file), github_token, username, repo_name, path, sha)
+                    for path, sha in remote_files.items() if path not in local
+                }
+
+                new_files = dict(unchanged, **{path: future.result() for path, future in upload_futures.items()})
+                failed_deletes = [path for path, future in delete_futures.items() if not future.result()]
+                pages_result = pages_future.result() if pages_future else f"https://{username}.github.io/{repo_name}/"
+
+            failed_uploads = [path for path, sha in new_files.items() if sha is None]
+            for path in failed_uploads:
+                logger.error(f"Failed to upload {path}")
+            for path in failed_deletes:
+                logger.error(f"Failed to delete {path}")
+
+            if failed_uploads or failed_deletes:
+                # Remote state is uncertain now; re-check everything next time
+                self.forget(username, repo_name)
+            else:
+                with self._lock:
+                    self._states[key] = {
+                        "checked_at": time.time(),
+                        "pages_enabled": bool(pages_result),
+                    }
+
+            plan["failed_uploads"] = failed_uploads
+            plan["failed_deletes"] = failed_deletes
+            # Nothing was committed, so GitHub won't start a new Pages build for this deploy
+            plan["no_changes"] = not upload_futures and not delete_futures and pages_future is None
+            plan["seconds"] = round(time.perf_counter() - started, 4)
+            if pages_result:
+                website_url = pages_result
+            else:
+                logger.warning("Files uploaded but GitHub Pages setup failed")
+                website_url = f"https://github.com/{username}/{repo_name}"
+            # Matches the old behaviour: individual upload failures are logged, not fatal.
+            # A file that should be gone but is still served is, so failed deletes fail the deploy.
+            return {"success": not failed_deletes, "website_url": website_url, "plan": plan}
+
+
+deploy_planner = DeployPlanner()
@@ -0,0 +1,252 @@
+"""
+Deploy backend that pushes the project as one git commit
+
+The contents API costs one HTTP request per file; this backend writes the
+project into a throwaway git directory (blobs, tree, commit) and pushes it with
+a single `git push`, so a deploy is one exchange with the remote whatever the
+file count. Any git remote works: GitHub, another host, or a local bare
+repository for testing:
+
+    DEPLOY_BACKEND=git GIT_DEPLOY_REMOTE=/tmp/remotes/{repo_name}.git
+
+For github.com remotes the repo is still created and Pages enabled through the
+REST API, once per repo (remembered for DEPLOY_STATE_TTL).
+"""
+import os
+import re
+import time
+import base64
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+from typing import Dict, Any, List, Optional, Tuple
+
+from tracing import span
+from deployPlanner import collect_local_files, DEPLOY_STATE_TTL
+from githubHandler import create_github_repo, enable_github_pages
+
+logger = logging.getLogger(__name__)
+
+# {username} and {repo_name} are filled in per deploy; the token never goes into the URL
+GIT_DEPLOY_REMOTE = os.getenv("GIT_DEPLOY_REMOTE", "https://github.com/{username}/{repo_name}.git")
+GIT_DEPLOY_BRANCH = os.getenv("GIT_DEPLOY_BRANCH", "main")
+# Public URL of the deployed site; defaults to the Pages URL for github.com remotes
+GIT_DEPLOY_SITE_URL = os.getenv("GIT_DEPLOY_SITE_URL", "")
+# 1 = fetch the branch tip first and fast-forward it (one extra round trip);
+# 0 = push a fresh root commit with --force, replacing the branch history
+GIT_DEPLOY_KEEP_HISTORY = os.getenv("GIT_DEPLOY_KEEP_HISTORY", "1") == "1"
+GIT_DEPLOY_TIMEOUT = int(os.getenv("GIT_DEPLOY_TIMEOUT", "120"))
+
+_COMMIT_ENV = {
+    "GIT_AUTHOR_NAME": os.getenv("GIT_AUTHOR_NAME", "AutoGenx"),
+    "GIT_AUTHOR_EMAIL": os.getenv("GIT_AUTHOR_EMAIL", "autogenx@users.noreply.github.com"),
+    "GIT_COMMITTER_NAME": os.getenv("GIT_COMMITTER_NAME", os.getenv("GIT_AUTHOR_NAME", "AutoGenx")),
+    "GIT_COMMITTER_EMAIL": os.getenv("GIT_COMMITTER_EMAIL", os.getenv("GIT_AUTHOR_EMAIL", "autogenx@users.noreply.github.com")),
+    # Never stop for a credential prompt on a server
+    "GIT_TERMINAL_PROMPT": "0",
+}
+
+
+class GitDeployError(Exception):
+    pass
+
+
+def _redact(text: str) -> str:
+    """Strip credentials from URLs before they reach logs or results"""
+    return re.sub(r"(://)[^/@\s]+@", r"\1***@", text)
+
+
+def _auth_env(github_token: str | None, remote: str) -> Dict[str, str]:
+    """
+    Git config that sends the token as an HTTP Authorization header
+
+    Passed through the environment rather than argv or the remote URL, so it
+    doesn't show up in ps or /proc/<pid>/cmdline and never reaches git's error output.
+    """
+    if not github_token or not remote.startswith(("https://", "http://")):
+        return {}
+    credentials = base64.b64encode(f"x-access-token:{github_token}".encode("utf-8")).decode("ascii")
+    return {
+        "GIT_CONFIG_COUNT": "1",
+        "GIT_CONFIG_KEY_0": "http.extraHeader",
+        "GIT_CONFIG_VALUE_0": f"Authorization: Basic {credentials}",
+    }
+
+
+def _is_local_path(remote: str) -> bool:
+    return "://" not in remote and not re.match(r"^[\w.-]+@[\w.-]+:", remote)
+
+
+def _git(git_dir: str, *args: str, input: str | None = None, env: Dict[str, str] | None = None) -> str:
+    proc = subprocess.run(
+        ["git", f"--git-dir={git_dir}", *args],
+        input=input, capture_output=True, text=True, timeout=GIT_DEPLOY_TIMEOUT,
+        env={**os.environ, **_COMMIT_ENV, **(env or {})},
+    )
+    if proc.returncode != 0:
+        raise GitDeployError(_redact(f"git {args[0]} failed: {proc.stderr.strip()[:500]}"))
+    return proc.stdout
+
+
+def build_commit(project_path: str, git_dir: str, message: str, parent: str | None = None) -> Tuple[str, str, List[str]]:
+    """
+    Write project_path as blobs, one tree and one commit into git_dir
+
+    The number of git invocations does not depend on the file count: all blobs
+    are hashed by one hash-object call and staged by one update-index call.
+
+    Returns:
+        (commit sha, tree sha, repo-relative paths)
+    """
+    files = collect_local_files(project_path)
+    paths = sorted(files)
+    env = {"GIT_INDEX_FILE": os.path.join(git_dir, "deploy-index")}
+    shas = _git(git_dir, "hash-object", "-w", "--stdin-paths", "--no-filters",
+                input="".join(f"{files[p]}\n" for p in paths)).split()
+    _git(git_dir, "update-index", "--add", "--index-info",
+         input="".join(f"100644 {sha}\t{path}\n" for sha, path in zip(shas, paths)), env=env)
+    tree = _git(git_dir, "write-tree", env=env).strip()
+    commit = _git(git_dir, "commit-tree", tree, *(["-p", parent] if parent else []), "-m", message).strip()
+    return commit, tree, paths
+
+
+class GitDeployer:
+    """Builds one commit per deploy and pushes it; same result shape as DeployPlanner.deploy"""
+
+    def __init__(self, remote_template: str = GIT_DEPLOY_REMOTE, branch: str = GIT_DEPLOY_BRANCH,
+                 keep_history: bool = GIT_DEPLOY_KEEP_HISTORY, ttl: int = DEPLOY_STATE_TTL):
+        self.remote_template = remote_template
+        self.branch = branch
+        self.keep_history = keep_history
+        self.ttl = ttl
+        # (username, repo_name) -> time the GitHub repo and Pages were last confirmed
+        self._github_ready: Dict[Tuple[str, str], float] = {}
+        self._repo_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _repo_lock(self, key: Tuple[str, str]) -> threading.Lock:
+        with self._lock:
+            return self._repo_locks.setdefault(key, threading.Lock())
+
+    def remote_url(self, username: str, repo_name: str) -> str:
+        return self.remote_template.format(username=username, repo_name=repo_name)
+
+    def site_url(self, remote: str, username: str, repo_name: str) -> Optional[str]:
+        if GIT_DEPLOY_SITE_URL:
+            return GIT_DEPLOY_SITE_URL.format(username=username, repo_name=repo_name)
+        if "github.com" in remote:
+            return f"https://{username}.github.io/{repo_name}/"
+        return None
+
+    def _github_confirmed(self, key: Tuple[str, str]) -> bool:
+        """Whether the repo and Pages were set up by a deploy within the TTL"""
+        with self._lock:
+            return time.time() - self._github_ready.get(key, 0) <= self.ttl
+
+    def _parent(self, git_dir: str, remote: str, auth: Dict[str, str]) -> Optional[str]:
+        """Tip of the remote branch, or None when the branch doesn't exist yet"""
+        try:
+            _git(git_dir, "fetch", "--depth=1", "--no-tags", remote, self.branch, env=auth)
+        except GitDeployError as e:
+            if "couldn't find remote ref" in str(e):
+                return None
+            raise
+        return _git(git_dir, "rev-parse", "FETCH_HEAD").strip()
+
+    def deploy(self, project_path: str, github_token: str, username: str, repo_name: str) -> Dict[str, Any]:
+        """
+        Push project_path as a single commit to the configured remote
+
+        Returns:
+            Dict with success, website_url and the executed plan
+        """
+        if not os.path.isdir(project_path):
+            logger.error(f"Directory {project_path} does not exist")
+            return {"success": False, "website_url": None, "plan": None}
+        if shutil.which("git") is None:
+            logger.error("DEPLOY_BACKEND=git but no git executable is installed")
+            return {"success": False, "website_url": None, "plan": None}
+
+        key = (username, repo_name)
+        remote = self.remote_url(username, repo_name)
+        auth = _auth_env(github_token, remote)
+        is_github = "github.com" in remote
+        plan: Dict[str, Any] = {
+            "repo": f"{username}/{repo_name}",
+            "backend": "git",
+            "remote": _redact(remote),
+            "branch": self.branch,
+            "keep_history": self.keep_history,
+        }
+        calls = {"github_api": 0, "fetch": 0, "push": 0}
+
+        with self._repo_lock(key):
+            started = time.perf_counter()
+            git_dir = tempfile.mkdtemp(prefix="autogenx-deploy-")
+            try:
+                if _is_local_path(remote) and not os.path.exists(remote):
+                    subprocess.run(["git", "init", "-q", "--bare", "-b", self.branch, remote], check=True,
+                                   capture_output=True, timeout=GIT_DEPLOY_TIMEOUT)
+                    logger.info(f"Created local bare repository {remote}")
+
+                pages_result = None
+                github_ready = is_github and self._github_confirmed(key)
+                if is_github and not github_ready:
+                    calls["github_api"] += 1
+                    if not create_github_repo(github_token, username, repo_name):
+                        return {"success": False, "website_url": None, "plan": dict(plan, expected_calls=calls)}
+
+                _git(git_dir, "init", "-q", "--bare")
+                parent = None
+                if self.keep_history:
+                    calls["fetch"] = 1
+                    with span("git fetch", branch=self.branch):
+                        parent = self._parent(git_dir, remote, auth)
+
+                message = f"Deploy {os.path.basename(os.path.normpath(project_path))}"
+                commit, tree, paths = build_commit(project_path, git_dir, message, parent=parent)
+                plan.update(commit=commit, parent=parent, files=len(paths))
+
+                if parent and _git(git_dir, "rev-parse", f"{parent}^{{tree}}").strip() == tree:
+                    plan["no_changes"] = True
+                    logger.info(f"{username}/{repo_name} already has this content, nothing to push")
+                else:
+                    calls["push"] = 1
+                    push_args = ["push", "--quiet", remote, f"{commit}:refs/heads/{self.branch}"]
+                    if not self.keep_history:
+                        # Only an explicit opt-out of history may overwrite the branch; a fast-forward
+                        # that lost a race with another push fails instead of discarding that push
+                        push_args.insert(1, "--force")
+                    with span("git push", files=len(paths), force=not self.keep_history):
+                        _git(git_dir, *push_args, env=auth)
+
+                if github_ready:
+                    pages_result = self.site_url(remote, username, repo_name)
+                elif is_github:
+                    # Pages needs the branch to exist, so it is enabled after the first push
+                    calls["github_api"] += 1
+                    pages_result = enable_github_pages(github_token, username, repo_name)
+                    if pages_result:
+                        with self._lock:
+                            self._github_ready[key] = time.time()
+            except (GitDeployError, subprocess.SubprocessError, OSError) as e:
+                logger.error(f"Git deploy to {username}/{repo_name} failed: {_redact(str(e))}")
+                with self._lock:
+                    self._github_ready.pop(key, None)
+                plan["error"] = _redact(str(e))
+                return {"success": False, "website_url": None, "plan": dict(plan, expected_calls=calls)}
+            finally:
+                shutil.rmtree(git_dir, ignore_errors=True)
+
+            calls["total"] = sum(calls.values())
+            plan["expected_calls"] = calls
+            plan["seconds"] = round(time.perf_counter() - started, 4)
+            website_url = pages_result or self.site_url(remote, username, repo_name) or _redact(remote)
+            logger.info(f"Pushed {plan['files']} file(s) to {plan['remote']} in one commit",
+                        extra={"commit": plan["commit"], "seconds": plan["seconds"]})
+            return {"success": True, "website_url": website_url, "plan": plan}
+
+
+git_deployer = GitDeployer()
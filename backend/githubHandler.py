@@ -3,53 +3,35 @@ import base64
 import requests
 import logging
 import os
-logging.basicConfig(level=logging.INFO)
+import time
+import threading
+from typing import Dict, Optional
+
+from logConfig import VERBOSE
+from tracing import traced_session
 logger = logging.getLogger(__name__)
 
-def delete_repo_contents(github_token: str, username: str, repo_name: str, path: str = "") -> bool:
-    """Delete all contents of a GitHub repository recursively"""
-    try:
-        contents_url = f"https://api.github.com/repos/{username}/{repo_name}/contents/{path}"
-        headers = {
-            "Authorization": f"token {github_token}",
-            "Accept": "application/vnd.github.v3+json"
-        }
-        
-        response = requests.get(contents_url, headers=headers)
-        response.raise_for_status()
-        
-        contents = response.json()
-        
-        if not contents:
-            logger.info(f"Path {path} is empty")
-            return True
-            
-        if not isinstance(contents, list):
-            contents = [contents]
-            
-        for item in contents:
-            item_path = item['path']
-            
-            if item['type'] == 'dir':
-                if not delete_repo_contents(github_token, username, repo_name, item_path):
-                    return False
-            else:
-                delete_url = f"https://api.github.com/repos/{username}/{repo_name}/contents/{item_path}"
-                delete_data = {
-                    "message": f"Delete {item_path}",
-                    "sha": item['sha'],
-                    "branch": "main"
-                }
-                
-                delete_response = requests.delete(delete_url, json=delete_data, headers=headers)
-                delete_response.raise_for_status()
-                logger.info(f"Deleted {item_path}")
-            
-        return True
-        
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error deleting repository contents: {str(e)}")
-        return False
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+# "rest" uploads file by file through the contents API, "git" pushes one commit (see gitDeployer.py)
+DEPLOY_BACKEND = os.getenv("DEPLOY_BACKEND", "rest")
+
+# Concurrent commits to one branch race on the ref; GitHub answers 409 and we retry
+CONFLICT_RETRIES = 4
+
+_local = threading.local()
+
+def _session() -> requests.Session:
+    """Per-thread session so repeated GitHub calls reuse pooled keep-alive connections"""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = traced_session()
+    return session
+
+def _auth_headers(github_token: str) -> Dict[str, str]:
+    return {
+        "Authorization": f"token {github_token}",
+        "Accept": "application/vnd.github.v3+json"
+    }
 
 def create_github_repo(github_token: str, username: str, repo_name: str) -> bool:
     """Create GitHub repository if it doesn't exist"""
@@ -59,17 +41,17 @@ def create_github_repo(github_token: str, username: str, repo_name: str) -> bool
             "Accept": "application/vnd.github.v3+json"
         }
         
-        repo_url = f"https://api.github.com/repos/{username}/{repo_name}"
-        response = requests.get(repo_url, headers=headers)
+        repo_url = f"{GITHUB_API_URL}/repos/{username}/{repo_name}"
+        response = _session().get(repo_url, headers=headers)
         
         if response.status_code == 404:
-            create_url = "https://api.github.com/user/repos"
+            create_url = f"{GITHUB_API_URL}/user/repos"
             repo_data = {
                 "name": repo_name,
                 "private": False,
                 "auto_init": True
             }
-            response = requests.post(create_url, json=repo_data, headers=headers)
+            response = _session().post(create_url, json=repo_data, headers=headers)
             response.raise_for_status()
             logger.info(f"Created new repository: {repo_name}")
         else:
@@ -81,69 +63,99 @@ def create_github_repo(github_token: str, username: str, repo_name: str) -> bool
         logger.error(f"Error creating repository: {str(e)}")
         return False
 
-def handle_file_upload(local_file_path: str, repo_path: str, github_token: str, username: str, repo_name: str) -> bool:
-    """Upload a single file to the repository"""
+def list_repo_files(github_token: str, username: str, repo_name: str, branch: str = "main") -> Optional[Dict[str, str]]:
+    """Return {path: blob sha} for every file on branch using a single recursive tree call"""
+    try:
+        tree_url = f"{GITHUB_API_URL}/repos/{username}/{repo_name}/git/trees/{branch}"
+        response = _session().get(tree_url, params={"recursive": "1"}, headers=_auth_headers(github_token))
+        if response.status_code in (404, 409):
+            # Missing branch or empty repository
+            return {}
+        response.raise_for_status()
+        return {item["path"]: item["sha"] for item in response.json().get("tree", []) if item.get("type") == "blob"}
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Error listing repository files: {str(e)}")
+        return None
+
+def put_repo_file(local_file_path: str, repo_path: str, github_token: str, username: str, repo_name: str,
+                  sha: str | None = None) -> Optional[str]:
+    """Create or update one file; returns the new blob sha, or None on failure"""
+    content_url = f"{GITHUB_API_URL}/repos/{username}/{repo_name}/contents/{repo_path}"
     try:
-        content_url = f"https://api.github.com/repos/{username}/{repo_name}/contents/{repo_path}"
-        headers = {
-            "Authorization": f"token {github_token}",
-            "Accept": "application/vnd.github.v3+json"
-        }
-        
         with open(local_file_path, "rb") as file:
             file_content = base64.b64encode(file.read()).decode("utf-8")
-            
-        file_data = {
-            "message": f"Upload {repo_path}",
-            "content": file_content,
-            "branch": "main"
-        }
-        
-        response = requests.put(content_url, json=file_data, headers=headers)
-        response.raise_for_status()
-        
-        logger.info(f"✅ File '{repo_path}' uploaded successfully!")
-        return True
-        
+
+        for attempt in range(CONFLICT_RETRIES + 1):
+            file_data = {
+                "message": f"Upload {repo_path}",
+                "content": file_content,
+                "branch": "main"
+            }
+            if sha:
+                file_data["sha"] = sha
+            response = _session().put(content_url, json=file_data, headers=_auth_headers(github_token))
+            if response.status_code in (409, 422) and attempt < CONFLICT_RETRIES:
+                # Either the branch moved under us or our cached sha is stale; refresh and retry
+                current = _session().get(content_url, params={"ref": "main"}, headers=_auth_headers(github_token))
+                sha = current.json().get("sha") if current.status_code == 200 else None
+                time.sleep(0.2 * (attempt + 1))
+                continue
+            response.raise_for_status()
+            logger.info(f"Uploaded {repo_path}", extra=VERBOSE)
+            return response.json().get("content", {}).get("sha", "")
+        return None
+
     except Exception as e:
         logger.error(f"⚠️ Error uploading file {local_file_path}: {str(e)}")
-        return False
+        return None
 
-def host_multi_files(dir_name: str, github_token: str, username: str, repo_name: str, current_path: str = "") -> bool:
-    """Upload multiple files maintaining directory structure"""
+def delete_repo_file(github_token: str, username: str, repo_name: str, repo_path: str, sha: str) -> bool:
+    """Delete one file by path and blob sha"""
+    delete_url = f"{GITHUB_API_URL}/repos/{username}/{repo_name}/contents/{repo_path}"
     try:
-        if not current_path:
-            if not create_github_repo(github_token, username, repo_name):
-                return False
-            if not delete_repo_contents(github_token, username, repo_name):
-                return False
-            logger.info("Repository cleaned and ready for upload")
-        
-        if not os.path.exists(dir_name):
-            logger.error(f"Directory {dir_name} does not exist")
-            return False
-            
-        for item in os.listdir(dir_name):
-            full_path = os.path.join(dir_name, item)
-            repo_path = os.path.join(current_path, item).replace("\\", "/")
-            
-            if os.path.isfile(full_path):
-                if not handle_file_upload(full_path, repo_path, github_token, username, repo_name):
-                    logger.error(f"Failed to upload {repo_path}")
-            else:
-                if not host_multi_files(full_path, github_token, username, repo_name, repo_path):
-                    return False
-                
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error processing directory {dir_name}: {str(e)}")
+        for attempt in range(CONFLICT_RETRIES + 1):
+            delete_data = {
+                "message": f"Delete {repo_path}",
+                "sha": sha,
+                "branch": "main"
+            }
+            response = _session().delete(delete_url, json=delete_data, headers=_auth_headers(github_token))
+            if response.status_code == 404:
+                return True
+            if response.status_code == 409 and attempt < CONFLICT_RETRIES:
+                time.sleep(0.2 * (attempt + 1))
+                continue
+            response.raise_for_status()
+            logger.info(f"Deleted {repo_path}", extra=VERBOSE)
+            return True
         return False
 
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Error deleting {repo_path}: {str(e)}")
+        return False
+
+def get_pages_build_status(github_token: str, username: str, repo_name: str) -> Optional[Dict]:
+    """Return the latest Pages build ({status, created_at, error}), {} if none yet, None on error"""
+    try:
+        builds_url = f"{GITHUB_API_URL}/repos/{username}/{repo_name}/pages/builds/latest"
+        response = _session().get(builds_url, headers=_auth_headers(github_token))
+        if response.status_code == 404:
+            return {}
+        response.raise_for_status()
+        build = response.json()
+        return {
+            "status": build.get("status"),
+            "created_at": build.get("created_at"),
+            "error": (build.get("error") or {}).get("message"),
+        }
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Error fetching Pages build status: {str(e)}")
+        return None
+
 def enable_github_pages(github_token: str, username: str, repo_name: str) -> str:
     """Enable GitHub Pages for the repository"""
     try:
-        pages_api_url = f"https://api.github.com/repos/{username}/{repo_name}/pages"
+        pages_api_url = f"{GITHUB_API_URL}/repos/{username}/{repo_name}/pages"
         headers = {
             "Authorization": f"token {github_token}",
             "Accept": "application/vnd.github.v3+json"
@@ -156,15 +168,14 @@ def enable_github_pages(github_token: str, username: str, repo_name: str) -> str
             }
         }
         
-        response = requests.post(pages_api_url, json=pages_data, headers=headers)
+        response = _session().post(pages_api_url, json=pages_data, headers=headers)
         
         if response.status_code in [201, 204, 409]:
             website_url = f"https://{username}.github.io/{repo_name}/"
-            print(f"✅ GitHub Pages enabled for {repo_name}!")
-            print(f"🔗 Your website will be available soon at: {website_url}")
+            logger.info(f"GitHub Pages enabled for {repo_name}", extra={"website_url": website_url})
             return website_url
         else:
-            print(f"⚠️ Error enabling GitHub Pages: {response.json()}")
+            logger.warning(f"Error enabling GitHub Pages: {response.text}", extra={"status": response.status_code})
             return False
             
     except Exception as e:
@@ -173,29 +184,29 @@ def enable_github_pages(github_token: str, username: str, repo_name: str) -> str
 
 def deploy_to_github(project_path: str, github_token: str, username: str, repo_name: str) -> str:
     """Deploy project to GitHub and enable Pages"""
+    result = deploy_to_github_with_plan(project_path, github_token, username, repo_name)
+    return result["website_url"] if result["success"] else False
+
+def deploy_to_github_with_plan(project_path: str, github_token: str, username: str, repo_name: str) -> Dict:
+    """Deploy through the configured backend and return the site URL together with the executed plan"""
+    # Imported here because both backends build on the helpers in this module
+    if DEPLOY_BACKEND == "git":
+        from gitDeployer import git_deployer as deployer
+    else:
+        from deployPlanner import deploy_planner as deployer
     try:
-        print(f"\n🚀 Deploying project to GitHub...")
-        print(f"   Repository: {username}/{repo_name}")
-        print(f"   Local path: {project_path}")
+        logger.info(f"Deploying {project_path} to {username}/{repo_name}", extra={"backend": DEPLOY_BACKEND})
         
-        # Upload files
-        success = host_multi_files(project_path, github_token, username, repo_name)
+        result = deployer.deploy(project_path, github_token, username, repo_name)
         
-        if success:
-            print("✅ All files uploaded successfully!")
-            
-            # Enable GitHub Pages
-            website_url = enable_github_pages(github_token, username, repo_name)
-            
-            if website_url:
-                return website_url
-            else:
-                print("⚠️ Files uploaded but GitHub Pages setup failed")
-                return f"https://github.com/{username}/{repo_name}"
+        if result["success"]:
+            plan = result["plan"]
+            logger.info("Files uploaded", extra={"remote_calls": plan["expected_calls"]["total"],
+                                                 "seconds": plan["seconds"]})
         else:
-            print("⚠️ Some errors occurred during upload")
-            return False
+            logger.warning("Some errors occurred during upload")
+        return result
             
     except Exception as e:
         logger.error(f"Error in deploy_to_github: {str(e)}")
-        return False
+        return {"success": False, "website_url": None, "plan": None}
@@ -0,0 +1,23 @@
+# gunicorn settings for Render (picked up automatically from the working directory)
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+# Result cache, rate limits, batch runs and Pages tracking live in process memory,
+# so one worker with threads keeps them consistent; raise WEB_CONCURRENCY with care
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+# Two model calls plus a deploy can take well over gunicorn's default 30s
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "180"))
+# Import the app once in the master; forked workers share its memory copy-on-write
+preload_app = True
+
+
+def when_ready(server):
+    from backend import warm_up
+
+    warm_up()
+    # Keep the preloaded objects out of the collector so workers don't dirty shared pages
+    gc.freeze()
+    server.log.info("App preloaded and warmed up")
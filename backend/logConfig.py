@@ -0,0 +1,155 @@
+"""
+Process-wide logging: structured records, request ids and a non-blocking queue handler
+
+Modules only do `logger = logging.getLogger(__name__)`; entry points (app.py,
+batchRunner.main) call configure_logging() once. Records are put on a bounded
+queue and written by a background listener, so a slow stdout pipe never stalls
+a request thread; when the queue is full records are dropped and counted.
+
+Extra structure:
+    logger.info("Deployed", extra={"repo": name, "seconds": 1.2})   # fields in the JSON output
+    logger.info("Uploaded %s", path, extra=VERBOSE)                  # sampled at LOG_SAMPLE_RATE
+"""
+import os
+import sys
+import json
+import uuid
+import queue
+import atexit
+import random
+import logging
+import threading
+import contextvars
+import logging.handlers
+from typing import Dict, Any, Callable
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" for humans, "json" for log collectors
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Longer messages (e.g. a whole model response) are cut to this many characters
+LOG_MAX_CHARS = int(os.getenv("LOG_MAX_CHARS", "2000"))
+# Fraction of verbose per-file / per-call events that are kept
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+
+VERBOSE = {"sample_rate": LOG_SAMPLE_RATE}
+
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_listener: logging.handlers.QueueListener | None = None
+_queue_handler: "DroppingQueueHandler | None" = None
+_lock = threading.Lock()
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def set_request_id(request_id: str | None = None) -> contextvars.Token:
+    """Tag every record logged from this context with request_id (a fresh one if None)"""
+    return request_id_var.set(request_id or new_request_id())
+
+
+def with_context(fn: Callable) -> Callable:
+    """Wrap fn to run in a copy of the current context, so pool threads keep the request id"""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+class ContextFilter(logging.Filter):
+    """Adds request_id and drops sampled-out verbose records"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        rate = getattr(record, "sample_rate", None)
+        return rate is None or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that truncates large messages and drops records instead of blocking when full"""
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        if len(record.msg) > LOG_MAX_CHARS:
+            record.msg = f"{record.msg[:LOG_MAX_CHARS]}… [{len(record.msg) - LOG_MAX_CHARS} chars truncated]"
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS and k != "sample_rate"})
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = {k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS and k != "sample_rate"}
+        return line + "".join(f" {k}={v}" for k, v in fields.items())
+
+
+def _start_listener() -> None:
+    global _listener
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, stream, respect_handler_level=False)
+    _listener.start()
+
+
+def _restart_after_fork() -> None:
+    # The listener thread doesn't survive fork (gunicorn preload); give the child its own queue and thread
+    if _queue_handler is not None:
+        _queue_handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+        _start_listener()
+
+
+def _stop() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+
+def configure_logging() -> None:
+    """Route the root logger through the queue handler; safe to call more than once"""
+    global _queue_handler
+    with _lock:
+        if _queue_handler is not None:
+            return
+        _queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        _queue_handler.addFilter(ContextFilter())
+        root = logging.getLogger()
+        root.handlers[:] = [_queue_handler]
+        root.setLevel(LOG_LEVEL)
+        # Per-request chatter from the HTTP clients would drown everything else
+        for noisy in ("httpx", "google_genai.models", "urllib3"):
+            logging.getLogger(noisy).setLevel(logging.WARNING)
+        _start_listener()
+        atexit.register(_stop)
+        os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "queued": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "dropped": DroppingQueueHandler.dropped,
+    }
@@ -1,24 +1,17 @@
-from google import genai
-from google.genai import types
 from typing import Dict, Any, Optional
 import json
 import logging
 import os
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
 
-def get_data_from_agent(prompt, img=None) -> Optional[Dict[str, Dict[str, str]]]:
-    """Fetch data from agent using amplification + unified development approach"""
-    try:
-        # Initialize client from environment variable to avoid hardcoding secrets
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            logger.error("Missing GOOGLE_API_KEY environment variable")
-            return None
-        client = genai.Client(api_key=api_key)
+from contextCache import instruction_cache
+from contextBuilder import build_development_context, log_stage_tokens
+from logConfig import LOG_MAX_CHARS
+from modelRouter import model_router
+from tracing import span
+logger = logging.getLogger(__name__)
 
-        # Step 1: Amplification prompt to extract detailed requirements
-        amplification_prompt = """
+# Step 1: Amplification prompt to extract detailed requirements
+AMPLIFICATION_PROMPT = """
 You are a senior web developer and UI/UX designer. Analyze the user's request and any uploaded images to create comprehensive web development requirements.
 
 If an image is uploaded: Replicate the exact design, layout, colors, typography, spacing, and visual elements shown in the image.
@@ -55,38 +48,9 @@ Instructions:
 - Focus on creating a complete, functional web experience
 
         """
-        if img:
-            my_file = client.files.upload(file=img)
-            amplification_response = client.models.generate_content(
-                model="gemini-2.0-flash",
-                config=types.GenerateContentConfig(
-                    system_instruction=amplification_prompt
-                ),
-                contents=[my_file,prompt]
-            )
-        else:
-            # Get comprehensive requirements analysis
-            amplification_response = client.models.generate_content(
-                model="gemini-2.0-flash",
-                config=types.GenerateContentConfig(
-                    system_instruction=amplification_prompt
-                ),
-                contents=prompt
-            )
-        
-        # Parse amplification response
-        try:
-            amplified_requirements = json.loads(amplification_response.text[7:-3])
-        except json.JSONDecodeError:
-            amplified_requirements = extract_json_from_response(amplification_response.text)
-        
-        print("📋 Amplified Requirements:")
-        print(f"Structural Demand: {amplified_requirements.get('structural_demand', 'Not specified')}")
-        print(f"styling_demand: {amplified_requirements.get('styling_demand', [])}")
-        print(f"scripting_demand: {amplified_requirements.get('scripting_demand', [])}")
-        
-        # Step 2: Unified development prompt with full context
-        unified_development_prompt = """
+
+# Step 2: Unified development prompt with full context
+UNIFIED_DEVELOPMENT_PROMPT = """
         You are a senior full-stack developer. Create a complete, production-ready web project based on the comprehensive requirements provided.
         
         IMPORTANT LINKING REQUIREMENTS:
@@ -123,41 +87,185 @@ Instructions:
         Create a fully functional, complete project that exceeds user expectations.
         """
 
-        # Combine original prompt with amplified requirements for full context
-        full_context = f"""
+# Follow-up edits: only the changes, never the whole project
+EDIT_PROMPT = """
+        You are a senior full-stack developer editing an existing web project. You receive every
+        project file and a change request. Change only what the request needs.
+
+        Return ONLY a JSON object with exactly this structure:
+        {
+            "patches": [
+                {"file": "relative/path/of/existing/file", "search": "exact text copied from the file", "replace": "new text"}
+            ],
+            "files": {
+                "relative/path/of/file": "complete new content"
+            }
+        }
+
+        RULES:
+        - Prefer patches. "search" must appear exactly once in the current file, so include enough surrounding lines to make it unique
+        - Use "files" only for new files or when most of a file changes
+        - Omit every file that does not change; keep HTML, CSS and JS references consistent
+        - Do not include any explanations or text outside the JSON.
+        """
+
+_clients: Dict[tuple, Any] = {}
+# Follow-up requests allowed when a response stops at the output token limit
+MAX_CONTINUATIONS = int(os.getenv("GEMINI_MAX_CONTINUATIONS", "3"))
+CONTINUE_PROMPT = (
+    "Your previous answer was cut off by the output limit. Continue exactly where it stopped, "
+    "without repeating anything and without any preamble or code fence."
+)
+
+
+def _get_client(api_key: str):
+    """Reuse one genai client (and its connection pool) per API key and base URL"""
+    # GOOGLE_GENAI_BASE_URL points the SDK at a proxy or a local stub (see benchmark.py)
+    base_url = os.getenv("GOOGLE_GENAI_BASE_URL")
+    key = (api_key, base_url)
+    if key not in _clients:
+        # The SDK takes most of the app's import time, so it is loaded on first use
+        from google import genai
+        from google.genai import types
+        http_options = types.HttpOptions(base_url=base_url) if base_url else None
+        _clients[key] = genai.Client(api_key=api_key, http_options=http_options)
+    return _clients[key]
+
+def _is_truncated(response) -> bool:
+    candidates = getattr(response, "candidates", None) or []
+    return bool(candidates) and candidates[0].finish_reason == "MAX_TOKENS"
+
+
+def _stitch(text: str, more: str) -> str:
+    """Append a continuation, dropping a code fence the model re-opened inside an open one"""
+    if text.count("```") % 2 == 1 and more.lstrip().startswith("```"):
+        more = more.lstrip().split("\n", 1)[1] if "\n" in more.lstrip() else ""
+    return text + more
+
+
+def _generate_text(client, system_instruction: str, contents, stage: str, **config_kwargs):
+    """
+    Generate on the stage's best model, failing over to the next one on errors
+
+    See _generate_on_model for how truncated answers are continued; the whole
+    exchange, continuations included, stays on one model.
+
+    Returns:
+        Tuple of the full text and the last response
+    """
+    return model_router.run(
+        stage, lambda model: _generate_on_model(client, model, system_instruction, contents, stage, **config_kwargs)
+    )
+
+
+def _generate_on_model(client, model: str, system_instruction: str, contents, stage: str, **config_kwargs):
+    """
+    Generate and, when the output hits the token limit, keep asking the model to continue
+
+    Continuations replay the conversation so far and are stitched onto the partial
+    text, so a long site completes instead of ending in the fallback page.
+
+    Returns:
+        Tuple of the full text and the last response
+    """
+    with span(f"model {stage}", model=model) as trace_span:
+        response = instruction_cache.generate(
+            client,
+            model=model,
+            system_instruction=system_instruction,
+            contents=contents,
+            **config_kwargs
+        )
+        text = response.text or ""
+        continuations = 0
+        from google.genai import types
+        # Continuations need the original turn as text; image requests are short enough not to need them
+        while _is_truncated(response) and isinstance(contents, str) and continuations < MAX_CONTINUATIONS:
+            continuations += 1
+            logger.info(f"{stage} output truncated at {len(text)} characters, requesting continuation {continuations}")
+            history = [
+                types.Content(role="user", parts=[types.Part.from_text(text=contents)]),
+                types.Content(role="model", parts=[types.Part.from_text(text=text)]),
+                types.Content(role="user", parts=[types.Part.from_text(text=CONTINUE_PROMPT)]),
+            ]
+            # JSON mode would make the model start a fresh object instead of finishing this one
+            response = instruction_cache.generate(
+                client,
+                model=model,
+                system_instruction=system_instruction,
+                contents=history,
+                **{k: v for k, v in config_kwargs.items() if k != "response_mime_type"}
+            )
+            text = _stitch(text, response.text or "")
+        if _is_truncated(response):
+            logger.warning(f"{stage} output still truncated after {continuations} continuation(s)")
+        trace_span.set("continuations", continuations)
+        trace_span.set("output_chars", len(text))
+        return text, response
+
+
+def get_data_from_agent(prompt, img=None) -> Optional[Dict[str, Dict[str, str]]]:
+    """Fetch data from agent using amplification + unified development approach"""
+    try:
+        # Initialize client from environment variable to avoid hardcoding secrets
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            logger.error("Missing GOOGLE_API_KEY environment variable")
+            return None
+        client = _get_client(api_key)
+
+        if img:
+            with span("gemini files.upload"):
+                my_file = client.files.upload(file=img)
+            amplification_text, amplification_response = _generate_text(
+                client, AMPLIFICATION_PROMPT, [my_file, prompt], "amplification"
+            )
+        else:
+            # Get comprehensive requirements analysis
+            amplification_text, amplification_response = _generate_text(
+                client, AMPLIFICATION_PROMPT, prompt, "amplification"
+            )
+        
+        # Parse amplification response
+        try:
+            amplified_requirements = json.loads(amplification_text[7:-3])
+        except json.JSONDecodeError:
+            amplified_requirements = extract_json_from_response(amplification_text)
         
-        AMPLIFIED REQUIREMENTS AND ANALYSIS:
-        {json.dumps(amplified_requirements, indent=2)}
+        logger.info("Amplified requirements ready", extra={"sections": list(amplified_requirements)})
+        logger.debug(f"Amplified requirements: {json.dumps(amplified_requirements)}")
         
-        Based on both the original request and the detailed analysis above, create a complete web project.
-        """
+        log_stage_tokens("amplification", prompt, amplification_response)
+
+        # Original prompt plus the amplified requirements, compacted to the development token budget
+        full_context = build_development_context(prompt, amplified_requirements)
 
         # Get the complete project files
-        development_response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            config=types.GenerateContentConfig(
-                system_instruction=unified_development_prompt
-            ),
-            contents=full_context
+        development_text, development_response = _generate_text(
+            client, UNIFIED_DEVELOPMENT_PROMPT, full_context, "development"
         )
+        log_stage_tokens("development", full_context, development_response)
 
         # Parse the development response
         try:
-            result = json.loads(development_response.text[7:-3])
+            result = json.loads(development_text[7:-3])
         except Exception as e:
-            print(e)
-            print(development_response.text)
-            result = extract_json_from_response(development_response.text)
+            # The handler truncates the response text, so this stays cheap for huge answers
+            # Only a bounded slice: the full response can run to hundreds of KB
+            logger.warning(f"Development response is not fenced JSON ({e}); extracting from: "
+                           f"{development_text[:LOG_MAX_CHARS]}",
+                           extra={"response_chars": len(development_text)})
+            result = extract_json_from_response(development_text)
         
         # Validate the structure
         if not validate_agent_response(result):
             logger.error("Invalid response structure from development agent")
             return None
             
-        print("\n🔧 Development Agent Response:")
-        for file_type, file_info in result.items():
-            print(f"{file_type.upper()}: {file_info.get('fileDir', 'No path')}")
-            print(f"Content length: {len(file_info.get('content', ''))} characters")
+        logger.info("Development files ready", extra={"files": {
+            file_type: f"{file_info.get('fileDir', 'No path')} ({len(file_info.get('content', ''))} chars)"
+            for file_type, file_info in result.items()
+        }})
 
         # Return both amplified requirements and files for reference
         return {
@@ -170,6 +278,45 @@ Instructions:
         return None
 
 
+def get_edit_from_agent(change_request: str, files: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """
+    Ask the model for targeted changes to an existing project
+
+    Args:
+        change_request: The user's follow-up instruction
+        files: Current project files, relative path -> content
+
+    Returns:
+        Dict with "patches" (file/search/replace) and "files" (path -> full content), or None
+    """
+    try:
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            logger.error("Missing GOOGLE_API_KEY environment variable")
+            return None
+        client = _get_client(api_key)
+
+        listing = "\n\n".join(f"=== {path} ===\n{content}" for path, content in sorted(files.items()))
+        contents = f"CHANGE REQUEST:\n{change_request.strip()}\n\nCURRENT FILES:\n{listing}"
+        text, response = _generate_text(
+            client, EDIT_PROMPT, contents, "edit", response_mime_type="application/json"
+        )
+        log_stage_tokens("edit", contents, response)
+
+        text = text.strip()
+        if text.startswith("```"):
+            text = text.split("\n", 1)[1].rsplit("```", 1)[0]
+        edit = json.loads(text)
+        if not isinstance(edit, dict):
+            logger.error("Invalid response structure from edit agent")
+            return None
+        return {"patches": edit.get("patches") or [], "files": edit.get("files") or {}}
+
+    except Exception as e:
+        logger.error(f"Error in get_edit_from_agent: {str(e)}")
+        return None
+
+
 def validate_agent_response(response: Dict) -> bool:
     """Validate that the agent response has the correct structure"""
     required_keys = ['html', 'css', 'js']
@@ -280,6 +427,12 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
 
+def is_fallback_structure(files: Dict[str, Dict[str, str]]) -> bool:
+    """True when files came from create_fallback_structure rather than the model"""
+    fallback = create_fallback_structure("")
+    return all((files.get(key) or {}).get("content") == fallback[key]["content"] for key in ("css", "js"))
+
+
 def extract_json_from_response(response_text: str) -> Dict[str, Dict[str, str]]:
     """Extract JSON from response that might contain extra text"""
     try:
@@ -0,0 +1,183 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, List, Callable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+# Ordered preference per stage, comma separated. Later models are fallbacks, or take over
+# when the earlier ones are measurably slower or failing
+STAGE_MODELS = {
+    # Amplification only restructures the prompt, so the cheaper, faster model goes first
+    "amplification": os.getenv("GEMINI_MODELS_AMPLIFICATION", f"gemini-2.0-flash-lite,{DEFAULT_MODEL}"),
+    "development": os.getenv("GEMINI_MODELS_DEVELOPMENT", f"{DEFAULT_MODEL},gemini-2.5-flash"),
+    "edit": os.getenv("GEMINI_MODELS_EDIT", f"{DEFAULT_MODEL},gemini-2.5-flash"),
+}
+
+ROUTER_WINDOW = int(os.getenv("MODEL_ROUTER_WINDOW", "50"))
+ROUTER_WINDOW_SECONDS = int(os.getenv("MODEL_ROUTER_WINDOW_SECONDS", "600"))
+# Samples a model needs before its latency/error stats can reorder the list
+MIN_SAMPLES = int(os.getenv("MODEL_ROUTER_MIN_SAMPLES", "5"))
+# A model is moved behind the others when its expected cost is this many times the best one
+DEMOTE_FACTOR = float(os.getenv("MODEL_ROUTER_DEMOTE_FACTOR", "1.5"))
+QUOTA_COOLDOWN = int(os.getenv("MODEL_ROUTER_QUOTA_COOLDOWN", "60"))
+ERROR_COOLDOWN = int(os.getenv("MODEL_ROUTER_ERROR_COOLDOWN", "30"))
+MAX_CONSECUTIVE_ERRORS = 3
+
+
+def _is_quota_error(error: Exception) -> bool:
+    code = getattr(error, "code", None)
+    text = str(error)
+    return code == 429 or "RESOURCE_EXHAUSTED" in text or "quota" in text.lower()
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Quota, server and transport errors may succeed on another model; a bad request fails on all of them"""
+    if _is_quota_error(error):
+        return True
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code >= 500 or code == 408
+    return isinstance(error, (TimeoutError, ConnectionError)) or any(
+        name in type(error).__name__ for name in ("Timeout", "ConnectError", "RemoteProtocolError")
+    )
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+
+class ModelStats:
+    """Sliding window of call outcomes for one model"""
+
+    def __init__(self, window: int = ROUTER_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+        self.last_error = None
+
+    def _recent(self):
+        cutoff = time.time() - ROUTER_WINDOW_SECONDS
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+        return self.samples
+
+    def record(self, ok: bool, seconds: float) -> None:
+        self.samples.append((time.time(), ok, seconds))
+
+    def expected_cost(self) -> float | None:
+        """Median successful latency divided by the success rate, or None without enough data"""
+        recent = self._recent()
+        if len(recent) < MIN_SAMPLES:
+            return None
+        successes = [seconds for _, ok, seconds in recent if ok]
+        if not successes:
+            return float("inf")
+        return _percentile(successes, 50) / (len(successes) / len(recent))
+
+    def snapshot(self) -> Dict[str, Any]:
+        recent = self._recent()
+        successes = [seconds for _, ok, seconds in recent if ok]
+        return {
+            "samples": len(recent),
+            "error_rate": round(1 - len(successes) / len(recent), 3) if recent else None,
+            "p50_ms": round(_percentile(successes, 50) * 1000, 1) if successes else None,
+            "p95_ms": round(_percentile(successes, 95) * 1000, 1) if successes else None,
+            "consecutive_errors": self.consecutive_errors,
+            "cooldown_seconds": max(0, round(self.cooldown_until - time.time(), 1)),
+            "last_error": self.last_error,
+        }
+
+
+class ModelRouter:
+    """
+    Picks the Gemini model for each stage and fails over between them
+
+    Each stage has an ordered model list. Models keep their configured order until
+    their sliding-window stats show them DEMOTE_FACTOR worse than another model;
+    a model that hits its quota or fails repeatedly sits out a cooldown and is only
+    tried as a last resort. A call that fails with a quota, server or timeout
+    error moves on to the next model.
+    """
+
+    def __init__(self, stage_models: Dict[str, str] = STAGE_MODELS):
+        self.stage_models = {
+            stage: [m.strip() for m in models.split(",") if m.strip()] or [DEFAULT_MODEL]
+            for stage, models in stage_models.items()
+        }
+        self._stats: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _model_stats(self, model: str) -> ModelStats:
+        return self._stats.setdefault(model, ModelStats())
+
+    def candidates(self, stage: str) -> List[str]:
+        """Models to try for a stage, best first"""
+        models = self.stage_models.get(stage) or [DEFAULT_MODEL]
+        now = time.time()
+        with self._lock:
+            costs = {m: self._model_stats(m).expected_cost() for m in models}
+            cooling = {m for m in models if self._model_stats(m).cooldown_until > now}
+            known = [c for m, c in costs.items() if c is not None and m not in cooling]
+            best = min(known) if known else None
+
+            def demoted(model):
+                cost = costs[model]
+                return best is not None and cost is not None and cost > best * DEMOTE_FACTOR
+
+            ready = sorted((m for m in models if m not in cooling), key=lambda m: (demoted(m), models.index(m)))
+            resting = sorted(cooling, key=lambda m: self._model_stats(m).cooldown_until)
+        return ready + resting
+
+    def run(self, stage: str, call: Callable[[str], T]) -> T:
+        """
+        Run call(model) on the best model for stage, failing over to the next on
+        quota, server and timeout errors; any other error is raised straight away
+        and doesn't count against the model
+        """
+        last_error: Exception | None = None
+        for model in self.candidates(stage):
+            started = time.perf_counter()
+            try:
+                result = call(model)
+            except Exception as e:
+                if not _is_retryable(e):
+                    raise
+                last_error = e
+                self._record_failure(model, e, time.perf_counter() - started)
+                logger.warning(f"{stage} call to {model} failed, trying next model: {str(e)[:200]}")
+                continue
+            with self._lock:
+                stats = self._model_stats(model)
+                stats.record(True, time.perf_counter() - started)
+                stats.consecutive_errors = 0
+            return result
+        raise last_error or RuntimeError(f"No models configured for {stage}")
+
+    def _record_failure(self, model: str, error: Exception, seconds: float) -> None:
+        with self._lock:
+            stats = self._model_stats(model)
+            stats.record(False, seconds)
+            stats.consecutive_errors += 1
+            stats.last_error = str(error)[:200]
+            if _is_quota_error(error):
+                stats.cooldown_until = time.time() + QUOTA_COOLDOWN
+            elif stats.consecutive_errors >= MAX_CONSECUTIVE_ERRORS:
+                stats.cooldown_until = time.time() + ERROR_COOLDOWN
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current routing order per stage and sliding-window stats per model"""
+        stages = {stage: self.candidates(stage) for stage in self.stage_models}
+        with self._lock:
+            models = {m: self._model_stats(m).snapshot() for order in self.stage_models.values() for m in order}
+        return {"stages": stages, "models": models}
+
+
+model_router = ModelRouter()
@@ -0,0 +1,183 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+from logConfig import with_context
+
+
+logger = logging.getLogger(__name__)
+
+PAGES_POLL_INITIAL = float(os.getenv("PAGES_POLL_INITIAL", "3"))
+PAGES_POLL_MAX = float(os.getenv("PAGES_POLL_MAX", "30"))
+PAGES_POLL_TIMEOUT = float(os.getenv("PAGES_POLL_TIMEOUT", "600"))
+# Long-poll requests allowed to block at once per worker; each one holds a request thread
+PAGES_MAX_WAITERS = int(os.getenv("PAGES_MAX_WAITERS", "4"))
+
+TERMINAL_STATUSES = ("built", "errored", "timeout")
+
+
+def _parse_time(value: str | None) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+class PagesWatcher:
+    """
+    Tracks GitHub Pages builds in the background, one poller thread per repo
+
+    Every deploy to a repo registers with the same watch, so however many
+    clients ask about a site, GitHub is polled once. Polling starts at
+    PAGES_POLL_INITIAL seconds and backs off by 1.5x up to PAGES_POLL_MAX while
+    the build status stays the same, resetting whenever it changes.
+    """
+
+    def __init__(self, initial: float = PAGES_POLL_INITIAL, maximum: float = PAGES_POLL_MAX,
+                 timeout: float = PAGES_POLL_TIMEOUT, max_waiters: int = PAGES_MAX_WAITERS):
+        self.initial = initial
+        self.maximum = maximum
+        self.timeout = timeout
+        self.max_waiters = max_waiters
+        self._waiters = 0
+        self._watches: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._cond = threading.Condition()
+
+    def _snapshot(self, watch: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "status": watch["status"],
+            "ready": watch["status"] == "built",
+            "pages_url": watch["pages_url"],
+            "error": watch["error"],
+            "polls": watch["polls"],
+            "checked_at": watch["checked_at"],
+            "version": watch["version"],
+        }
+
+    def watch(self, github_token: str, username: str, repo_name: str, pages_url: str,
+              since: float | None = None) -> Dict[str, Any]:
+        """
+        Start (or join) the poller for a repo; builds older than since (default now)
+        are ignored, so since=0 reports the latest build whatever its age
+        """
+        key = (username, repo_name)
+        since = since if since is not None else time.time()
+        with self._cond:
+            watch = self._watches.get(key)
+            if watch and watch["thread"] is not None:
+                # A newer deploy supersedes whatever the running poller was waiting for
+                watch.update(token=github_token, since=max(watch["since"], since), status="pending",
+                             error=None, deadline=time.time() + self.timeout, interval=self.initial, wake=True)
+                watch["version"] += 1
+                self._cond.notify_all()
+                return self._snapshot(watch)
+
+            watch = {
+                "token": github_token,
+                "pages_url": pages_url,
+                "since": since,
+                "status": "pending",
+                "error": None,
+                "polls": 0,
+                "checked_at": None,
+                "version": (watch["version"] + 1) if watch else 1,
+                "deadline": time.time() + self.timeout,
+                "interval": self.initial,
+                "wake": False,
+                "thread": None,
+            }
+            self._watches[key] = watch
+            watch["thread"] = threading.Thread(target=with_context(self._poll), args=(key,), daemon=True,
+                                               name=f"pages-watch-{username}/{repo_name}")
+            watch["thread"].start()
+            return self._snapshot(watch)
+
+    def status(self, username: str, repo_name: str) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            watch = self._watches.get((username, repo_name))
+            return self._snapshot(watch) if watch else None
+
+    def wait(self, username: str, repo_name: str, timeout: float, version: int | None = None) -> Optional[Dict[str, Any]]:
+        """
+        Block until the build reaches a terminal status, the status changes from
+        the one the caller last saw (by version), or timeout seconds pass
+
+        With max_waiters callers already blocked, answers immediately with the
+        current status so long-polls can't take every request thread.
+        """
+        deadline = time.time() + timeout
+        with self._cond:
+            if self._waiters >= self.max_waiters:
+                watch = self._watches.get((username, repo_name))
+                return self._snapshot(watch) if watch else None
+            self._waiters += 1
+            try:
+                while True:
+                    watch = self._watches.get((username, repo_name))
+                    if not watch:
+                        return None
+                    if watch["status"] in TERMINAL_STATUSES or (version is not None and watch["version"] != version):
+                        return self._snapshot(watch)
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return self._snapshot(watch)
+                    self._cond.wait(remaining)
+            finally:
+                self._waiters -= 1
+
+    def _poll(self, key: Tuple[str, str]) -> None:
+        # Imported here so loading the app doesn't pull in the HTTP stack
+        from githubHandler import get_pages_build_status
+        while True:
+            with self._cond:
+                watch = self._watches[key]
+                # The condition is shared by all repos, so re-check our own schedule on every wake-up;
+                # a new deploy to this repo sets "wake" to poll right away
+                next_poll = time.time() + watch["interval"]
+                while not watch["wake"] and time.time() < next_poll:
+                    self._cond.wait(next_poll - time.time())
+                watch["wake"] = False
+                if time.time() > watch["deadline"]:
+                    watch["status"] = "timeout"
+                    watch["version"] += 1
+                    watch["token"] = watch["thread"] = None
+                    self._cond.notify_all()
+                    return
+                token = watch["token"]
+
+            build = get_pages_build_status(token, key[0], key[1])
+
+            with self._cond:
+                watch["polls"] += 1
+                watch["checked_at"] = datetime.utcnow().isoformat() + "Z"
+                status = "pending"
+                if build:
+                    created = _parse_time(build.get("created_at"))
+                    # Read since now: a deploy registered while the request was in flight raises it,
+                    # and the build fetched before then must not count for the new deploy.
+                    # Allow a little clock skew between us and GitHub
+                    if created is None or created >= watch["since"] - 5:
+                        status = build.get("status") or "pending"
+
+                if status != watch["status"]:
+                    watch["status"] = status
+                    watch["error"] = build.get("error") if build else None
+                    watch["version"] += 1
+                    watch["interval"] = self.initial
+                    self._cond.notify_all()
+                else:
+                    watch["interval"] = min(self.maximum, watch["interval"] * 1.5)
+
+                if status in TERMINAL_STATUSES:
+                    # Nobody needs the token once the build has settled
+                    watch["token"] = watch["thread"] = None
+                    logger.info(f"Pages build for {key[0]}/{key[1]} finished: {status}")
+                    return
+
+
+pages_watcher = PagesWatcher()
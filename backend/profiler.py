@@ -0,0 +1,200 @@
+"""
+On-demand request profiling for running workers
+
+Off unless PROFILE_SAMPLE_RATE > 0 or an admin turns it on through
+/api/admin/profiling; while off the only cost per request is one float
+comparison. A sampled request is profiled in one of two modes:
+
+    sample    a background thread snapshots the request thread's stack every
+              PROFILE_INTERVAL_MS and counts identical stacks per route
+    cprofile  the request runs under cProfile and the stats are merged per route
+
+flush() writes per route, per worker process:
+
+    <route>.<pid>.collapsed   "frame;frame;frame count" lines (sample mode), the input
+                              format of flamegraph.pl, speedscope and inferno
+    <route>.<pid>.prof        pstats dump (cprofile mode), for snakeviz or flameprof
+"""
+import os
+import re
+import sys
+import time
+import random
+import cProfile
+import pstats
+import logging
+import threading
+from pathlib import Path
+from collections import Counter
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Admin endpoints are disabled unless this is set
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "profiles"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sample")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MODES = ("sample", "cprofile")
+# Stacks deeper than this are cut at the leaf end
+MAX_STACK_DEPTH = 128
+
+
+def _frame_label(code) -> str:
+    # ';' separates frames in the collapsed format
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _route_slug(route: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", route).strip("_") or "root"
+
+
+class RequestProfiler:
+    """Profiles a random fraction of requests and aggregates the results per route"""
+
+    def __init__(self, sample_rate: float = PROFILE_SAMPLE_RATE, mode: str = PROFILE_MODE,
+                 interval_ms: float = PROFILE_INTERVAL_MS):
+        self.sample_rate = 0.0
+        self.mode = "sample"
+        self.interval = PROFILE_INTERVAL_MS / 1000
+        self.configure(sample_rate=sample_rate, mode=mode, interval_ms=interval_ms)
+        self._stacks: Dict[str, Counter] = {}
+        self._stats: Dict[str, pstats.Stats] = {}
+        self._requests: Counter = Counter()
+        self._active: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def configure(self, sample_rate: float | None = None, mode: str | None = None,
+                  interval_ms: float | None = None) -> None:
+        if sample_rate is not None:
+            if not 0 <= sample_rate <= 1:
+                raise ValueError("sample_rate must be between 0 and 1")
+            self.sample_rate = sample_rate
+        if mode is not None:
+            if mode not in PROFILE_MODES:
+                raise ValueError(f"mode must be one of {', '.join(PROFILE_MODES)}")
+            self.mode = mode
+        if interval_ms is not None:
+            if interval_ms < 1:
+                raise ValueError("interval_ms must be at least 1")
+            self.interval = interval_ms / 1000
+
+    def start(self, route: str):
+        """Maybe start profiling the current request; returns a handle for stop(), or None"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        if self.mode == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler already owns this thread (or, on 3.12+, the process)
+                return None
+            return route, profile
+        with self._lock:
+            self._active[threading.get_ident()] = route
+            self._ensure_sampler()
+        self._wake.set()
+        return route, None
+
+    def stop(self, handle) -> None:
+        if handle is None:
+            return
+        route, profile = handle
+        if profile is not None:
+            profile.disable()
+            with self._lock:
+                if route in self._stats:
+                    self._stats[route].add(profile)
+                else:
+                    self._stats[route] = pstats.Stats(profile)
+                self._requests[route] += 1
+            return
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+            self._requests[route] += 1
+
+    def _ensure_sampler(self) -> None:
+        if self._sampler is None or not self._sampler.is_alive():
+            self._sampler = threading.Thread(target=self._sample_loop, name="request-profiler", daemon=True)
+            self._sampler.start()
+
+    def _sample_loop(self) -> None:
+        while True:
+            with self._lock:
+                active = dict(self._active)
+            if not active:
+                self._wake.clear()
+                self._wake.wait()
+                continue
+            frames = sys._current_frames()
+            samples = []
+            for thread_id, route in active.items():
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                if stack:
+                    samples.append((route, ";".join(reversed(stack))))
+            del frames
+            with self._lock:
+                for route, stack in samples:
+                    self._stacks.setdefault(route, Counter())[stack] += 1
+            time.sleep(self.interval)
+
+    def flush(self, reset: bool = False) -> List[str]:
+        """Write the aggregated profiles to PROFILE_DIR; returns the written paths"""
+        with self._lock:
+            stacks = {route: Counter(counts) for route, counts in self._stacks.items()}
+            stats = dict(self._stats)
+            if reset:
+                self._stacks, self._stats, self._requests = {}, {}, Counter()
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        written = []
+        for route, counts in stacks.items():
+            path = PROFILE_DIR / f"{_route_slug(route)}.{os.getpid()}.collapsed"
+            path.write_text("".join(f"{stack} {n}\n" for stack, n in counts.most_common()), encoding="utf-8")
+            written.append(str(path))
+        for route, route_stats in stats.items():
+            path = PROFILE_DIR / f"{_route_slug(route)}.{os.getpid()}.prof"
+            route_stats.dump_stats(str(path))
+            written.append(str(path))
+        logger.info(f"Wrote {len(written)} profile file(s) to {PROFILE_DIR}")
+        return written
+
+    def status(self, top: int = 10) -> Dict[str, Any]:
+        """Current settings, profiled requests per route and the hottest leaf functions"""
+        with self._lock:
+            routes = {}
+            for route in set(self._requests) | set(self._stacks) | set(self._stats):
+                leaves = Counter()
+                for stack, n in self._stacks.get(route, Counter()).items():
+                    leaves[stack.rsplit(";", 1)[-1]] += n
+                routes[route] = {
+                    "requests": self._requests[route],
+                    "samples": sum(leaves.values()),
+                    "top_frames": [{"frame": frame, "samples": n} for frame, n in leaves.most_common(top)],
+                }
+                if route in self._stats:
+                    # Own time per function: (file, line, name) -> (calls, total calls, own, cumulative, callers)
+                    by_own_time = sorted(self._stats[route].stats.items(), key=lambda kv: kv[1][2], reverse=True)
+                    routes[route]["top_functions"] = [
+                        {"function": f"{name} ({os.path.basename(file)}:{line})", "calls": nc,
+                         "own_ms": round(tt * 1000, 3), "cumulative_ms": round(ct * 1000, 3)}
+                        for (file, line, name), (_, nc, tt, ct, _) in by_own_time[:top]
+                    ]
+            return {
+                "pid": os.getpid(),
+                "sample_rate": self.sample_rate,
+                "mode": self.mode,
+                "interval_ms": self.interval * 1000,
+                "active": len(self._active),
+                "routes": routes,
+            }
+
+
+request_profiler = RequestProfiler()
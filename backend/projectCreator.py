@@ -4,7 +4,9 @@ import logging
 from pathlib import Path
 from typing import Dict, Any, Optional
 
-logging.basicConfig(level=logging.INFO)
+from logConfig import VERBOSE
+from blobStore import blob_store
+
 logger = logging.getLogger(__name__)
 
 def create_fallback_structure(response_text: str) -> Dict[str, Dict[str, str]]:
@@ -79,7 +81,7 @@ def create_project_structure(agent_result: Dict[str, Any], project_name: str = "
         bool: True if successful, False otherwise
     """
     try:
-        print(f'🚀 Creating project structure for: {project_name}')
+        logger.info(f"Creating project structure for {project_name}")
         
         # Create main project directory
         project_path = Path(project_name)
@@ -103,27 +105,20 @@ def create_project_structure(agent_result: Dict[str, Any], project_name: str = "
                 # Create parent directories if they don't exist
                 full_file_path.parent.mkdir(parents=True, exist_ok=True)
                 
-                # Write file content
-                with open(full_file_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
+                # Write file content (a link to the stored blob when the blob store is on)
+                blob_store.write_file(full_file_path, content)
                 
-                logger.info(f"Created {file_type} file: {full_file_path}")
+                logger.info(f"Created {file_type} file: {full_file_path}", extra=VERBOSE)
                 created_files.append(f"{file_type}: {file_dir}")
-                print(f"✅ Created {file_type.upper()}: {file_dir}")
             else:
                 logger.warning(f"Invalid file structure for {file_type}: {file_info}")
         
         # Create project documentation with amplified requirements
         if 'amplified_requirements' in agent_result:
             requirements_path = project_path / "PROJECT_REQUIREMENTS.md"
-            with open(requirements_path, 'w', encoding='utf-8') as f:
-                f.write(generate_project_documentation(agent_result['amplified_requirements']))
-            print("📄 Created PROJECT_REQUIREMENTS.md")
+            blob_store.write_file(requirements_path, generate_project_documentation(agent_result['amplified_requirements']))
         
-        print(f"\n🎉 Project '{project_name}' created successfully!")
-        print(f"📁 Files created: {len(created_files)}")
-        for file_info in created_files:
-            print(f"   • {file_info}")
+        logger.info(f"Project {project_name} created", extra={"files": created_files})
             
         return True
         
@@ -193,3 +188,82 @@ def generate_project_documentation(requirements: Dict) -> str:
 
     doc += "\n---\n*Generated automatically from user requirements*\n"
     return doc
+
+
+# Files the edit flow shows to the model and lets it change
+EDITABLE_SUFFIXES = (".html", ".css", ".js", ".json", ".svg", ".txt", ".xml")
+
+
+def read_project_files(project_path: str) -> Dict[str, str]:
+    """Return the editable text files of a project, relative path (forward slashes) -> content"""
+    files = {}
+    root = Path(project_path)
+    for path in sorted(root.rglob("*")):
+        if path.is_file() and path.suffix.lower() in EDITABLE_SUFFIXES:
+            files[path.relative_to(root).as_posix()] = path.read_text(encoding="utf-8", errors="replace")
+    return files
+
+
+def _resolve_in_project(root: Path, rel: str) -> Optional[Path]:
+    target = (root / rel).resolve()
+    if target == root or root not in target.parents:
+        return None
+    return target
+
+
+def apply_project_edit(project_path: str, edit: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Apply an edit from get_edit_from_agent to a project in place
+
+    Patches replace one exact, unique occurrence of "search"; a patch that doesn't
+    match leaves its file untouched. Full files in "files" overwrite or create the
+    path. Each changed file is written atomically and its stale .gz/.br siblings
+    are removed so the preview serves the new content.
+
+    Returns:
+        Report with the changed paths and any patches that could not be applied
+    """
+    root = Path(project_path).resolve()
+    new_contents: Dict[str, str] = {}
+    failed = []
+
+    for rel, content in (edit.get("files") or {}).items():
+        if _resolve_in_project(root, rel) is None or not isinstance(content, str):
+            failed.append({"file": rel, "reason": "invalid path or content"})
+            continue
+        new_contents[rel] = content
+
+    for patch in edit.get("patches") or []:
+        rel = patch.get("file", "")
+        search, replace = patch.get("search"), patch.get("replace")
+        target = _resolve_in_project(root, rel)
+        if target is None or not isinstance(search, str) or not isinstance(replace, str) or not search:
+            failed.append({"file": rel, "reason": "invalid patch"})
+            continue
+        if rel in new_contents:
+            current = new_contents[rel]
+        elif target.is_file():
+            current = target.read_text(encoding="utf-8")
+        else:
+            failed.append({"file": rel, "reason": "file not found"})
+            continue
+        count = current.count(search)
+        if count != 1:
+            failed.append({"file": rel, "reason": "search text not found" if count == 0 else f"search text matches {count} times"})
+            continue
+        new_contents[rel] = current.replace(search, replace, 1)
+
+    changed, created = [], []
+    for rel, content in new_contents.items():
+        target = _resolve_in_project(root, rel)
+        existed = target.is_file()
+        if existed and target.read_text(encoding="utf-8") == content:
+            continue
+        # Replaces the file rather than writing into it, which would change every project sharing the blob
+        blob_store.write_file(target, content)
+        for suffix in (".gz", ".br"):
+            target.with_name(target.name + suffix).unlink(missing_ok=True)
+        (changed if existed else created).append(rel)
+        logger.info(f"Edited {target}", extra=VERBOSE)
+
+    return {"changed": changed, "created": created, "failed": failed}
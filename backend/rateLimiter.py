@@ -0,0 +1,225 @@
+import os
+import json
+import math
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "0") == "1"
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+# Comma-separated API keys that get their own budget; any other key is limited by client IP
+RATE_LIMIT_API_KEYS = frozenset(k.strip() for k in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if k.strip())
+
+# Per-stage budgets: sustained requests per minute, bucket size, and max concurrent jobs
+STAGE_LIMITS: Dict[str, Dict[str, float]] = {
+    "model": {
+        "per_minute": float(os.getenv("RATE_LIMIT_MODEL_PER_MINUTE", "6")),
+        "burst": float(os.getenv("RATE_LIMIT_MODEL_BURST", "3")),
+        "concurrency": int(os.getenv("RATE_LIMIT_MODEL_CONCURRENCY", "2")),
+    },
+    "deploy": {
+        "per_minute": float(os.getenv("RATE_LIMIT_DEPLOY_PER_MINUTE", "2")),
+        "burst": float(os.getenv("RATE_LIMIT_DEPLOY_BURST", "2")),
+        "concurrency": int(os.getenv("RATE_LIMIT_DEPLOY_CONCURRENCY", "1")),
+    },
+}
+
+# Active-job counters expire after this long so a crashed worker can't leak a slot forever
+SLOT_TTL = int(os.getenv("RATE_LIMIT_SLOT_TTL", "900"))
+# How long a job already under way waits for a stage slot (or token) before giving up
+RATE_LIMIT_WAIT_TIMEOUT = float(os.getenv("RATE_LIMIT_WAIT_TIMEOUT", "120"))
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, stage: str, retry_after: float):
+        super().__init__(f"Rate limit for the {stage} stage exceeded; retry in {math.ceil(retry_after)}s")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+def _refill(state: Optional[Dict[str, float]], rate: float, burst: float, now: float) -> Tuple[Dict[str, float], float]:
+    """Apply the token-bucket step; returns the new state and seconds to wait (0 if admitted)"""
+    tokens = burst if state is None else min(burst, state["tokens"] + (now - state["ts"]) * rate)
+    if tokens >= 1:
+        return {"tokens": tokens - 1, "ts": now}, 0.0
+    return {"tokens": tokens, "ts": now}, (1 - tokens) / rate if rate > 0 else float(SLOT_TTL)
+
+
+class MemoryStore:
+    """Process-local limiter state; each gunicorn worker enforces its own budget"""
+
+    def __init__(self):
+        self._buckets: Dict[str, Dict[str, float]] = {}
+        self._active: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def take_token(self, key: str, rate: float, burst: float) -> float:
+        with self._lock:
+            state, wait = _refill(self._buckets.get(key), rate, burst, time.time())
+            self._buckets[key] = state
+            return wait
+
+    def acquire_slot(self, key: str, limit: int) -> bool:
+        with self._lock:
+            if self._active.get(key, 0) >= limit:
+                return False
+            self._active[key] = self._active.get(key, 0) + 1
+            return True
+
+    def release_slot(self, key: str) -> None:
+        with self._lock:
+            remaining = self._active.get(key, 0) - 1
+            if remaining > 0:
+                self._active[key] = remaining
+            else:
+                self._active.pop(key, None)
+
+
+class RedisStore:
+    """
+    Limiter state shared across workers through a Redis-compatible client
+
+    Only get/set/incr/decr/expire/delete are used, so any client exposing the
+    redis-py call signatures for those commands (including an in-memory fake) works.
+    """
+
+    def __init__(self, client: Any, prefix: str = "autogenx:rl:"):
+        self.client = client
+        self.prefix = prefix
+
+    def _with_lock(self, key: str, fn, on_timeout):
+        """Run fn under a short Redis lock; returns on_timeout instead if the lock can't be had within 1s"""
+        lock_key = f"{self.prefix}lock:{key}"
+        token = uuid.uuid4().hex
+        deadline = time.time() + 1.0
+        while not self.client.set(lock_key, token, nx=True, px=1000):
+            if time.time() > deadline:
+                # Updating the bucket unlocked could hand out tokens twice; fail closed instead
+                logger.warning(f"Rate limit lock {lock_key} is busy; rejecting the request")
+                return on_timeout
+            time.sleep(0.005)
+        try:
+            return fn()
+        finally:
+            current = self.client.get(lock_key)
+            if current is not None and (current.decode() if isinstance(current, bytes) else current) == token:
+                self.client.delete(lock_key)
+
+    def take_token(self, key: str, rate: float, burst: float) -> float:
+        bucket_key = f"{self.prefix}bucket:{key}"
+
+        def step():
+            raw = self.client.get(bucket_key)
+            state, wait = _refill(json.loads(raw) if raw else None, rate, burst, time.time())
+            ttl = int(burst / rate) + 1 if rate > 0 else SLOT_TTL
+            self.client.set(bucket_key, json.dumps(state), ex=ttl)
+            return wait
+
+        return self._with_lock(bucket_key, step, on_timeout=1.0)
+
+    def acquire_slot(self, key: str, limit: int) -> bool:
+        slot_key = f"{self.prefix}active:{key}"
+        count = self.client.incr(slot_key)
+        self.client.expire(slot_key, SLOT_TTL)
+        if count > limit:
+            self.client.decr(slot_key)
+            return False
+        return True
+
+    def release_slot(self, key: str) -> None:
+        slot_key = f"{self.prefix}active:{key}"
+        if self.client.decr(slot_key) <= 0:
+            self.client.delete(slot_key)
+
+
+def _default_store():
+    if not RATE_LIMIT_REDIS_URL:
+        return MemoryStore()
+    try:
+        import redis
+        return RedisStore(redis.Redis.from_url(RATE_LIMIT_REDIS_URL))
+    except ImportError:
+        logger.warning("RATE_LIMIT_REDIS_URL is set but redis is not installed; using in-process limits")
+        return MemoryStore()
+
+
+class RateLimiter:
+    """Token-bucket and concurrency limits per tenant, with a separate budget per stage"""
+
+    def __init__(self, store=None, limits: Dict[str, Dict[str, float]] | None = None):
+        self.store = store or _default_store()
+        self.limits = limits or STAGE_LIMITS
+
+    def admit(self, tenant: str, stage: str) -> float:
+        """
+        Try to start a job for tenant in stage
+
+        Returns:
+            0 when admitted (a slot is held until release()), otherwise the
+            number of seconds the client should wait before retrying
+        """
+        limits = self.limits[stage]
+        key = f"{stage}:{tenant}"
+        if not self.store.acquire_slot(key, int(limits["concurrency"])):
+            # No way to know when a running job finishes; suggest a short back-off
+            return 5.0
+        wait = self.store.take_token(key, limits["per_minute"] / 60.0, limits["burst"])
+        if wait > 0:
+            self.store.release_slot(key)
+        return wait
+
+    def release(self, tenant: str, stage: str) -> None:
+        self.store.release_slot(f"{stage}:{tenant}")
+
+    def take_token(self, tenant: str, stage: str) -> float:
+        """Charge one job to tenant's budget for stage without holding a slot; returns seconds to wait (0 if charged)"""
+        limits = self.limits[stage]
+        return self.store.take_token(f"{stage}:{tenant}", limits["per_minute"] / 60.0, limits["burst"])
+
+    def charge(self, tenant: str, stage: str, timeout: float = RATE_LIMIT_WAIT_TIMEOUT) -> None:
+        """Like take_token, but wait for the bucket to refill; raises RateLimitExceeded after timeout"""
+        deadline = time.time() + timeout
+        while True:
+            wait = self.take_token(tenant, stage)
+            if not wait:
+                return
+            if time.time() + wait > deadline:
+                raise RateLimitExceeded(stage, wait)
+            time.sleep(wait)
+
+    @contextmanager
+    def slot(self, tenant: str, stage: str, timeout: float = RATE_LIMIT_WAIT_TIMEOUT):
+        """Hold one of tenant's concurrency slots for stage, waiting up to timeout for one to free up"""
+        key = f"{stage}:{tenant}"
+        deadline = time.time() + timeout
+        while not self.store.acquire_slot(key, int(self.limits[stage]["concurrency"])):
+            if time.time() >= deadline:
+                raise RateLimitExceeded(stage, 5.0)
+            time.sleep(0.25)
+        try:
+            yield
+        finally:
+            self.store.release_slot(key)
+
+
+def tenant_from_request(req) -> str:
+    """
+    Identify the caller by a configured API key, otherwise by client IP
+
+    Unknown keys are ignored so a client can't mint fresh budgets by varying the
+    header. The IP is remote_addr, which only reflects X-Forwarded-For when the
+    app is wrapped in ProxyFix for the trusted proxy hops (see TRUSTED_PROXY_HOPS).
+    """
+    api_key = req.headers.get("X-API-Key") or req.form.get("api_key")
+    if api_key and api_key in RATE_LIMIT_API_KEYS:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    return f"ip:{req.remote_addr or 'unknown'}"
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,146 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "0") == "1"
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "3600"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256"))
+
+
+def _hash_file(path: str) -> Optional[str]:
+    """Return the sha256 of a file's bytes, or None when it can't be read"""
+    try:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    except OSError:
+        return None
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace and case so trivially different prompts share a key"""
+    return re.sub(r"\s+", " ", prompt or "").strip().lower()
+
+
+def request_fingerprint(prompt: str, img: str | None = None, **options: Any) -> str:
+    """
+    Build a stable fingerprint for a generation request
+
+    Args:
+        prompt: User's project description
+        img: Path to the reference image, hashed by content rather than name
+        **options: Any other request options that change the output (deploy target etc.)
+
+    Returns:
+        Hex digest identifying the normalized request
+    """
+    payload = {
+        "prompt": normalize_prompt(prompt),
+        "image": _hash_file(img) if img else None,
+        "options": {k: v for k, v in sorted(options.items()) if v is not None},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """In-process cache of finished generation results with single-flight coalescing"""
+
+    def __init__(self, ttl: int = RESULT_CACHE_TTL, max_entries: int = RESULT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[str, tuple[float, Dict[str, Any]]] = {}
+        self._inflight: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, stored_at: float, result: Dict[str, Any]) -> bool:
+        if time.time() - stored_at > self.ttl:
+            return False
+        # A cached result is only useful while its project directory is still on disk
+        project_path = result.get("project_path")
+        return bool(project_path) and os.path.isdir(project_path)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a fresh cached result for key, evicting it if stale"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            stored_at, result = entry
+            if not self._is_fresh(stored_at, result):
+                del self._entries[key]
+                return None
+            return dict(result)
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        """Store a successful result, dropping the oldest entry when full"""
+        if not result.get("success"):
+            return
+        # A failed, blocked or skipped deploy has to be retried by the next identical request
+        if result.get("deployment_status", "success") != "success":
+            return
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                oldest = min(self._entries, key=lambda k: self._entries[k][0])
+                del self._entries[oldest]
+            self._entries[key] = (time.time(), dict(result))
+
+    def invalidate_path(self, project_path: str) -> None:
+        """Drop every entry pointing at project_path (e.g. after the project is edited)"""
+        with self._lock:
+            for key in [k for k, (_, r) in self._entries.items() if r.get("project_path") == project_path]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Return the cached result for key, or run compute once for all concurrent callers
+
+        The returned dict carries a "cache" field: "hit" when served from the cache
+        (including callers that waited on an in-flight generation) and "miss" otherwise.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            cached["cache"] = "hit"
+            return cached
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = {"event": threading.Event(), "result": None}
+                self._inflight[key] = flight
+
+        if not leader:
+            flight["event"].wait()
+            result = dict(flight["result"] or {"success": False, "error": "Coalesced generation failed"})
+            result["cache"] = "hit" if result.get("success") else "miss"
+            return result
+
+        result = None
+        try:
+            result = compute()
+            self.put(key, result)
+        finally:
+            flight["result"] = result
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight["event"].set()
+
+        result = dict(result)
+        result["cache"] = "miss"
+        return result
+
+
+result_cache = ResultCache()
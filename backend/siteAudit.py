@@ -0,0 +1,227 @@
+"""
+Offline performance and integrity audit of a generated site
+
+Parses every HTML page in the project and checks what it references instead of
+trusting the model's output: local CSS/JS references (including CSS @import)
+must resolve to files inside the project, and each page gets a weight (bytes a
+first visit downloads from the project) and request count. Missing images and
+media, links to missing pages, render-blocking resources and oversized inline
+styles/scripts are reported as warnings.
+"""
+import os
+import re
+import logging
+from pathlib import Path
+from html.parser import HTMLParser
+from urllib.parse import urlsplit, unquote
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from siteBuilder import is_precompressed_variant
+
+logger = logging.getLogger(__name__)
+
+SITE_AUDIT_ENABLED = os.getenv("SITE_AUDIT_ENABLED", "1") == "1"
+# Refuse to deploy a site whose pages reference files that don't exist
+SITE_AUDIT_BLOCK_DEPLOY = os.getenv("SITE_AUDIT_BLOCK_DEPLOY", "1") == "1"
+# Reference kinds whose absence breaks the site (css, js, asset); the others only warn
+SITE_AUDIT_BLOCKING_KINDS = frozenset(
+    k.strip() for k in os.getenv("SITE_AUDIT_BLOCKING_KINDS", "css,js").split(",") if k.strip()
+)
+INLINE_STYLE_LIMIT = int(os.getenv("SITE_AUDIT_INLINE_STYLE_LIMIT", str(10 * 1024)))
+INLINE_SCRIPT_LIMIT = int(os.getenv("SITE_AUDIT_INLINE_SCRIPT_LIMIT", str(10 * 1024)))
+PAGE_WEIGHT_LIMIT = int(os.getenv("SITE_AUDIT_PAGE_WEIGHT_LIMIT", str(500 * 1024)))
+
+# @import (quoted or url()) is tried first so its target is told apart from plain url() assets
+_CSS_REF_RE = re.compile(
+    r"""@import\s+(?:url\(\s*(["']?)([^"')]+)\1\s*\)|(["'])([^"']+)\3)|url\(\s*(["']?)([^"')]+)\5\s*\)""",
+    re.IGNORECASE,
+)
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+
+
+def _is_external(ref: str) -> bool:
+    return bool(re.match(r"^[a-z][a-z0-9+.-]*:|^//", ref, re.IGNORECASE))
+
+
+class _PageParser(HTMLParser):
+    """Collects referenced resources, inline style/script sizes and render-blocking tags of one page"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.resources: List[Dict[str, Any]] = []
+        self.render_blocking: List[str] = []
+        self.inline_style_bytes = 0
+        self.inline_script_bytes = 0
+        self.style_attr_bytes = 0
+        self._seen_body = False
+        self._raw: Optional[str] = None
+
+    def _add(self, kind: str, ref: Optional[str], **extra) -> None:
+        if ref and ref.strip() and not ref.startswith(("#", "data:", "javascript:", "mailto:", "tel:")):
+            self.resources.append(dict(kind=kind, ref=ref.strip(), **extra))
+
+    def handle_starttag(self, tag, attrs):
+        a = {k.lower(): (v or "") for k, v in attrs}
+        if "style" in a:
+            self.style_attr_bytes += len(a["style"].encode("utf-8"))
+        if tag == "body":
+            self._seen_body = True
+        elif tag == "link":
+            rel = a.get("rel", "").lower().split()
+            if "stylesheet" in rel:
+                self._add("css", a.get("href"))
+                media = a.get("media", "all").lower()
+                if not self._seen_body and media in ("", "all", "screen") and "disabled" not in a:
+                    self.render_blocking.append(a.get("href", ""))
+            elif {"icon", "preload", "modulepreload", "manifest"} & set(rel):
+                self._add("asset", a.get("href"))
+        elif tag == "script":
+            if a.get("src"):
+                self._add("js", a["src"])
+                if not self._seen_body and "async" not in a and "defer" not in a and a.get("type") != "module":
+                    self.render_blocking.append(a["src"])
+            self._raw = "script"
+        elif tag == "style":
+            self._raw = "style"
+        elif tag in ("img", "source", "video", "audio", "iframe", "embed"):
+            self._add("asset", a.get("src"))
+            for candidate in a.get("srcset", "").split(","):
+                self._add("asset", candidate.strip().split(" ")[0])
+        elif tag == "a":
+            self._add("page", a.get("href"))
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style"):
+            self._raw = None
+
+    def handle_data(self, data):
+        if self._raw == "style":
+            self.inline_style_bytes += len(data.encode("utf-8"))
+        elif self._raw == "script":
+            self.inline_script_bytes += len(data.encode("utf-8"))
+
+
+def _resolve(root: Path, page_dir: Path, ref: str) -> Optional[Path]:
+    """Local file a relative reference points at (None when it escapes the project)"""
+    path = unquote(urlsplit(ref).path)
+    if not path:
+        return None
+    base = root if path.startswith("/") else page_dir
+    target = (base / path.lstrip("/")).resolve()
+    if target.is_dir():
+        target = target / "index.html"
+    root = root.resolve()
+    if target != root and root not in target.parents:
+        return None
+    return target
+
+
+def _css_references(css_path: Path) -> List[Tuple[str, str]]:
+    """(kind, ref) pairs of a stylesheet: imported stylesheets are css, url() targets are assets"""
+    css = _CSS_COMMENT_RE.sub("", css_path.read_text(encoding="utf-8", errors="ignore"))
+    return [("asset", m.group(6)) if m.group(6) else ("css", m.group(2) or m.group(4))
+            for m in _CSS_REF_RE.finditer(css)]
+
+
+def audit_site(project_path: str) -> Dict[str, Any]:
+    """
+    Audit every HTML page under project_path
+
+    Returns:
+        Report with per-page weight, request count, render-blocking resources and
+        broken references, plus site-wide broken_links and warnings
+    """
+    root = Path(project_path)
+    pages = sorted(p for p in root.rglob("*.html") if p.is_file())
+    report_pages: Dict[str, Dict[str, Any]] = {}
+    broken: List[Dict[str, str]] = []
+    warnings: List[str] = []
+    css_refs: Dict[Path, List[Tuple[str, str]]] = {}
+
+    if not pages:
+        broken.append({"page": None, "ref": "index.html", "kind": "page", "reason": "site has no HTML page"})
+
+    for page in pages:
+        rel_page = page.relative_to(root).as_posix()
+        parser = _PageParser()
+        html = page.read_text(encoding="utf-8", errors="ignore")
+        parser.feed(html)
+        parser.close()
+
+        local: Set[Path] = set()
+        external: Set[str] = set()
+        page_broken: List[Dict[str, str]] = []
+        page_missing: List[str] = []
+
+        def check(kind: str, ref: str, base_dir: Path, origin: str) -> None:
+            if _is_external(ref):
+                if kind != "page":
+                    external.add(ref)
+                return
+            if ref.startswith("/") and not ref.startswith("//"):
+                warnings.append(f"{origin}: root-relative '{ref}' breaks on a GitHub Pages project site")
+            target = _resolve(root, base_dir, ref)
+            if target is None or not target.is_file():
+                reason = "outside the project" if target is None else "file not found"
+                if kind == "page":
+                    warnings.append(f"{origin}: link to missing page '{ref}'")
+                elif kind in SITE_AUDIT_BLOCKING_KINDS:
+                    # Missing styles or scripts break the page itself
+                    page_broken.append({"page": rel_page, "ref": ref, "kind": kind, "reason": reason, "in": origin})
+                else:
+                    # A missing image or font degrades the page but still renders it
+                    page_missing.append(ref)
+                    warnings.append(f"{origin}: missing {kind} '{ref}' ({reason})")
+                return
+            if kind == "page" or target in local:
+                return
+            local.add(target)
+            # Fonts and images pulled in by a stylesheet count towards the page as well
+            if target.suffix.lower() == ".css":
+                if target not in css_refs:
+                    css_refs[target] = _css_references(target)
+                for css_kind, css_ref in css_refs[target]:
+                    if not css_ref.startswith("data:"):
+                        check(css_kind, css_ref, target.parent, target.relative_to(root.resolve()).as_posix())
+
+        for resource in parser.resources:
+            check(resource["kind"], resource["ref"], page.parent, rel_page)
+
+        html_bytes = len(html.encode("utf-8"))
+        weight = html_bytes + sum(p.stat().st_size for p in local)
+        entry = {
+            "html_bytes": html_bytes,
+            "weight_bytes": weight,
+            "requests": 1 + len(local) + len(external),
+            "local_resources": sorted(p.relative_to(root.resolve()).as_posix() for p in local),
+            "external_resources": sorted(external),
+            "render_blocking": parser.render_blocking,
+            "inline_style_bytes": parser.inline_style_bytes + parser.style_attr_bytes,
+            "inline_script_bytes": parser.inline_script_bytes,
+            "broken_links": page_broken,
+            "missing_assets": page_missing,
+        }
+        report_pages[rel_page] = entry
+        broken.extend(page_broken)
+
+        if entry["inline_style_bytes"] > INLINE_STYLE_LIMIT:
+            warnings.append(f"{rel_page}: {entry['inline_style_bytes']} bytes of inline styles (limit {INLINE_STYLE_LIMIT})")
+        if entry["inline_script_bytes"] > INLINE_SCRIPT_LIMIT:
+            warnings.append(f"{rel_page}: {entry['inline_script_bytes']} bytes of inline script (limit {INLINE_SCRIPT_LIMIT})")
+        if weight > PAGE_WEIGHT_LIMIT:
+            warnings.append(f"{rel_page}: page weight {weight} bytes exceeds {PAGE_WEIGHT_LIMIT}")
+        for ref in parser.render_blocking:
+            warnings.append(f"{rel_page}: render-blocking {ref}")
+
+    files = [p for p in root.rglob("*") if p.is_file() and not is_precompressed_variant(str(p))]
+    report = {
+        "ok": not broken,
+        "pages": report_pages,
+        "broken_links": broken,
+        "warnings": list(dict.fromkeys(warnings)),
+        "total_bytes": sum(p.stat().st_size for p in files),
+        "file_count": len(files),
+    }
+    logger.info(f"Audited {project_path}: {len(report_pages)} page(s), {len(broken)} broken link(s)",
+                extra={"warnings": len(report["warnings"])})
+    return report
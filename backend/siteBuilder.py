@@ -0,0 +1,312 @@
+import os
+import re
+import gzip
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, Any, List, Set, Tuple
+
+from blobStore import blob_store
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without it only .gz variants are produced
+    brotli = None
+
+SITE_BUILD_ENABLED = os.getenv("SITE_BUILD_ENABLED", "0") == "1"
+
+COMPRESSIBLE = (".html", ".css", ".js", ".svg", ".json", ".txt", ".xml")
+PRECOMPRESSED = {".br": "br", ".gz": "gzip"}
+
+_STRING_RE = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'')
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+_HTML_COMMENT_RE = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+_RAW_BLOCK_RE = re.compile(r"(<(pre|textarea|script|style)\b[^>]*>)(.*?)(</\2\s*>)", re.DOTALL | re.IGNORECASE)
+_ASSET_REF_RE = re.compile(r'((?:href|src)\s*=\s*)(["\'])([^"\']+)\2', re.IGNORECASE)
+
+
+def is_precompressed_variant(path: str) -> bool:
+    """True for the .gz/.br siblings the build writes next to an original file"""
+    root, ext = os.path.splitext(path)
+    return ext in PRECOMPRESSED and os.path.splitext(root)[1] in COMPRESSIBLE
+
+
+def _protect_strings(text: str) -> Tuple[str, List[str]]:
+    strings: List[str] = []
+
+    def keep(match):
+        strings.append(match.group(0))
+        return f"\x00{len(strings) - 1}\x00"
+
+    return _STRING_RE.sub(keep, text), strings
+
+
+def _restore_strings(text: str, strings: List[str]) -> str:
+    return re.sub(r"\x00(\d+)\x00", lambda m: strings[int(m.group(1))], text)
+
+
+def minify_css(css: str) -> str:
+    """Drop comments and insignificant whitespace; string contents are left untouched"""
+    text, strings = _protect_strings(css)
+    text = _CSS_COMMENT_RE.sub("", text)
+    text = re.sub(r"\s+", " ", text)
+    # Spaces before ":" are significant in selectors ("div :hover"), so only strip after it
+    text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+    text = re.sub(r":\s+", ":", text)
+    text = text.replace(";}", "}")
+    return _restore_strings(text, strings).strip()
+
+
+def minify_js(js: str) -> str:
+    """
+    Conservative JS minification: drop indentation, blank lines and whole-line
+    comments, keeping newlines so automatic semicolon insertion still works.
+    Lines inside template literals and block comments are handled explicitly.
+    """
+    out = []
+    in_template = False
+    in_block_comment = False
+    for line in js.splitlines():
+        if in_template:
+            out.append(line)
+        else:
+            stripped = line.strip()
+            if in_block_comment:
+                if "*/" in stripped:
+                    in_block_comment = False
+                    stripped = stripped.split("*/", 1)[1].strip()
+                else:
+                    continue
+            if stripped.startswith("/*") and not stripped.startswith("/**/"):
+                if "*/" in stripped:
+                    stripped = stripped.split("*/", 1)[1].strip()
+                else:
+                    in_block_comment = True
+                    continue
+            if not stripped or stripped.startswith("//"):
+                continue
+            out.append(stripped)
+        # An odd number of unescaped backticks toggles template-literal state
+        if len(re.findall(r"(?<!\\)`", line)) % 2 == 1:
+            in_template = not in_template
+    return "\n".join(out)
+
+
+def minify_html(html: str) -> str:
+    """Remove comments and collapse whitespace outside pre/textarea; minify inline CSS/JS"""
+    blocks: List[str] = []
+
+    def keep(match):
+        opening, tag, body, closing = match.groups()
+        tag = tag.lower()
+        if tag == "style":
+            body = minify_css(body)
+        elif tag == "script" and "src=" not in opening.lower():
+            body = minify_js(body)
+        blocks.append(opening + body + closing)
+        return f"\x00{len(blocks) - 1}\x00"
+
+    text = _RAW_BLOCK_RE.sub(keep, html)
+    text = _HTML_COMMENT_RE.sub("", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return re.sub(r"\x00(\d+)\x00", lambda m: blocks[int(m.group(1))], text)
+
+
+def _split_selectors(selector_text: str) -> List[str]:
+    parts, depth, current = [], 0, ""
+    for ch in selector_text:
+        if ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth -= 1
+        if ch == "," and depth == 0:
+            parts.append(current)
+            current = ""
+        else:
+            current += ch
+    parts.append(current)
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _selector_used(selector: str, used_tokens: Set[str]) -> bool:
+    # Negations and attribute selectors don't require anything to be present
+    selector = re.sub(r":not\([^)]*\)|\[[^\]]*\]", "", selector)
+    names = re.findall(r"[.#](-?[_a-zA-Z][\w-]*)", selector)
+    return all(name in used_tokens for name in names)
+
+
+def _find_block_end(text: str, open_index: int) -> int:
+    depth = 0
+    for i in range(open_index, len(text)):
+        if text[i] == "{":
+            depth += 1
+        elif text[i] == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(text) - 1
+
+
+def purge_unused_css(css: str, used_tokens: Set[str]) -> Tuple[str, int]:
+    """
+    Drop selectors whose classes/ids never appear in the HTML or JS
+
+    Returns the new CSS and the number of selectors removed. At-rules other than
+    @media/@supports (keyframes, font-face, ...) are always kept.
+    """
+    text, strings = _protect_strings(_CSS_COMMENT_RE.sub("", css))
+    out, removed, i = [], 0, 0
+    while i < len(text):
+        brace = text.find("{", i)
+        if brace == -1:
+            out.append(text[i:])
+            break
+        end = _find_block_end(text, brace)
+        body = text[brace + 1:end]
+        # Anything before the block's own prelude (e.g. an @import statement) is kept verbatim
+        statement, _, prelude = text[i:brace].rpartition(";")
+        if statement:
+            out.append(statement + ";")
+        head = prelude.strip()
+        if head.startswith("@"):
+            if re.match(r"@(media|supports)\b", head):
+                inner, inner_removed = purge_unused_css(_restore_strings(body, strings), used_tokens)
+                removed += inner_removed
+                if inner.strip():
+                    out.append(f"{head} {{{inner}}}")
+            else:
+                out.append(f"{head} {{{body}}}")
+        else:
+            selector_text = prelude
+            selectors = _split_selectors(selector_text)
+            kept = [s for s in selectors if _selector_used(s, used_tokens)]
+            removed += len(selectors) - len(kept)
+            if kept:
+                out.append(f"{', '.join(kept)} {{{body}}}")
+        i = end + 1
+    return _restore_strings("\n".join(out), strings), removed
+
+
+def _write_precompressed(path: Path) -> Dict[str, int]:
+    data = path.read_bytes()
+    sizes = {}
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        blob_store.write_file(path.with_name(path.name + ".gz"), gz)
+        sizes["gzip"] = len(gz)
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            blob_store.write_file(path.with_name(path.name + ".br"), br)
+            sizes["br"] = len(br)
+    return sizes
+
+
+def sources_path(project_path: str | Path) -> Path:
+    """Sibling directory where build_project keeps a project's unbuilt sources"""
+    root = Path(project_path)
+    return root.with_name(root.name + ".src")
+
+
+def build_project(project_path: str, keep_sources: bool = True) -> Dict[str, Any]:
+    """
+    Optimize a generated project in place
+
+    Minifies HTML/CSS/JS, removes CSS selectors nothing references, renames CSS
+    and JS to content-hashed names (rewriting references in the HTML), and writes
+    .gz (and .br when brotli is installed) variants for the preview route. The
+    unbuilt files are first copied to sources_path() so edits can be applied to
+    them and rebuilt (see rebuild_project).
+
+    Returns:
+        Report with per-file and total byte counts before and after
+    """
+    root = Path(project_path)
+    if keep_sources:
+        sources = sources_path(root)
+        shutil.rmtree(sources, ignore_errors=True)
+        blob_store.copy_tree(root, sources, ignore=lambda d, names: [n for n in names if is_precompressed_variant(n)])
+    files = [p for p in root.rglob("*") if p.is_file() and not is_precompressed_variant(str(p))]
+    by_ext = {ext: [p for p in files if p.suffix.lower() == ext] for ext in (".html", ".css", ".js")}
+    before = {p.relative_to(root).as_posix(): p.stat().st_size for p in files}
+
+    # Every word in the markup and scripts counts as "used" so classes toggled from JS survive
+    used_tokens: Set[str] = set()
+    for p in by_ext[".html"] + by_ext[".js"]:
+        used_tokens.update(re.findall(r"[\w-]+", p.read_text(encoding="utf-8", errors="ignore")))
+
+    removed_selectors = 0
+    for p in by_ext[".css"]:
+        css, removed = purge_unused_css(p.read_text(encoding="utf-8"), used_tokens)
+        removed_selectors += removed
+        blob_store.write_file(p, minify_css(css))
+    for p in by_ext[".js"]:
+        blob_store.write_file(p, minify_js(p.read_text(encoding="utf-8")))
+
+    renamed: Dict[str, str] = {}
+    for p in by_ext[".css"] + by_ext[".js"]:
+        digest = hashlib.sha256(p.read_bytes()).hexdigest()[:8]
+        target = p.with_name(f"{p.stem}.{digest}{p.suffix}")
+        p.rename(target)
+        renamed[p.relative_to(root).as_posix()] = target.relative_to(root).as_posix()
+
+    for p in by_ext[".html"]:
+        html = p.read_text(encoding="utf-8")
+
+        def rewrite(match):
+            prefix, quote, ref = match.groups()
+            if re.match(r"^[a-z]+:|^//|^#", ref, re.IGNORECASE):
+                return match.group(0)
+            resolved = os.path.normpath(os.path.join(p.parent.relative_to(root).as_posix(), ref)).replace("\\", "/")
+            if resolved not in renamed:
+                return match.group(0)
+            new_ref = os.path.relpath(root / renamed[resolved], p.parent).replace("\\", "/")
+            return f"{prefix}{quote}{new_ref}{quote}"
+
+        blob_store.write_file(p, minify_html(_ASSET_REF_RE.sub(rewrite, html)))
+
+    report_files: Dict[str, Dict[str, int]] = {}
+    totals = {"before_bytes": 0, "after_bytes": 0, "gzip_bytes": 0, "br_bytes": 0}
+    for rel, size in before.items():
+        final = root / renamed.get(rel, rel)
+        entry = {"before": size, "after": final.stat().st_size}
+        if final.suffix.lower() in COMPRESSIBLE:
+            entry.update(_write_precompressed(final))
+        report_files[renamed.get(rel, rel)] = entry
+        totals["before_bytes"] += entry["before"]
+        totals["after_bytes"] += entry["after"]
+        totals["gzip_bytes"] += entry.get("gzip", entry["after"])
+        totals["br_bytes"] += entry.get("br", entry.get("gzip", entry["after"]))
+
+    logger.info(f"Built {project_path}: {totals['before_bytes']} -> {totals['after_bytes']} bytes")
+    return dict(totals, files=report_files, renamed=renamed, removed_css_selectors=removed_selectors,
+                brotli=brotli is not None)
+
+
+def rebuild_project(project_path: str) -> Dict[str, Any]:
+    """
+    Rebuild a project from its kept sources, e.g. after they were edited
+
+    The build runs in a scratch copy that then replaces the project, so asset
+    names are re-fingerprinted and the .gz/.br variants regenerated, and the
+    preview never sees a half-built directory.
+    """
+    root = Path(project_path)
+    staging = root.with_name(root.name + ".build")
+    shutil.rmtree(staging, ignore_errors=True)
+    blob_store.copy_tree(sources_path(root), staging)
+    try:
+        report = build_project(str(staging), keep_sources=False)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    previous = root.with_name(root.name + ".old")
+    shutil.rmtree(previous, ignore_errors=True)
+    os.rename(root, previous)
+    os.rename(staging, root)
+    shutil.rmtree(previous, ignore_errors=True)
+    return report
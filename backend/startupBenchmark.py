@@ -0,0 +1,119 @@
+"""
+Cold-start benchmark: import-time breakdown and time to first served request
+
+Each run starts a fresh server process and polls "/" until it answers, so the
+number includes interpreter start, imports and app creation. The import
+breakdown comes from `python -X importtime -c "import app"`, and the deferred
+cost is what backend.warm_up() (the lazily loaded SDKs) adds on top.
+
+Usage:
+    python startupBenchmark.py --runs 5
+    python startupBenchmark.py --runs 5 --gunicorn --output startup.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+import urllib.request
+from typing import Dict, Any, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_breakdown(top: int = 15) -> Dict[str, Any]:
+    """Slowest imports when loading the app, by cumulative and by self time"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                          cwd=HERE, capture_output=True, text=True, check=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append({"module": name.strip(), "depth": (len(name) - len(name.lstrip())) // 2,
+                     "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    app_row = next((r for r in rows if r["module"] == "app"), None)
+    return {
+        "app_import_ms": app_row["cumulative_ms"] if app_row else None,
+        "by_cumulative": sorted(rows, key=lambda r: r["cumulative_ms"], reverse=True)[:top],
+        "by_self": sorted(rows, key=lambda r: r["self_ms"], reverse=True)[:top],
+    }
+
+
+def deferred_import_ms() -> float:
+    """Time backend.warm_up() takes after the app is loaded, i.e. what lazy loading moved off startup"""
+    code = "import time, backend; t = time.perf_counter(); backend.warm_up(); print(time.perf_counter() - t)"
+    proc = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True, check=True)
+    return round(float(proc.stdout.strip().splitlines()[-1]) * 1000, 1)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_first_request(use_gunicorn: bool, timeout: float = 60.0) -> float:
+    """Seconds from spawning the server until GET / returns 200"""
+    port = _free_port()
+    env = dict(os.environ, PORT=str(port))
+    if use_gunicorn:
+        cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"]
+    else:
+        cmd = [sys.executable, "app.py"]
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"Server exited with code {proc.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f"No response within {timeout}s")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def _median(values: List[float]) -> float:
+    ordered = sorted(values)
+    mid = len(ordered) // 2
+    return ordered[mid] if len(ordered) % 2 else (ordered[mid - 1] + ordered[mid]) / 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure AutoGenx cold-start time")
+    parser.add_argument("--runs", type=int, default=5, help="Server starts to time")
+    parser.add_argument("--gunicorn", action="store_true", help="Start with gunicorn.conf.py instead of app.py")
+    parser.add_argument("--top", type=int, default=15, help="Imports to list in the breakdown")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    runs = [time_to_first_request(args.gunicorn) for _ in range(args.runs)]
+    report = {
+        "server": "gunicorn" if args.gunicorn else "flask",
+        "time_to_first_request_ms": {
+            "runs": [round(r * 1000, 1) for r in runs],
+            "median": round(_median(runs) * 1000, 1),
+            "max": round(max(runs) * 1000, 1),
+        },
+        "deferred_import_ms": deferred_import_ms(),
+        "imports": import_breakdown(args.top),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
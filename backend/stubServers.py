@@ -0,0 +1,316 @@
+import re
+import json
+import time
+import uuid
+import base64
+import hashlib
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+# 1x1 transparent PNG served as the rendered Figma frame
+PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489"
+    "0000000d49444154789c6300010000000500010d0a2db40000000049454e44ae426082"
+)
+
+Route = Tuple[str, str, str, Callable]
+
+
+class StubServer:
+    """
+    Local HTTP server emulating one upstream API
+
+    Every request sleeps for latency_ms (plus up to jitter_ms) and fails with
+    error_status for a fraction error_rate of calls. Each call is recorded with
+    its route name and duration so the benchmark can report per-upstream stats.
+    """
+
+    def __init__(self, name: str, routes: List[Route], latency_ms: float = 0, jitter_ms: float = 0,
+                 error_rate: float = 0.0, error_status: int = 500, seed: Optional[int] = None):
+        self.name = name
+        self.routes = [(method, re.compile(pattern), label, fn) for method, pattern, label, fn in routes]
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.calls: List[Dict[str, Any]] = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _dispatch(self):
+                started = time.perf_counter()
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                path = self.path.split("?", 1)[0]
+                label, status, headers, payload, injected = stub._handle(self.command, path, self.headers, body)
+                if isinstance(payload, (dict, list)):
+                    payload = json.dumps(payload).encode("utf-8")
+                    headers.setdefault("Content-Type", "application/json")
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                with stub._lock:
+                    stub.calls.append({"route": label, "status": status, "injected": injected,
+                                       "bytes_in": len(body), "seconds": time.perf_counter() - started})
+
+            do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = _dispatch
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _handle(self, method: str, path: str, headers, body: bytes):
+        delay = self.latency_ms + (self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay:
+            time.sleep(delay / 1000.0)
+        for route_method, pattern, label, fn in self.routes:
+            match = pattern.fullmatch(path)
+            if route_method == method and match:
+                with self._lock:
+                    inject = self._random.random() < self.error_rate
+                if inject:
+                    return label, self.error_status, {}, {"error": {"message": "injected failure"}}, True
+                status, out_headers, payload = fn(match, headers, body)
+                return label, status, out_headers, payload, False
+        return f"{method} unmatched", 404, {}, {"message": "Not Found"}, False
+
+
+def _fenced(obj: Dict[str, Any]) -> str:
+    # model.py strips the ```json fence by slicing [7:-3]
+    return "```json\n" + json.dumps(obj) + "\n```"
+
+
+def genai_stub(html_kb: int = 8, truncate_chars: int = 0, exhausted_models: tuple = (), **options) -> StubServer:
+    """Emulate generateContent (generation and edit prompts), cachedContents and the resumable files.upload endpoints"""
+    filler = "x" * (html_kb * 1024)
+    amplified = {
+        "structural_demand": {"purpose": "Benchmark page", "layout": "Header, main, footer",
+                              "content": "Placeholder copy", "semantic_structure": "header/main/footer"},
+        "styling_demand": {"visual_design": "Neutral", "responsive_design": "Fluid",
+                           "animations": "None", "design_system": "8px grid"},
+        "scripting_demand": {"interactions": "Button click", "dynamic_content": "None",
+                             "api_integration": "None", "functionality": "Counter"},
+    }
+    files = {
+        "html": {"fileDir": "index.html",
+                 "content": "<!DOCTYPE html><html><head><link rel=\"stylesheet\" href=\"styles.css\"></head>"
+                            f"<body><main><p>{filler}</p></main><script src=\"script.js\"></script></body></html>"},
+        "css": {"fileDir": "styles.css", "content": "main { display: grid; padding: 16px; }\np { margin: 0; }"},
+        "js": {"fileDir": "script.js", "content": "const main = document.querySelector('main');\nconsole.log(main);"},
+    }
+    edit = {"patches": [{"file": "styles.css", "search": "padding: 16px;", "replace": "padding: 24px;"}], "files": {}}
+    sessions: Dict[str, bool] = {}
+    cached_contents: Dict[str, Any] = {}
+
+    def generate(match, headers, body):
+        if match.group(1) in exhausted_models:
+            return 429, {}, {"error": {"code": 429, "message": "Quota exceeded", "status": "RESOURCE_EXHAUSTED"}}
+        request = json.loads(body or b"{}")
+        instruction = request.get("systemInstruction") or request.get("system_instruction")
+        cache_name = request.get("cachedContent")
+        if cache_name:
+            if cache_name not in cached_contents:
+                return 404, {}, {"error": {"code": 404, "message": "CachedContent not found"}}
+            instruction = cached_contents[cache_name]
+        system = json.dumps(instruction or {})
+        if "patches" in system:
+            text = json.dumps(edit)
+        else:
+            text = _fenced(files if '\\"html\\"' in system or "fileDir" in system else amplified)
+        finish = "STOP"
+        if truncate_chars:
+            # Serve the answer in slices, resuming after whatever the model turns already delivered
+            delivered = sum(len(part.get("text", "")) for turn in request.get("contents", [])
+                            if turn.get("role") == "model" for part in turn.get("parts", []))
+            if delivered + truncate_chars < len(text):
+                finish = "MAX_TOKENS"
+            text = text[delivered:delivered + truncate_chars]
+        return 200, {}, {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": finish}],
+            "usageMetadata": {"promptTokenCount": len(body) // 4, "candidatesTokenCount": len(text) // 4,
+                              "totalTokenCount": (len(body) + len(text)) // 4},
+        }
+
+    def upload_start(match, headers, body):
+        session = uuid.uuid4().hex
+        sessions[session] = True
+        return 200, {"x-goog-upload-url": f"{server.url}/upload-session/{session}",
+                     "x-goog-upload-status": "active"}, {}
+
+    def upload_chunk(match, headers, body):
+        return 200, {"x-goog-upload-status": "final"}, {"file": {
+            "name": f"files/{match.group(1)}", "uri": f"{server.url}/v1beta/files/{match.group(1)}",
+            "mimeType": "image/png", "sizeBytes": str(len(body)), "state": "ACTIVE"}}
+
+    def create_cache(match, headers, body):
+        request = json.loads(body or b"{}")
+        name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+        cached_contents[name] = request.get("systemInstruction")
+        expire = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 3600))
+        return 200, {}, {"name": name, "model": request.get("model"), "expireTime": expire}
+
+    def update_cache(match, headers, body):
+        name = f"cachedContents/{match.group(1)}"
+        if name not in cached_contents:
+            return 404, {}, {"error": {"code": 404, "message": "CachedContent not found"}}
+        expire = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 3600))
+        return 200, {}, {"name": name, "expireTime": expire}
+
+    server = StubServer("genai", [
+        ("POST", r".*/models/([^/:]+):generateContent", "generateContent", generate),
+        ("POST", r"/upload/[^/]+/files|/upload/files", "files.upload.start", upload_start),
+        ("POST", r"/upload-session/([0-9a-f]+)", "files.upload.chunk", upload_chunk),
+        ("POST", r"/[^/]+/cachedContents", "cachedContents.create", create_cache),
+        ("PATCH", r"/[^/]+/cachedContents/([0-9a-f]+)", "cachedContents.update", update_cache),
+    ], **options)
+    return server
+
+
+def figma_stub(**options) -> StubServer:
+    """Emulate the Figma file metadata, image render and image CDN endpoints"""
+
+    def file_meta(match, headers, body):
+        return 200, {}, {"document": {"children": [{"id": "0:1"}]}}
+
+    def images(match, headers, body):
+        return 200, {}, {"images": {"0:1": f"{server.url}/cdn/{match.group(1)}.png",
+                                    "1:2": f"{server.url}/cdn/{match.group(1)}.png"}}
+
+    def cdn(match, headers, body):
+        return 200, {"Content-Type": "image/png"}, PNG_BYTES
+
+    server = StubServer("figma", [
+        ("GET", r"/v1/files/([^/]+)", "files", file_meta),
+        ("GET", r"/v1/images/([^/]+)", "images", images),
+        ("GET", r"/cdn/([^/]+)\.png", "cdn", cdn),
+    ], **options)
+    return server
+
+
+def github_stub(pages_build_ms: float = 500, **options) -> StubServer:
+    """Emulate the subset of the GitHub repos, contents and pages API used by githubHandler"""
+    repos: Dict[str, Dict[str, str]] = {}
+    pages_enabled = set()
+    # Time of the last commit per repo; the Pages build for it finishes pages_build_ms later
+    last_commit: Dict[str, float] = {}
+    lock = threading.Lock()
+
+    def get_repo(match, headers, body):
+        full = f"{match.group(1)}/{match.group(2)}"
+        if full not in repos:
+            return 404, {}, {"message": "Not Found"}
+        return 200, {}, {"full_name": full, "default_branch": "main"}
+
+    def create_repo(match, headers, body):
+        request = json.loads(body)
+        with lock:
+            files = repos.setdefault(f"bench/{request['name']}", {})
+            if request.get("auto_init"):
+                files["README.md"] = uuid.uuid4().hex
+        return 201, {}, {"name": request["name"]}
+
+    def tree(match, headers, body):
+        files = repos.get(f"{match.group(1)}/{match.group(2)}")
+        if not files:
+            return 409, {}, {"message": "Git Repository is empty."}
+        return 200, {}, {"tree": [{"path": path, "type": "blob", "sha": sha} for path, sha in sorted(files.items())],
+                         "truncated": False}
+
+    def list_contents(match, headers, body):
+        files = repos.setdefault(f"{match.group(1)}/{match.group(2)}", {})
+        prefix = (match.group(3) or "").strip("/")
+        items, dirs = [], set()
+        for path, sha in sorted(files.items()):
+            if prefix and not path.startswith(prefix + "/"):
+                continue
+            rest = path[len(prefix) + 1:] if prefix else path
+            if "/" in rest:
+                child = (prefix + "/" if prefix else "") + rest.split("/", 1)[0]
+                if child not in dirs:
+                    dirs.add(child)
+                    items.append({"path": child, "type": "dir", "sha": ""})
+            else:
+                items.append({"path": path, "type": "file", "sha": sha})
+        return 200, {}, items
+
+    def get_content(match, headers, body):
+        sha = repos.get(f"{match.group(1)}/{match.group(2)}", {}).get(match.group(3))
+        if sha is None:
+            return list_contents(match, headers, body)
+        return 200, {}, {"path": match.group(3), "type": "file", "sha": sha}
+
+    def put_content(match, headers, body):
+        request = json.loads(body)
+        with lock:
+            files = repos.setdefault(f"{match.group(1)}/{match.group(2)}", {})
+            current = files.get(match.group(3))
+            if current is not None and request.get("sha") != current:
+                return 422, {}, {"message": "\"sha\" wasn't supplied."}
+            # Same sha GitHub reports: the git blob sha of the content
+            content = base64.b64decode(request.get("content", ""))
+            files[match.group(3)] = sha = hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+            last_commit[f"{match.group(1)}/{match.group(2)}"] = time.time()
+        return (200 if current else 201), {}, {"content": {"path": match.group(3), "sha": sha}}
+
+    def delete_content(match, headers, body):
+        with lock:
+            repos.setdefault(f"{match.group(1)}/{match.group(2)}", {}).pop(match.group(3), None)
+            last_commit[f"{match.group(1)}/{match.group(2)}"] = time.time()
+        return 200, {}, {"commit": {}}
+
+    def pages(match, headers, body):
+        full = f"{match.group(1)}/{match.group(2)}"
+        with lock:
+            if full in pages_enabled:
+                return 409, {}, {"message": "GitHub Pages is already enabled."}
+            pages_enabled.add(full)
+        return 201, {}, {"status": "queued", "html_url": f"https://{match.group(1)}.github.io/{match.group(2)}/"}
+
+    def latest_build(match, headers, body):
+        full = f"{match.group(1)}/{match.group(2)}"
+        if full not in pages_enabled or full not in last_commit:
+            return 404, {}, {"message": "Not Found"}
+        committed = last_commit[full]
+        status = "built" if time.time() - committed >= pages_build_ms / 1000.0 else "building"
+        created = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(committed))
+        return 200, {}, {"status": status, "created_at": created, "error": {"message": None}}
+
+    server = StubServer("github", [
+        ("GET", r"/repos/([^/]+)/([^/]+)", "repos.get", get_repo),
+        ("POST", r"/user/repos", "repos.create", create_repo),
+        ("GET", r"/repos/([^/]+)/([^/]+)/git/trees/([^/]+)", "git.trees", tree),
+        ("GET", r"/repos/([^/]+)/([^/]+)/contents/?(.*)", "contents.get", get_content),
+        ("PUT", r"/repos/([^/]+)/([^/]+)/contents/(.+)", "contents.put", put_content),
+        ("DELETE", r"/repos/([^/]+)/([^/]+)/contents/(.+)", "contents.delete", delete_content),
+        ("POST", r"/repos/([^/]+)/([^/]+)/pages", "pages.create", pages),
+        ("GET", r"/repos/([^/]+)/([^/]+)/pages/builds/latest", "pages.builds.latest", latest_build),
+    ], **options)
+    return server
@@ -0,0 +1,193 @@
+import os
+import re
+import json
+import math
+import importlib.util
+import time
+import uuid
+import shutil
+import logging
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+from siteBuilder import is_precompressed_variant
+from blobStore import blob_store
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process locking on Windows; each worker may then overwrite the others' additions
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Optional: without numpy the index is disabled and every request goes to the model.
+# It is only imported once the index is first used, to keep app start-up fast
+np = None
+TEMPLATE_INDEX_ENABLED = os.getenv("TEMPLATE_INDEX_ENABLED", "0") == "1"
+if TEMPLATE_INDEX_ENABLED and importlib.util.find_spec("numpy") is None:
+    logger.warning("TEMPLATE_INDEX_ENABLED=1 but numpy is not installed; the template index is disabled")
+    TEMPLATE_INDEX_ENABLED = False
+TEMPLATE_INDEX_DIR = Path(os.getenv("TEMPLATE_INDEX_DIR", "template_index"))
+TEMPLATE_INDEX_MAX = int(os.getenv("TEMPLATE_INDEX_MAX", "500"))
+# Cosine similarity above which a stored site is served as is
+TEMPLATE_SERVE_THRESHOLD = float(os.getenv("TEMPLATE_SERVE_THRESHOLD", "0.9"))
+# Above this a stored site seeds an edit-style generation instead of a full one
+TEMPLATE_SEED_THRESHOLD = float(os.getenv("TEMPLATE_SEED_THRESHOLD", "0.5"))
+
+_STOP_WORDS = {
+    "a", "an", "and", "the", "for", "of", "to", "with", "in", "on", "my", "me", "i", "is", "it", "that",
+    "this", "create", "make", "build", "generate", "please", "want", "need", "website", "site", "page", "web",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words minus filler, plus adjacent-word bigrams so word order carries some weight"""
+    words = [w for w in re.findall(r"[a-z0-9]+", (text or "").lower()) if w not in _STOP_WORDS]
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+class TemplateIndex:
+    """
+    TF-IDF index over previously generated projects
+
+    Each entry is a snapshot of a project's files plus the prompt and the
+    requirements' purpose it was generated from. Vectors are L2-normalized rows
+    of one float32 matrix, so a lookup is a single matrix-vector product. The
+    matrix, vocabulary and entries are persisted under TEMPLATE_INDEX_DIR.
+
+    Several workers share the directory: add() re-reads the index from disk
+    under an exclusive file lock before appending, and lookups reload it
+    whenever another process has rewritten it.
+    """
+
+    def __init__(self, root: Path = TEMPLATE_INDEX_DIR, max_entries: int = TEMPLATE_INDEX_MAX):
+        self.root = root
+        self.max_entries = max_entries
+        self._entries: List[Dict[str, Any]] = []
+        self._vocab: Dict[str, int] = {}
+        self._idf = None
+        self._matrix = None
+        self._loaded = False
+        # mtime of the index.json this process last read or wrote
+        self._loaded_mtime: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        """Read the persisted index unless the in-memory copy is already current"""
+        global np
+        if np is None:
+            import numpy as np
+        meta = self.root / "index.json"
+        try:
+            mtime = meta.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if self._loaded and mtime == self._loaded_mtime:
+            return
+        self._loaded = True
+        self._loaded_mtime = mtime
+        if mtime is None:
+            return
+        try:
+            data = json.loads(meta.read_text(encoding="utf-8"))
+            self._entries = data["entries"]
+            self._vocab = data["vocab"]
+            self._idf = np.asarray(data["idf"], dtype=np.float32)
+            self._matrix = np.load(self.root / "vectors.npy")
+        except Exception as e:
+            logger.error(f"Could not load template index, starting empty: {str(e)}")
+            self._entries, self._vocab, self._idf, self._matrix = [], {}, None, None
+
+    def _vectorize(self, terms: List[str]):
+        vector = np.zeros(len(self._vocab), dtype=np.float32)
+        for term, count in Counter(terms).items():
+            column = self._vocab.get(term)
+            if column is not None:
+                vector[column] = (1 + math.log(count)) * self._idf[column]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _rebuild(self) -> None:
+        """Recompute vocabulary, IDF and the matrix (IDF shifts with every entry) and persist them"""
+        documents = [entry["terms"] for entry in self._entries]
+        df = Counter(term for terms in documents for term in set(terms))
+        self._vocab = {term: i for i, term in enumerate(sorted(df))}
+        n = len(documents)
+        self._idf = np.array([math.log((1 + n) / (1 + df[t])) + 1 for t in sorted(df)], dtype=np.float32)
+        self._matrix = np.vstack([self._vectorize(terms) for terms in documents]) if documents else None
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        if self._matrix is not None:
+            with open(self.root / "vectors.npy.tmp", "wb") as f:
+                np.save(f, self._matrix)
+            os.replace(self.root / "vectors.npy.tmp", self.root / "vectors.npy")
+        meta = {"entries": self._entries, "vocab": self._vocab, "idf": self._idf.tolist()}
+        (self.root / "index.json.tmp").write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(self.root / "index.json.tmp", self.root / "index.json")
+        self._loaded_mtime = (self.root / "index.json").stat().st_mtime_ns
+
+    @contextmanager
+    def _file_lock(self, shared: bool = False):
+        """Lock the index directory across worker processes (shared for readers, exclusive for add)"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".lock", "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def add(self, prompt: str, project_path: str, amplified_requirements: Dict[str, Any] | None = None) -> str:
+        """Snapshot a freshly generated project into the index and return its template id"""
+        purpose = ((amplified_requirements or {}).get("structural_demand") or {}).get("purpose", "")
+        template_id = uuid.uuid4().hex[:8]
+        blob_store.copy_tree(project_path, self.root / template_id,
+                             ignore=lambda d, names: [n for n in names if is_precompressed_variant(n)])
+        with self._lock, self._file_lock():
+            # Pick up entries other workers added since this one last read the index
+            self._load()
+            self._entries.append({
+                "id": template_id,
+                "prompt": prompt,
+                "terms": tokenize(prompt) + tokenize(str(purpose)),
+                "amplified_requirements": amplified_requirements or {},
+                "added_at": time.time(),
+            })
+            while len(self._entries) > self.max_entries:
+                evicted = self._entries.pop(0)
+                shutil.rmtree(self.root / evicted["id"], ignore_errors=True)
+            self._rebuild()
+        return template_id
+
+    def match(self, prompt: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Best stored entry for prompt and its cosine similarity, or None when the index is empty"""
+        with self._lock, self._file_lock(shared=True):
+            self._load()
+            if self._matrix is None or not self._entries:
+                return None
+            query = self._vectorize(tokenize(prompt))
+            scores = self._matrix @ query
+            best = int(np.argmax(scores))
+            return self._entries[best], float(scores[best])
+
+    def materialize(self, entry: Dict[str, Any], project_path: str) -> Dict[str, str]:
+        """Copy a template's files to project_path; returns relative path -> content for the copied files"""
+        blob_store.copy_tree(self.root / entry["id"], project_path)
+        root = Path(project_path)
+        return {p.relative_to(root).as_posix(): p.read_text(encoding="utf-8", errors="replace")
+                for p in root.rglob("*") if p.is_file()}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock, self._file_lock(shared=True):
+            self._load()
+            return {"entries": len(self._entries), "vocabulary": len(self._vocab),
+                    "matrix_bytes": int(self._matrix.nbytes) if self._matrix is not None else 0}
+
+
+template_index = TemplateIndex()
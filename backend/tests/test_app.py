@@ -0,0 +1,23 @@
+import pytest
+
+from app import create_app
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    app = create_app()
+    app.config["TESTING"] = True
+    return app.test_client()
+
+
+@pytest.mark.parametrize("concurrency", [None, [1, 2], {"n": 1}, "many"])
+def test_batch_create_rejects_bad_concurrency(client, concurrency):
+    response = client.post("/api/batch", json={"items": [{"prompt": "a site"}], "concurrency": concurrency})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("body", [{"concurrency": None}, {"retries": [1]}, [1, 2]])
+def test_batch_resume_rejects_bad_options(client, body):
+    response = client.post("/api/batch/abc/resume", json=body)
+    assert response.status_code == 400
@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+
+import batchRunner
+from batchRunner import BatchRun, BatchManager, BatchLimitError
+
+
+def _items(count):
+    return [{"id": str(i), "prompt": f"site {i}", "project_name": None, "img": None,
+             "auto_deploy": False, "username": None, "repo_name": None} for i in range(count)]
+
+
+def test_failed_run_still_finishes(tmp_path, monkeypatch):
+    def broken_checkpoint(output_path):
+        raise OSError("disk gone")
+
+    monkeypatch.setattr(batchRunner, "load_checkpoint", broken_checkpoint)
+    run = BatchRun(_items(1), str(tmp_path / "results.jsonl"), generate=lambda **kwargs: {"success": True})
+
+    with pytest.raises(OSError):
+        run.run()
+
+    summary = run.summary()
+    assert summary["finished_at"] is not None
+    assert summary["error"] == "disk gone"
+
+
+def test_tenant_limit_is_checked_and_registered_atomically(tmp_path, monkeypatch):
+    monkeypatch.setattr(batchRunner, "BATCHES_DIR", tmp_path)
+    monkeypatch.setattr(batchRunner, "BATCH_MAX_PER_TENANT", 1)
+    release = threading.Event()
+
+    def blocked_run(self):
+        release.wait(5)
+        self.finished_at = "done"
+
+    monkeypatch.setattr(BatchRun, "run", blocked_run)
+    manager = BatchManager()
+    barrier = threading.Barrier(8)
+    outcomes = []
+
+    def submit():
+        barrier.wait()
+        try:
+            manager.start(_items(1), concurrency=1, retries=0, tenant="t")
+            outcomes.append("started")
+        except BatchLimitError:
+            outcomes.append("limited")
+
+    threads = [threading.Thread(target=submit) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    release.set()
+
+    assert outcomes.count("started") == 1
+    assert manager.running("t") <= 1
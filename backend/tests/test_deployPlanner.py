@@ -0,0 +1,82 @@
+import deployPlanner
+from deployPlanner import DeployPlanner
+
+
+class FakeGitHub:
+    """Records the REST calls the planner makes against an in-memory repo"""
+
+    def __init__(self, files=None, delete_ok=True):
+        self.files = dict(files or {})
+        self.delete_ok = delete_ok
+        self.calls = []
+
+    def install(self, monkeypatch):
+        monkeypatch.setattr(deployPlanner, "create_github_repo", self.create)
+        monkeypatch.setattr(deployPlanner, "enable_github_pages", self.pages)
+        monkeypatch.setattr(deployPlanner, "list_repo_files", self.listing)
+        monkeypatch.setattr(deployPlanner, "put_repo_file", self.put)
+        monkeypatch.setattr(deployPlanner, "delete_repo_file", self.delete)
+
+    def create(self, token, username, repo_name):
+        self.calls.append("create")
+        return True
+
+    def pages(self, token, username, repo_name):
+        self.calls.append("pages")
+        return f"https://{username}.github.io/{repo_name}/"
+
+    def listing(self, token, username, repo_name):
+        self.calls.append("listing")
+        return dict(self.files)
+
+    def put(self, full, path, token, username, repo_name, sha):
+        self.calls.append(f"put {path}")
+        self.files[path] = deployPlanner.blob_store.sha_of(full)
+        return self.files[path]
+
+    def delete(self, token, username, repo_name, path, sha):
+        self.calls.append(f"delete {path}")
+        if self.delete_ok:
+            self.files.pop(path, None)
+        return self.delete_ok
+
+
+def _project(tmp_path, **files):
+    project = tmp_path / "site"
+    project.mkdir()
+    for name, text in files.items():
+        (project / name.replace("_", ".")).write_text(text, encoding="utf-8")
+    return str(project)
+
+
+def test_redeploy_sees_out_of_band_changes(tmp_path, monkeypatch):
+    github = FakeGitHub()
+    github.install(monkeypatch)
+    planner = DeployPlanner(ttl=600)
+    project = _project(tmp_path, index_html="<h1>hi</h1>")
+
+    first = planner.deploy(project, "token", "user", "repo")
+    assert first["success"]
+
+    # Someone else pushes a file the local project doesn't have
+    github.files["stray.html"] = "deadbeef"
+    github.calls.clear()
+
+    second = planner.deploy(project, "token", "user", "repo")
+
+    assert second["success"]
+    assert github.calls == ["listing", "delete stray.html"]
+    assert not second["plan"]["no_changes"]
+    assert "stray.html" not in github.files
+
+
+def test_failed_delete_fails_the_deploy(tmp_path, monkeypatch):
+    github = FakeGitHub(files={"old.html": "deadbeef"}, delete_ok=False)
+    github.install(monkeypatch)
+    planner = DeployPlanner(ttl=600)
+    project = _project(tmp_path, index_html="<h1>hi</h1>")
+
+    result = planner.deploy(project, "token", "user", "repo")
+
+    assert not result["success"]
+    assert result["plan"]["failed_deletes"] == ["old.html"]
@@ -0,0 +1,72 @@
+import re
+from pathlib import Path
+
+import backend
+from siteBuilder import build_project, sources_path
+
+INDEX = """<!DOCTYPE html>
+<html>
+<head><link rel="stylesheet" href="styles.css"></head>
+<body><h1 class="title">Hello</h1><script src="script.js"></script></body>
+</html>
+"""
+
+
+# Long enough that the compressed variants are smaller and therefore written
+STYLES = ".title { color: red; }\n" + ".title { margin: 0 auto; padding: 1rem 2rem; }\n" * 20
+
+
+def _built_project(root: Path) -> Path:
+    project = root / "projects" / "site-test"
+    project.mkdir(parents=True)
+    (project / "index.html").write_text(INDEX, encoding="utf-8")
+    (project / "styles.css").write_text(STYLES, encoding="utf-8")
+    (project / "script.js").write_text("console.log('hi');\n", encoding="utf-8")
+    build_project(str(project))
+    return project
+
+
+def _asset(project: Path, pattern: str) -> Path:
+    matches = [p for p in project.iterdir() if re.fullmatch(pattern, p.name)]
+    assert len(matches) == 1, matches
+    return matches[0]
+
+
+def test_edit_of_built_project_rebuilds_assets(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    project = _built_project(tmp_path)
+    old_css = _asset(project, r"styles\.[0-9a-f]{8}\.css")
+    assert sources_path(project).joinpath("styles.css").is_file()
+
+    edit = {"patches": [{"file": "styles.css", "search": "color: red;", "replace": "color: blue;"}]}
+    monkeypatch.setattr(backend, "get_edit_from_agent", lambda change_request, files: edit)
+
+    result = backend.edit_project("site-test", "make the title blue")
+
+    assert result["success"], result
+    assert result["edit_report"]["failed"] == []
+    assert result["files_changed"] == ["styles.css"]
+    new_css = _asset(project, r"styles\.[0-9a-f]{8}\.css")
+    assert new_css.name != old_css.name
+    assert "blue" in new_css.read_text(encoding="utf-8")
+    assert new_css.name in (project / "index.html").read_text(encoding="utf-8")
+    assert new_css.with_name(new_css.name + ".gz").is_file()
+    assert not old_css.exists()
+    assert "blue" in sources_path(project).joinpath("styles.css").read_text(encoding="utf-8")
+
+
+def test_edit_of_unbuilt_project_patches_in_place(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    project = tmp_path / "projects" / "site-plain"
+    project.mkdir(parents=True)
+    (project / "index.html").write_text(INDEX, encoding="utf-8")
+    (project / "styles.css").write_text(".title { color: red; }\n", encoding="utf-8")
+    (project / "script.js").write_text("console.log('hi');\n", encoding="utf-8")
+
+    edit = {"patches": [{"file": "styles.css", "search": "red", "replace": "blue"}]}
+    monkeypatch.setattr(backend, "get_edit_from_agent", lambda change_request, files: edit)
+
+    result = backend.edit_project("site-plain", "make the title blue")
+
+    assert result["success"], result
+    assert (project / "styles.css").read_text(encoding="utf-8") == ".title { color: blue; }\n"
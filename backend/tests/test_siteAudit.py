@@ -0,0 +1,30 @@
+from siteAudit import audit_site
+
+PAGE = '<!DOCTYPE html><html><head><link rel="stylesheet" href="styles.css"></head><body></body></html>'
+
+
+def _site(tmp_path, css):
+    (tmp_path / "index.html").write_text(PAGE, encoding="utf-8")
+    (tmp_path / "styles.css").write_text(css, encoding="utf-8")
+    return str(tmp_path)
+
+
+def test_missing_import_is_broken(tmp_path):
+    report = audit_site(_site(tmp_path, '@import "theme.css";\nbody { margin: 0; }\n'))
+
+    assert not report["ok"]
+    assert [(b["ref"], b["kind"]) for b in report["broken_links"]] == [("theme.css", "css")]
+
+
+def test_missing_import_url_is_broken(tmp_path):
+    report = audit_site(_site(tmp_path, "@import url('theme.css');\n"))
+
+    assert [(b["ref"], b["kind"]) for b in report["broken_links"]] == [("theme.css", "css")]
+
+
+def test_missing_background_image_only_warns(tmp_path):
+    report = audit_site(_site(tmp_path, "body { background: url(bg.png); }\n"))
+
+    assert report["ok"]
+    assert report["broken_links"] == []
+    assert any("bg.png" in warning for warning in report["warnings"])
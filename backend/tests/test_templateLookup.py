@@ -0,0 +1,40 @@
+import backend
+
+
+class StopPipeline(Exception):
+    pass
+
+
+def _stub_stages(monkeypatch, lookups):
+    def from_template(prompt, project_path):
+        lookups.append(prompt)
+        return None
+
+    def model(prompt, img=None):
+        raise StopPipeline()
+
+    monkeypatch.setattr(backend, "TEMPLATE_INDEX_ENABLED", True)
+    monkeypatch.setattr(backend, "RESULT_CACHE_ENABLED", False)
+    monkeypatch.setattr(backend, "_project_from_template", from_template)
+    monkeypatch.setattr(backend, "get_data_from_agent", model)
+
+
+def test_bypass_cache_skips_template_lookup(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    lookups = []
+    _stub_stages(monkeypatch, lookups)
+
+    result = backend.create_and_deploy_project("a bakery site", bypass_cache=True)
+
+    assert not result["success"]
+    assert lookups == []
+
+
+def test_template_lookup_runs_by_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    lookups = []
+    _stub_stages(monkeypatch, lookups)
+
+    backend.create_and_deploy_project("a bakery site")
+
+    assert lookups == ["a bakery site"]
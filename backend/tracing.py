@@ -0,0 +1,216 @@
+"""
+Lightweight span tracing for the generation pipeline
+
+A trace starts per API request (app.py) or batch item and collects nested spans
+(pipeline stages, Gemini calls, every upstream HTTP call). The current span lives
+in a contextvar, so threads started through logConfig.with_context attach their
+spans to the right parent. When the root span ends the whole trace is exported:
+
+    TRACE_EXPORT=file         one JSON line per trace in TRACE_DIR/traces-YYYYMMDD.jsonl
+    TRACE_EXPORT=console      an indented span tree in the log
+    TRACE_EXPORT=file,console both
+
+With TRACE_EXPORT unset tracing is off and span() is a no-op.
+"""
+import os
+import json
+import time
+import random
+import logging
+import threading
+import contextvars
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORT = {e.strip() for e in os.getenv("TRACE_EXPORT", "").split(",") if e.strip()}
+TRACING_ENABLED = bool(TRACE_EXPORT)
+TRACE_DIR = Path(os.getenv("TRACE_DIR", "traces"))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_export_lock = threading.Lock()
+
+
+class Trace:
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List["Span"] = []
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def add(self, span: "Span") -> None:
+        with self._lock:
+            self.spans.append(span)
+
+
+class Span:
+    __slots__ = ("name", "trace", "span_id", "parent_id", "attributes", "start", "_t0", "duration_ms",
+                 "status", "error")
+
+    def __init__(self, name: str, trace: Trace, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def fail(self, error: BaseException | str) -> None:
+        self.status = "error"
+        self.error = (f"{type(error).__name__}: {error}" if isinstance(error, BaseException) else error)[:300]
+
+    def end(self) -> None:
+        if self.duration_ms is None:
+            self.duration_ms = round((time.perf_counter() - self._t0) * 1000, 3)
+            self.trace.add(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": round(self.start, 6),
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def fail(self, error) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+@contextmanager
+def span(name: str, **attributes: Any):
+    """Record a child of the current span; does nothing outside a trace"""
+    parent = _current.get()
+    # Background work (e.g. a Pages poller) can outlive the request that started it
+    if parent is None or parent.trace.closed:
+        yield _NOOP
+        return
+    current = Span(name, parent.trace, parent.span_id, attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        current.end()
+        _current.reset(token)
+
+
+def _parse_traceparent(header: str | None) -> Tuple[Optional[str], Optional[str]]:
+    """Trace and parent span id from a W3C traceparent header (00-<trace>-<span>-<flags>)"""
+    parts = (header or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return None, None
+
+
+def start_trace(name: str, traceparent: str | None = None, **attributes: Any):
+    """
+    Open a root span and make it current
+
+    Returns:
+        (root span, context token) to pass to end_trace, or None when not tracing
+    """
+    if not TRACING_ENABLED or random.random() >= TRACE_SAMPLE_RATE:
+        return None
+    trace_id, parent_id = _parse_traceparent(traceparent)
+    root = Span(name, Trace(trace_id or os.urandom(16).hex()), parent_id, attributes)
+    return root, _current.set(root)
+
+
+def end_trace(handle, error: BaseException | None = None) -> None:
+    """Close the root span opened by start_trace and export the trace"""
+    if handle is None:
+        return
+    root, token = handle
+    if error is not None:
+        root.fail(error)
+    root.end()
+    root.trace.closed = True
+    _current.reset(token)
+    try:
+        _export(root)
+    except Exception as e:
+        logger.warning(f"Trace export failed: {str(e)}")
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current.get()
+    return current.trace.trace_id if current is not None else None
+
+
+def http_span(method: str, url: str):
+    """Span for one upstream HTTP call; ids in the path are kept, the query string is not"""
+    parts = urlsplit(url)
+    return span(f"http {method.upper()} {parts.netloc}", method=method.upper(), path=parts.path)
+
+
+def traced_session():
+    """A requests.Session whose every call is recorded as an http span"""
+    import requests
+
+    class TracedSession(requests.Session):
+        def request(self, method, url, *args, **kwargs):
+            with http_span(method, url) as s:
+                response = super().request(method, url, *args, **kwargs)
+                s.set("status", response.status_code)
+                if response.status_code >= 500:
+                    s.fail(f"HTTP {response.status_code}")
+                return response
+
+    return TracedSession()
+
+
+def _export(root: Span) -> None:
+    spans = sorted(root.trace.spans, key=lambda s: s.start)
+    if "file" in TRACE_EXPORT:
+        record = {
+            "trace_id": root.trace.trace_id,
+            "name": root.name,
+            "start": datetime.utcfromtimestamp(root.start).isoformat() + "Z",
+            "duration_ms": root.duration_ms,
+            "status": root.status,
+            "spans": [s.to_dict() for s in spans],
+        }
+        TRACE_DIR.mkdir(parents=True, exist_ok=True)
+        path = TRACE_DIR / f"traces-{datetime.utcnow():%Y%m%d}.jsonl"
+        with _export_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+    if "console" in TRACE_EXPORT:
+        children: Dict[Optional[str], List[Span]] = {}
+        for s in spans:
+            children.setdefault(s.parent_id, []).append(s)
+        lines = []
+
+        def walk(s: Span, depth: int) -> None:
+            flag = "" if s.status == "ok" else f" [{s.error}]"
+            lines.append(f"{'  ' * depth}{s.name} {s.duration_ms:.1f}ms{flag}")
+            for child in children.get(s.span_id, []):
+                walk(child, depth + 1)
+
+        walk(root, 0)
+        logger.info(f"trace {root.trace.trace_id}\n" + "\n".join(lines))